@@ -0,0 +1,193 @@
+"""
+Benchmarks for the public transforms of staintools.
+
+Usage:
+    python benchmarks/run_benchmarks.py                      # Run and compare with benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --save-baseline      # Run and store a new baseline
+    python benchmarks/run_benchmarks.py --sizes 256 1024
+
+Reports throughput (megapixels per second), peak traced memory and, for stain normalization,
+a per-stage breakdown, and the time to import staintools in a fresh interpreter.
+Exits with status 1 if a benchmark is slower than the baseline by more than the tolerance.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import staintools
+from staintools.tissue_masks.luminosity_threshold_tissue_locator import LuminosityThresholdTissueLocator
+
+from synthetic_images import make_synthetic_he_image
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def spams_available():
+    try:
+        import spams
+        return True
+    except ImportError:
+        return False
+
+
+def get_benchmarks():
+    """
+    Get the benchmarks as a dict name -> setup function.
+    A setup function takes the target and source images and returns a zero argument function to time.
+    """
+
+    def normalizer(method, solver, extractor_kwargs=None):
+        def setup(target, I):
+            n = staintools.StainNormalizer(method=method, solver=solver, extractor_kwargs=extractor_kwargs)
+            n.fit(target)
+            return lambda: n.transform(I)
+        return setup
+
+    def augmentor(method, solver):
+        def setup(target, I):
+            a = staintools.StainAugmentor(method=method, solver=solver)
+            a.fit(I)
+            return lambda: a.pop()
+        return setup
+
+    def reinhard(target, I):
+        n = staintools.ReinhardColorNormalizer()
+        n.fit(target)
+        return lambda: n.transform(I)
+
+    benchmarks = {
+        'StainNormalizer.transform[macenko,numpy]': normalizer('macenko', 'numpy'),
+        'StainNormalizer.transform[vahadane,numpy]': normalizer('vahadane', 'numpy', {'backend': 'numpy'}),
+        'StainAugmentor.pop[macenko,numpy]': augmentor('macenko', 'numpy'),
+        'ReinhardColorNormalizer.transform': reinhard,
+        'LuminosityStandardizer.standardize': lambda target, I: lambda: staintools.LuminosityStandardizer.standardize(I),
+        'LuminosityThresholdTissueLocator.get_tissue_mask':
+            lambda target, I: lambda: LuminosityThresholdTissueLocator.get_tissue_mask(I),
+    }
+    if spams_available():
+        benchmarks['StainNormalizer.transform[macenko,spams]'] = normalizer('macenko', 'spams')
+        benchmarks['StainNormalizer.transform[vahadane,spams]'] = normalizer('vahadane', 'spams')
+        benchmarks['StainAugmentor.pop[vahadane,spams]'] = augmentor('vahadane', 'spams')
+    return benchmarks
+
+
+def stage_breakdown(target, I, method='macenko', solver='numpy'):
+    """
+    Time the stages of StainNormalizer.transform with the profiling hooks.
+
+    :return: Dict stage -> seconds.
+    """
+    normalizer = staintools.StainNormalizer(method=method, solver=solver)
+    normalizer.fit(target)
+    with staintools.profile() as profiler:
+        normalizer.transform(I)
+    return {name: counter['seconds'] for name, counter in profiler.as_dict().items()}
+
+
+def import_time(repeats):
+    """
+    Time `import staintools` in fresh interpreters (the startup cost of every worker process and CLI call).
+
+    :return: Best time in seconds and the heavy modules loaded by the import.
+    """
+    code = ('import sys, time; start = time.perf_counter(); import staintools; seconds = time.perf_counter() - start; '
+            'print(seconds, [m for m in ("cv2", "matplotlib", "spams") if m in sys.modules])')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    times = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-c', code], cwd=root, check=True, capture_output=True, text=True)
+        seconds, loaded = output.stdout.split(' ', 1)
+        times.append(float(seconds))
+    return min(times), loaded.strip()
+
+
+def run(sizes, repeats):
+    results = {}
+    seconds, loaded = import_time(max(repeats, 3))
+    results['import staintools'] = {'import_seconds': seconds}
+    print('{:<65} {:>9.3f} s    (heavy modules loaded: {})'.format('import staintools', seconds, loaded))
+    benchmarks = get_benchmarks()
+    for size in sizes:
+        target = make_synthetic_he_image(size, seed=0)
+        I = make_synthetic_he_image(size, seed=1)
+        megapixels = size * size / 1e6
+        n_repeats = repeats if size <= 1024 else 1
+        for name, setup in benchmarks.items():
+            f = setup(target, I)
+            f()  # Warm up.
+            times = []
+            for _ in range(n_repeats):
+                start = time.perf_counter()
+                f()
+                times.append(time.perf_counter() - start)
+            tracemalloc.start()
+            f()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            best = min(times)
+            key = '{} @ {}'.format(name, size)
+            results[key] = {'seconds': best, 'megapixels_per_second': megapixels / best, 'peak_memory_mb': peak / 2 ** 20}
+            print('{:<65} {:>9.2f} MP/s {:>10.1f} MB'.format(key, megapixels / best, peak / 2 ** 20))
+        stages = stage_breakdown(target, I)
+        results['StainNormalizer stages @ {}'.format(size)] = {'stages': stages}
+        print('  stages: ' + ', '.join('{} {:.3f}s'.format(k, v) for k, v in stages.items()))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare throughput with the baseline.
+
+    :return: List of regressions.
+    """
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        if 'import_seconds' in result:
+            # Imports are quick, so allow some absolute slack too.
+            expected = baseline[key]['import_seconds']
+            if result['import_seconds'] > max((1 + tolerance) * expected, expected + 0.05):
+                regressions.append('{}: {:.3f}s vs baseline {:.3f}s'.format(key, result['import_seconds'], expected))
+            continue
+        if 'megapixels_per_second' not in result:
+            continue
+        expected = baseline[key]['megapixels_per_second']
+        if result['megapixels_per_second'] < (1 - tolerance) * expected:
+            regressions.append('{}: {:.2f} MP/s vs baseline {:.2f} MP/s'.format(
+                key, result['megapixels_per_second'], expected))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[256, 1024, 4096])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=0.3, help='Allowed relative slowdown.')
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeats)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print('Baseline saved to {}'.format(args.baseline))
+        return 0
+    if os.path.isfile(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
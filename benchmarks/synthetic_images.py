@@ -0,0 +1,33 @@
+import numpy as np
+
+# Typical H&E stain vectors (hematoxylin first row, eosin second row) in OD space.
+HE_STAIN_MATRIX = np.array([[0.65, 0.70, 0.29],
+                            [0.07, 0.99, 0.11]])
+
+
+def make_synthetic_he_image(size, seed=0, tissue_fraction=0.6):
+    """
+    Make a synthetic H&E-like image: blobs of two stains (with noise) on a white background.
+
+    :param size: Side of the square image.
+    :param seed: Random seed.
+    :param tissue_fraction: Approximate fraction of the image covered by tissue.
+    :return: Image RGB uint8.
+    """
+    rng = np.random.default_rng(seed)
+    stain_matrix = HE_STAIN_MATRIX / np.linalg.norm(HE_STAIN_MATRIX, axis=1)[:, None]
+
+    # Smooth random field thresholded to give tissue regions.
+    coarse = rng.uniform(0, 1, (max(size // 64, 2), max(size // 64, 2)))
+    field = np.kron(coarse, np.ones((64, 64)))[:size, :size]
+    field = np.pad(field, ((0, size - field.shape[0]), (0, size - field.shape[1])), mode='edge')
+    tissue = field < np.quantile(field, tissue_fraction)
+
+    concentrations = np.empty((size, size, 2), dtype=np.float32)
+    concentrations[..., 0] = rng.gamma(2.0, 0.35, (size, size))
+    concentrations[..., 1] = rng.gamma(2.0, 0.25, (size, size))
+    concentrations *= tissue[..., None]
+
+    I = 255 * np.exp(-1 * np.dot(concentrations, stain_matrix.astype(np.float32)))
+    I += rng.normal(0, 2, I.shape).astype(np.float32)
+    return np.clip(I, 0, 255).astype(np.uint8)
@@ -8,6 +8,9 @@ setup(
     author_email='peter554-dev@protonmail.com',
     url='https://github.com/Peter554/StainTools',
     packages=find_packages(exclude=('tests')),
+    entry_points={
+        'console_scripts': ['staintools=staintools.cli:main']
+    },
     install_requires=[
         'numpy',
         'matplotlib',
@@ -2,13 +2,50 @@ import sys
 if sys.version_info[0] < 3:
     raise Exception("Error: You are not running Python 3.")
 
-from staintools.stain_extraction.vahadane_stain_extractor import VahadaneStainExtractor
-from staintools.stain_extraction.macenko_stain_extractor import MacenkoStainExtractor
+import importlib
 
-from staintools.stain_normalizer import StainNormalizer
-from staintools.stain_augmentor import StainAugmentor
-from staintools.reinhard_color_normalizer import ReinhardColorNormalizer
+# The public names and the modules defining them. A module is only imported when one of its names is first used
+# (PEP 562), so `import staintools` does not load OpenCV, spams or matplotlib.
+_LAZY_ATTRIBUTES = {
+    'VahadaneStainExtractor': 'staintools.stain_extraction.vahadane_stain_extractor',
+    'WarmStartVahadaneStainExtractor': 'staintools.stain_extraction.vahadane_stain_extractor',
+    'MacenkoStainExtractor': 'staintools.stain_extraction.macenko_stain_extractor',
 
-from staintools.preprocessing.luminosity_standardizer import LuminosityStandardizer
-from staintools.preprocessing.read_image import read_image
-from staintools.visualization.visualization import *
+    'StainNormalizer': 'staintools.stain_normalizer',
+    'TiledStainNormalizer': 'staintools.tiled_stain_normalizer',
+    'StainAugmentor': 'staintools.stain_augmentor',
+    'ReinhardColorNormalizer': 'staintools.reinhard_color_normalizer',
+    'StainAugmentationDataset': 'staintools.augmentation_dataset',
+
+    'LuminosityStandardizer': 'staintools.preprocessing.luminosity_standardizer',
+    'read_image': 'staintools.preprocessing.read_image',
+    'decode_image': 'staintools.preprocessing.read_image',
+    'write_image': 'staintools.preprocessing.image_io',
+    'prefetch_images': 'staintools.preprocessing.image_io',
+    'ImageWriter': 'staintools.preprocessing.image_io',
+    'parallel_transform': 'staintools.parallel_runner',
+    'FitCache': 'staintools.utils.fit_cache',
+    'StainMatrixCache': 'staintools.utils.stain_matrix_cache',
+    'profile': 'staintools.utils.profiling',
+    'set_default_dtype': 'staintools.utils.dtype_policy',
+    'get_default_dtype': 'staintools.utils.dtype_policy',
+    'default_dtype': 'staintools.utils.dtype_policy',
+
+    'plot_row_colors': 'staintools.visualization.visualization',
+    'plot_image': 'staintools.visualization.visualization',
+    'plot_image_list': 'staintools.visualization.visualization',
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError("module 'staintools' has no attribute '{}'".format(name))
+    value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]), name)
+    globals()[name] = value  # Later lookups don't go through __getattr__.
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
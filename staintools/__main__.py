@@ -0,0 +1,5 @@
+import sys
+
+from staintools.cli import main
+
+sys.exit(main())
@@ -0,0 +1,200 @@
+import collections
+import concurrent.futures
+import copy
+import os
+import threading
+import time
+
+import numpy as np
+
+from staintools.preprocessing.read_image import read_image
+
+# The dataset in a worker process, set once by the pool initializer.
+_worker_dataset = None
+
+
+class StainAugmentationDataset(object):
+    """
+    Stain augmented versions of a collection of images, for training loops.
+
+    Each image is fitted (stain matrix and concentrations) the first time it is used and the fit is cached, so later
+    epochs only pay for the reconstruction. The cached concentrations can be quantized to float16 or uint16 to keep
+    more images in memory (see the concentration_dtype of StainAugmentor).
+
+    The dataset can be indexed (len and dataset[i]), as expected by framework data loaders (e.g. a torch DataLoader,
+    whose workers then each cache their own fits), or iterated with iterate, which generates the augmented images in
+    background threads or processes ahead of their use:
+
+        dataset = StainAugmentationDataset(paths, StainAugmentor(method='macenko', solver='numpy'), seed=0)
+        for epoch in range(10):
+            for index, I in dataset.iterate(epoch=epoch, shuffle=True):
+                ...
+        print(dataset.get_stats())
+    """
+
+    def __init__(self, images, augmentor, concentration_dtype=None, cache_size=None, seed=None, dtype=np.uint8):
+        """
+        :param images: Sequence of images RGB uint8, paths to images or encoded images (read on first use).
+        :param augmentor: A StainAugmentor, whose parameters are used to fit every image.
+        :param concentration_dtype: None for that of the augmentor, np.float16 or np.uint16 to quantize the cached
+            concentrations.
+        :param cache_size: Maximum number of fitted images kept (the least recently used are dropped), None for all.
+        :param seed: Seed for reproducible augmentation (given the index and the epoch), None for fresh randomness.
+        :param dtype: Dtype of the augmented images (e.g. np.uint8 or np.float32).
+        """
+        self.images = images
+        self.augmentor = augmentor
+        self.concentration_dtype = concentration_dtype
+        self.cache_size = cache_size
+        self.seed = seed
+        self.dtype = dtype
+        self.epoch = 0
+        self.fitted = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'fits': 0, 'images': 0, 'seconds': 0.0, 'queue_depth': 0, 'queue_depth_total': 0}
+
+    def __getstate__(self):
+        # Sent to worker processes with the fits made so far (the lock is not picklable).
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.images)
+
+    def __getitem__(self, index):
+        return self.get_item(index, self.epoch)
+
+    def set_epoch(self, epoch):
+        """
+        Set the epoch used by dataset[i] (with a seed, each epoch gets different augmentations).
+
+        :param epoch: Epoch number.
+        :return:
+        """
+        self.epoch = epoch
+
+    def get_fitted(self, index):
+        """
+        Get the augmentor fitted to an image, from the cache or by fitting it.
+
+        :param index: Image index.
+        :return: Fitted StainAugmentor (with quantized concentrations if concentration_dtype is set).
+        """
+        with self.lock:
+            augmentor = self.fitted.get(index)
+            if augmentor is not None:
+                self.fitted.move_to_end(index)
+                return augmentor
+        I = self.images[index]
+        if isinstance(I, (str, os.PathLike, bytes, bytearray, memoryview)):
+            I = read_image(I)
+        augmentor = copy.copy(self.augmentor)
+        if self.concentration_dtype is not None:
+            augmentor.concentration_dtype = np.dtype(self.concentration_dtype).name
+        augmentor.fit(I)
+        with self.lock:
+            self.stats['fits'] += 1
+            self.fitted[index] = augmentor
+            while self.cache_size is not None and len(self.fitted) > self.cache_size:
+                self.fitted.popitem(last=False)
+        return augmentor
+
+    def fit_all(self):
+        """
+        Fit every image now (e.g. before iterate with the process backend, so the workers share the fits).
+
+        :return:
+        """
+        for index in range(len(self)):
+            self.get_fitted(index)
+
+    def get_item(self, index, epoch=0):
+        """
+        Get an augmented version of an image.
+
+        :param index: Image index.
+        :param epoch: Epoch number (used with a seed).
+        :return: Augmented image.
+        """
+        augmentor = self.get_fitted(index)
+        rng = None if self.seed is None else [self.seed, epoch, index]
+        return augmentor.pop_batch(1, rng=rng, dtype=self.dtype)[0]
+
+    def iterate(self, epoch=0, shuffle=False, n_workers=2, prefetch=8, backend='thread'):
+        """
+        Generate the augmented images of an epoch in background workers, at most prefetch images ahead of their use.
+
+        With the process backend each worker gets a copy of the fits made so far (see fit_all) and caches its own.
+
+        :param epoch: Epoch number (used for the shuffling and, with a seed, the augmentations).
+        :param shuffle: Visit the images in a random order?
+        :param n_workers: Number of workers.
+        :param prefetch: Maximum number of images generated ahead.
+        :param backend: 'thread' or 'process'.
+        :return: Generator of (index, augmented image).
+        """
+        if backend == 'thread':
+            executor = concurrent.futures.ThreadPoolExecutor(n_workers)
+            generate = self.get_item
+        elif backend == 'process':
+            executor = concurrent.futures.ProcessPoolExecutor(n_workers, initializer=_init_worker, initargs=(self,))
+            generate = _get_item
+        else:
+            raise Exception('Backend not recognized.')
+        order = np.arange(len(self))
+        if shuffle:
+            order = np.random.default_rng(None if self.seed is None else [self.seed, epoch]).permutation(order)
+
+        pending = collections.deque()
+
+        def get_oldest():
+            depth = sum(future.done() for _, future in pending)  # Images ready to be taken.
+            index, future = pending.popleft()
+            I = future.result()
+            self.stats['images'] += 1
+            self.stats['queue_depth'] = depth
+            self.stats['queue_depth_total'] += depth
+            return index, I
+
+        start = time.perf_counter()
+        try:
+            for index in order.tolist():
+                pending.append((index, executor.submit(generate, index, epoch)))
+                if len(pending) >= prefetch:
+                    yield get_oldest()
+            while pending:
+                yield get_oldest()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            self.stats['seconds'] += time.perf_counter() - start
+
+    def get_stats(self):
+        """
+        Get the throughput and prefetch statistics of iterate.
+
+        :return: Dict of the number of fits, images generated, seconds, images per second, the last and the mean
+            number of images ready in the queue when one is taken (a mean near 0 means the workers are the bottleneck)
+            and the memory used by the cached concentrations.
+        """
+        stats = self.stats
+        with self.lock:
+            concentration_bytes = sum(augmentor.source_concentrations.nbytes for augmentor in self.fitted.values())
+        return {'fits': stats['fits'], 'images': stats['images'], 'seconds': stats['seconds'],
+                'images_per_second': stats['images'] / max(stats['seconds'], 1e-9),
+                'queue_depth': stats['queue_depth'],
+                'mean_queue_depth': stats['queue_depth_total'] / max(stats['images'], 1),
+                'concentration_bytes': concentration_bytes}
+
+
+def _init_worker(dataset):
+    global _worker_dataset
+    _worker_dataset = dataset
+
+
+def _get_item(index, epoch):
+    return _worker_dataset.get_item(index, epoch)
@@ -0,0 +1,283 @@
+"""
+Command line interface for processing directories of images.
+
+Usage:
+    staintools normalize slides/ -o normalized/ --target target.png --method macenko --workers 8
+    staintools normalize 'slides/*.jpg' -o normalized/ --fit normalizer.npz --format png
+    staintools augment slides/ -o augmented/ --method macenko --n-augmentations 5
+    staintools standardize slides/ -o standardized/
+
+Outputs keep the path of their input relative to its source (a directory, the fixed part of a glob pattern or the
+directory of a file). Inputs whose outputs would overwrite those of another input fail. Outputs that already exist
+are skipped, so an interrupted run can be resumed. A line per input file with its status
+(ok, skipped or failed), timings and error is appended to a JSON lines manifest (by default manifest.jsonl in the
+output directory). The exit status is 1 if any file failed.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+# The transformers and OpenCV are imported by the functions that use them, so parsing arguments (e.g. --help) is fast.
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog='staintools', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('inputs', nargs='+', help='Input directories, glob patterns or files.')
+    common.add_argument('-o', '--output', required=True, help='Output directory.')
+    common.add_argument('--format', help='Output format (e.g. png, jpg). Defaults to that of each input.')
+    common.add_argument('--workers', type=int, default=1, help='Number of worker processes.')
+    common.add_argument('--reduce', type=int, default=1, choices=[1, 2, 4, 8],
+                        help='Decode the inputs at 1/reduce of their resolution.')
+    common.add_argument('--overwrite', action='store_true', help='Process inputs whose outputs already exist.')
+    common.add_argument('--manifest', help='Manifest path. Defaults to manifest.jsonl in the output directory.')
+
+    normalize = subparsers.add_parser('normalize', parents=[common], help='Stain normalize to a target.')
+    fit = normalize.add_mutually_exclusive_group(required=True)
+    fit.add_argument('--target', help='Target image.')
+    fit.add_argument('--fit', help='Fitted normalizer saved with save (.npz).')
+    normalize.add_argument('--method', default='macenko', choices=['macenko', 'vahadane', 'vahadane_warm', 'reinhard'])
+    normalize.add_argument('--solver', default='numpy', choices=['numpy', 'spams'])
+    normalize.add_argument('--save-fit', help='Save the normalizer fitted to the target to this path (.npz).')
+    normalize.add_argument('--estimation-scale', type=float, default=1,
+                           help='Estimate the source stain matrix and percentile at this scale (e.g. 0.25).')
+
+    augment = subparsers.add_parser('augment', parents=[common], help='Stain augment each image.')
+    augment.add_argument('--method', default='macenko', choices=['macenko', 'vahadane'])
+    augment.add_argument('--solver', default='numpy', choices=['numpy', 'spams'])
+    augment.add_argument('--sigma1', type=float, default=0.2)
+    augment.add_argument('--sigma2', type=float, default=0.2)
+    augment.add_argument('--n-augmentations', type=int, default=1, help='Augmented images per input.')
+    augment.add_argument('--seed', type=int, default=0)
+    augment.add_argument('--estimation-scale', type=float, default=1,
+                         help='Estimate the stain matrix at this scale (e.g. 0.25).')
+
+    standardize = subparsers.add_parser('standardize', parents=[common], help='Standardize brightness.')
+    standardize.add_argument('--percentile', type=float, default=95)
+    return parser
+
+
+def get_transformer(args):
+    """
+    Get the (fitted) transformer of a command.
+
+    :param args: Parsed arguments.
+    :return: Transformer.
+    """
+    from staintools.preprocessing.luminosity_standardizer import LuminosityStandardizer
+    from staintools.preprocessing.read_image import read_image
+    from staintools.reinhard_color_normalizer import ReinhardColorNormalizer
+    from staintools.stain_augmentor import StainAugmentor
+    from staintools.stain_normalizer import StainNormalizer
+
+    if args.command == 'standardize':
+        return LuminosityStandardizer
+    if args.command == 'augment':
+        return StainAugmentor(method=args.method, sigma1=args.sigma1, sigma2=args.sigma2, solver=args.solver,
+                              estimation_scale=args.estimation_scale)
+    normalizer_class = ReinhardColorNormalizer if args.method == 'reinhard' else StainNormalizer
+    if args.fit is not None:
+        normalizer = normalizer_class.load(args.fit)
+        if args.method != 'reinhard' and args.estimation_scale != 1:
+            normalizer.estimation_scale = args.estimation_scale
+        return normalizer
+    normalizer = ReinhardColorNormalizer() if args.method == 'reinhard' else \
+        StainNormalizer(method=args.method, solver=args.solver, estimation_scale=args.estimation_scale)
+    normalizer.fit(read_image(args.target))
+    if args.save_fit is not None:
+        normalizer.save(args.save_fit)
+    return normalizer
+
+
+def list_inputs(sources):
+    """
+    List the input files with their path relative to their source (a directory, the fixed part of a glob pattern or
+    the directory of a file). A file listed by several sources is kept once.
+
+    :param sources: Input directories, glob patterns or files.
+    :return: List of (path, relative path).
+    """
+    from staintools.preprocessing.image_io import list_images
+
+    inputs = []
+    seen = set()
+    for source in sources:
+        if os.path.isdir(source) or not glob.has_magic(source):
+            root = source if os.path.isdir(source) else os.path.dirname(source)
+        else:
+            parts = source.split(os.sep)
+            n_fixed = next(i for i, part in enumerate(parts) if glob.has_magic(part))
+            root = os.sep.join(parts[:n_fixed])
+        for path in list_images(source):
+            if os.path.abspath(path) not in seen:
+                seen.add(os.path.abspath(path))
+                inputs.append((path, os.path.relpath(path, root or os.curdir)))
+    return inputs
+
+
+def get_output_paths(args, relative_path):
+    """
+    Get the output paths of an input file.
+
+    :param args: Parsed arguments.
+    :param relative_path: Input path relative to its source (see list_inputs).
+    :return: List of output paths.
+    """
+    stem, extension = os.path.splitext(os.path.join(args.output, relative_path))
+    if args.format is not None:
+        extension = '.' + args.format.lstrip('.')
+    if args.command == 'augment':
+        return ['{}_{}{}'.format(stem, i, extension) for i in range(args.n_augmentations)]
+    return [stem + extension]
+
+
+def process_file(transformer, task):
+    """
+    Read, transform and write one file (run by parallel_transform).
+
+    :param transformer: The transformer.
+    :param task: Tuple (index, input path, output paths, options).
+    :return: Manifest record.
+    """
+    from staintools.parallel_runner import apply_transformer
+    from staintools.preprocessing.read_image import read_image
+
+    index, path, output_paths, options = task
+    record = {'input': path, 'outputs': output_paths, 'status': 'ok'}
+    try:
+        start = time.perf_counter()
+        I = read_image(path, reduce=options['reduce'])
+        record['read_seconds'] = time.perf_counter() - start
+        record['pixels'] = I.shape[0] * I.shape[1]
+
+        start = time.perf_counter()
+        if options['n_augmentations'] is None:
+            images = [apply_transformer(transformer, I, **options['kwargs'])]
+        else:
+            images = apply_transformer(transformer, I, n_augmentations=options['n_augmentations'],
+                                       rng=[options['seed'], index])
+        record['transform_seconds'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for output_path, image in zip(output_paths, images):
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            write_atomically(output_path, image)
+        record['write_seconds'] = time.perf_counter() - start
+    except Exception as e:
+        record['status'] = 'failed'
+        record['error'] = '{}: {}'.format(type(e).__name__, e)
+    return record
+
+
+def write_atomically(path, I):
+    """
+    Write an image under a temporary name and rename it, so an interrupted run leaves no partial outputs.
+
+    :param path: Output path.
+    :param I: RGB uint8 image.
+    :return:
+    """
+    from staintools.preprocessing.image_io import write_image
+
+    directory, name = os.path.split(path)
+    tmp_path = os.path.join(directory, '.tmp-{}-{}'.format(os.getpid(), name))
+    try:
+        write_image(tmp_path, I)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def run(args, stream=sys.stdout):
+    """
+    Run a command.
+
+    :param args: Parsed arguments.
+    :param stream: Stream for the progress report.
+    :return: Dict of counts of ok, skipped and failed files.
+    """
+    from staintools.parallel_runner import parallel_transform
+
+    os.makedirs(args.output, exist_ok=True)
+    inputs = list_inputs(args.inputs)
+    options = {'reduce': args.reduce, 'seed': getattr(args, 'seed', 0),
+               'n_augmentations': args.n_augmentations if args.command == 'augment' else None,
+               'kwargs': {'percentile': args.percentile} if args.command == 'standardize' else {}}
+    manifest_path = args.manifest or os.path.join(args.output, 'manifest.jsonl')
+
+    counts = {'ok': 0, 'skipped': 0, 'failed': 0}
+    tasks = []
+    writers = {}  # The input writing each output path.
+    with open(manifest_path, 'a') as manifest:
+        for index, (path, relative_path) in enumerate(inputs):
+            output_paths = get_output_paths(args, relative_path)
+            collisions = [writers[output_path] for output_path in output_paths if output_path in writers]
+            writers.update((output_path, path) for output_path in output_paths if output_path not in writers)
+            if collisions:
+                counts['failed'] += 1
+                error = 'OutputCollision: the outputs of {} would overwrite those of {}'.format(path, collisions[0])
+                manifest.write(json.dumps({'input': path, 'outputs': output_paths, 'status': 'failed',
+                                           'error': error}) + '\n')
+                stream.write('Failed {}: {}\n'.format(path, error))
+            elif not args.overwrite and all(os.path.exists(output_path) for output_path in output_paths):
+                counts['skipped'] += 1
+                manifest.write(json.dumps({'input': path, 'outputs': output_paths, 'status': 'skipped'}) + '\n')
+            else:
+                tasks.append((index, path, output_paths, options))
+
+        start = time.perf_counter()
+        transformer = get_transformer(args) if tasks else None
+        fit_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        records = []
+        if tasks:
+            records = parallel_transform(transformer, tasks, n_jobs=args.workers,
+                                         backend='process' if args.workers > 1 else 'thread', function=process_file)
+        pixels = report(records, manifest, counts, len(tasks), start, stream)
+        seconds = time.perf_counter() - start
+
+    stream.write('{} ok, {} skipped, {} failed in {:.1f}s (fit {:.1f}s): {:.2f} images/s, {:.2f} MP/s\n'.format(
+        counts['ok'], counts['skipped'], counts['failed'], seconds, fit_seconds,
+        counts['ok'] / max(seconds, 1e-9), pixels / 1e6 / max(seconds, 1e-9)))
+    stream.write('Manifest: {}\n'.format(manifest_path))
+    return counts
+
+
+def report(records, manifest, counts, n_tasks, start, stream):
+    """
+    Write the records to the manifest as they arrive and report the progress.
+
+    :return: Number of pixels processed successfully.
+    """
+    pixels = 0
+    for i, record in enumerate(records, 1):
+        counts[record['status']] += 1
+        if record['status'] == 'ok':
+            pixels += record['pixels']
+        manifest.write(json.dumps(record) + '\n')
+        manifest.flush()
+        if record['status'] == 'failed':
+            stream.write('\rFailed {}: {}\n'.format(record['input'], record['error']))
+        elapsed = time.perf_counter() - start
+        stream.write('\r[{}/{}] {:.2f} images/s'.format(i, n_tasks, i / max(elapsed, 1e-9)))
+        if i == n_tasks:
+            stream.write('\n')
+        stream.flush()
+    return pixels
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    counts = run(args)
+    return 1 if counts['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+import collections
+import concurrent.futures
+import copy
+import itertools
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from staintools.preprocessing.read_image import read_image
+from staintools.stain_augmentor import StainAugmentor
+
+# The fitted transformer in a worker process, set once by the pool initializer.
+_worker_transformer = None
+_worker_shared_memory = []
+
+
+class SharedArray(object):
+    """
+    Picklable handle to a numpy array held in shared memory.
+    """
+
+    def __init__(self, name, shape, dtype):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+    def attach(self):
+        """
+        Attach to the shared memory block.
+
+        :return: The shared memory block and a numpy array viewing it.
+        """
+        shm = shared_memory.SharedMemory(name=self.name)
+        return shm, np.ndarray(self.shape, dtype=self.dtype, buffer=shm.buf)
+
+
+def apply_transformer(transformer, I, n_augmentations=None, rng=None, **kwargs):
+    """
+    Apply a fitted transformer to an image.
+
+    StainAugmentor is fitted to I and popped once (or n_augmentations times), objects with a transform method
+    (StainNormalizer, ReinhardColorNormalizer...) are transformed and LuminosityStandardizer is standardized.
+
+    :param transformer: The transformer.
+    :param I: Image RGB uint8, path to an image or encoded image (bytes).
+    :param n_augmentations: Optional number of augmented images (StainAugmentor only, see pop_batch).
+    :param rng: Optional seed for the augmentations (with n_augmentations).
+    :param kwargs: Keyword arguments of transform or standardize (e.g. percentile).
+    :return: The transformed image (an array n_augmentations x H x W x 3 if n_augmentations is given).
+    """
+    if isinstance(I, (str, os.PathLike, bytes, bytearray, memoryview)):
+        I = read_image(I)
+    if isinstance(transformer, StainAugmentor):
+        augmentor = copy.copy(transformer)  # Don't share fitted state between threads.
+        augmentor.fit(I)
+        if n_augmentations is None:
+            return augmentor.pop()
+        return augmentor.pop_batch(n_augmentations, rng=rng)
+    elif hasattr(transformer, 'transform'):
+        return transformer.transform(I, **kwargs)
+    elif hasattr(transformer, 'standardize'):
+        return transformer.standardize(I, **kwargs)
+    else:
+        raise Exception('Transformer not recognized.')
+
+
+def parallel_transform(transformer, images, n_jobs=None, chunk_size=1, backend='process', share_threshold=2 ** 20,
+                       function=apply_transformer):
+    """
+    Apply a fitted transformer to many images using a pool of workers.
+
+    With the process backend the fitted state is sent to each worker once, when the worker starts, and fitted
+    arrays of at least share_threshold bytes are placed in shared memory rather than being copied.
+    Results are yielded in the order of the input. Only a bounded number of chunks are in flight at once so the
+    input may be a long (lazy) iterable.
+
+    :param transformer: A fitted transformer (see apply_transformer).
+    :param images: Iterable of images RGB uint8 or paths to images (or of the items given to function).
+    :param n_jobs: Number of workers. Defaults to the number of CPUs.
+    :param chunk_size: Number of images sent to a worker per task.
+    :param backend: 'process' or 'thread'.
+    :param share_threshold: Minimum size in bytes of fitted arrays placed in shared memory.
+    :param function: Function applied to the transformer and each item, function(transformer, item). With the
+        process backend it should be defined at the top level of a module (picklable).
+    :return: Generator of transformed images (or of the results of function).
+    """
+    n_jobs = n_jobs or os.cpu_count()
+    blocks = []
+    if backend == 'process':
+        state, blocks = share_arrays(transformer, share_threshold)
+        executor = concurrent.futures.ProcessPoolExecutor(n_jobs, initializer=_init_worker, initargs=(state,))
+        task_transformer = None
+    elif backend == 'thread':
+        executor = concurrent.futures.ThreadPoolExecutor(n_jobs)
+        task_transformer = transformer
+    else:
+        raise Exception('Backend not recognized.')
+
+    try:
+        pending = collections.deque()
+        images = iter(images)
+        while True:
+            chunk = list(itertools.islice(images, chunk_size))
+            if not chunk:
+                break
+            pending.append(executor.submit(_process_chunk, chunk, task_transformer, function))
+            if len(pending) >= 2 * n_jobs:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+
+def share_arrays(transformer, share_threshold):
+    """
+    Get a copy of a transformer where the large fitted arrays are replaced by handles to shared memory.
+
+    :param transformer: The transformer.
+    :param share_threshold: Minimum size in bytes of arrays placed in shared memory.
+    :return: The copy and the list of shared memory blocks (to be unlinked by the caller).
+    """
+    if isinstance(transformer, type):
+        return transformer, []
+    state = copy.copy(transformer)
+    blocks = []
+    for name, value in vars(transformer).items():
+        if isinstance(value, np.ndarray) and value.nbytes >= share_threshold and value.nbytes > 0:
+            shm = shared_memory.SharedMemory(create=True, size=value.nbytes)
+            np.ndarray(value.shape, dtype=value.dtype, buffer=shm.buf)[...] = value
+            setattr(state, name, SharedArray(shm.name, value.shape, value.dtype.str))
+            blocks.append(shm)
+    return state, blocks
+
+
+def _init_worker(state):
+    global _worker_transformer
+    if not isinstance(state, type):
+        for name, value in vars(state).items():
+            if isinstance(value, SharedArray):
+                shm, array = value.attach()
+                _worker_shared_memory.append(shm)
+                setattr(state, name, array)
+    _worker_transformer = state
+
+
+def _process_chunk(chunk, transformer=None, function=apply_transformer):
+    if transformer is None:
+        transformer = _worker_transformer
+    return [function(transformer, I) for I in chunk]
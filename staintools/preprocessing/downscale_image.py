@@ -0,0 +1,17 @@
+import cv2 as cv
+
+
+def downscale_image(I, scale):
+    """
+    Downscale an image with area averaging (e.g. for a low resolution estimate of the stain matrix).
+
+    :param I: Image RGB uint8.
+    :param scale: Scale factor in (0, 1].
+    :return: The downscaled image (I itself if scale is 1).
+    """
+    assert 0 < scale <= 1, "Scale should be in (0, 1]."
+    if scale == 1:
+        return I
+    h, w = I.shape[:2]
+    size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+    return cv.resize(I, size, interpolation=cv.INTER_AREA)
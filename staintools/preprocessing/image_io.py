@@ -0,0 +1,155 @@
+import collections
+import concurrent.futures
+import glob
+import os
+
+import cv2 as cv
+
+from staintools.preprocessing.read_image import read_image
+from staintools.utils.exceptions import ImageWriteException
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp')
+
+
+def list_images(source):
+    """
+    List image paths.
+
+    :param source: A directory, a glob pattern or an iterable of paths.
+    :return: List of paths (sorted for a directory or a glob pattern).
+    """
+    if isinstance(source, (str, os.PathLike)):
+        source = os.fspath(source)
+        if os.path.isdir(source):
+            return sorted(os.path.join(source, name) for name in os.listdir(source)
+                          if name.lower().endswith(IMAGE_EXTENSIONS))
+        return sorted(glob.glob(source))
+    return list(source)
+
+
+def write_image(path, I, params=None):
+    """
+    Write an RGB uint8 image (converted to the BGR order of opencv).
+
+    :param path: The path, the format is given by the extension.
+    :param I: RGB uint8 image.
+    :param params: Optional opencv encoding parameters (e.g. [cv.IMWRITE_JPEG_QUALITY, 90]).
+    :return:
+    """
+    if not cv.imwrite(os.fspath(path), cv.cvtColor(I, cv.COLOR_RGB2BGR), params or []):
+        raise ImageWriteException("Image could not be written: {}".format(path))
+
+
+def prefetch_images(source, n_threads=4, prefetch=8, reader=read_image, return_exceptions=False, **reader_kwargs):
+    """
+    Read images in background threads, ahead of their use.
+
+    opencv releases the GIL while decoding, so reading overlaps with the processing of the images already read.
+    At most prefetch images are read ahead.
+
+    :param source: A directory, a glob pattern or an iterable of paths (see list_images).
+    :param n_threads: Number of reading threads.
+    :param prefetch: Maximum number of images read ahead.
+    :param reader: Callable path -> image (e.g. read_image or a reader for another format).
+    :param return_exceptions: Yield the exception raised by the reader in place of the image rather than raising it?
+    :param reader_kwargs: Keyword arguments for the reader (e.g. reduce=2).
+    :return: Generator of (path, image) in the order of the source.
+    """
+    executor = concurrent.futures.ThreadPoolExecutor(n_threads)
+    pending = collections.deque()
+
+    def get_oldest():
+        path, future = pending.popleft()
+        try:
+            return path, future.result()
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            return path, e
+
+    try:
+        for path in list_images(source):
+            pending.append((path, executor.submit(reader, path, **reader_kwargs)))
+            if len(pending) >= prefetch:
+                yield get_oldest()
+        while pending:
+            yield get_oldest()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+class ImageWriter(object):
+    """
+    Write images in background threads, so encoding and disk I/O overlap with the processing of the next images.
+
+    At most max_pending images wait to be written; write blocks beyond that. An image must not be modified until
+    it is written (e.g. do not reuse an out buffer before flush). Errors are raised by the write, flush or close
+    call that follows them. Use as a context manager to wait for all the writes at the end:
+
+        with ImageWriter() as writer:
+            for path, I in prefetch_images('input/'):
+                writer.write(path.replace('input', 'output'), normalizer.transform(I))
+    """
+
+    def __init__(self, n_threads=4, max_pending=8, writer=write_image, **writer_kwargs):
+        """
+        :param n_threads: Number of writing threads.
+        :param max_pending: Maximum number of images waiting to be written.
+        :param writer: Callable (path, image) -> None.
+        :param writer_kwargs: Keyword arguments for the writer (e.g. params).
+        """
+        self.executor = concurrent.futures.ThreadPoolExecutor(n_threads)
+        self.max_pending = max_pending
+        self.writer = writer
+        self.writer_kwargs = writer_kwargs
+        self.pending = collections.deque()
+
+    def write(self, path, I):
+        """
+        Queue an image to be written.
+
+        :param path: The path.
+        :param I: RGB uint8 image.
+        :return:
+        """
+        while len(self.pending) >= self.max_pending:
+            self.pending.popleft().result()
+        self.pending.append(self.executor.submit(self.writer, path, I, **self.writer_kwargs))
+
+    def write_batch(self, paths, images):
+        """
+        Queue a batch of images to be written.
+
+        :param paths: The paths.
+        :param images: List of RGB uint8 images or an array N x H x W x 3.
+        :return:
+        """
+        assert len(paths) == len(images), "There should be one path per image."
+        for path, I in zip(paths, images):
+            self.write(path, I)
+
+    def flush(self):
+        """
+        Wait for all the queued images to be written.
+
+        :return:
+        """
+        while self.pending:
+            self.pending.popleft().result()
+
+    def close(self):
+        """
+        Wait for all the queued images to be written and stop the threads.
+
+        :return:
+        """
+        try:
+            self.flush()
+        finally:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -2,24 +2,31 @@ import numpy as np
 import cv2 as cv
 
 from staintools.preprocessing.input_validation import is_uint8_image
+from staintools.utils.quantiles import histogram_percentile
 
 
 class LuminosityStandardizer(object):
 
     @staticmethod
-    def standardize(I, percentile=95):
+    def standardize(I, percentile=95, out=None):
         """
         Transform image I to standard brightness.
         Modifies the luminosity channel such that a fixed percentile is saturated.
 
         :param I: Image uint8 RGB.
         :param percentile: Percentile for luminosity saturation. At least (100 - percentile)% of pixels should be fully luminous (white).
+        :param out: Optional preallocated uint8 array of the same shape as I to write into.
         :return: Image uint8 RGB with standardized brightness.
         """
         assert is_uint8_image(I), "Image should be RGB uint8."
         I_LAB = cv.cvtColor(I, cv.COLOR_RGB2LAB)
+        # Exact percentile of the uint8 channel from its histogram (no sort).
+        p = histogram_percentile(I_LAB[:, :, 0], percentile)
         L_float = I_LAB[:, :, 0].astype(float)
-        p = np.percentile(L_float, percentile)
         I_LAB[:, :, 0] = np.clip(255 * L_float / p, 0, 255).astype(np.uint8)
-        I = cv.cvtColor(I_LAB, cv.COLOR_LAB2RGB)
-        return I
+        if out is None:
+            return cv.cvtColor(I_LAB, cv.COLOR_LAB2RGB)
+        assert out.shape == I.shape and out.dtype == np.uint8 and out.flags.c_contiguous, \
+            "Output should be a contiguous uint8 array of the image shape."
+        cv.cvtColor(I_LAB, cv.COLOR_LAB2RGB, dst=out)
+        return out
@@ -1,16 +1,70 @@
 import cv2 as cv
+import numpy as np
 import os
 
-def read_image(path):
+from staintools.utils.exceptions import ImageReadException
+
+# Decode straight to RGB if OpenCV supports it (4.10+), otherwise convert from BGR after decoding.
+IMREAD_COLOR_RGB = getattr(cv, 'IMREAD_COLOR_RGB', None)
+
+REDUCED_FLAGS = {1: cv.IMREAD_COLOR, 2: cv.IMREAD_REDUCED_COLOR_2, 4: cv.IMREAD_REDUCED_COLOR_4,
+                 8: cv.IMREAD_REDUCED_COLOR_8}
+
+
+def get_imread_flags(reduce=1):
+    """
+    Get the OpenCV flags to decode a color image.
+
+    :param reduce: Decode at 1/reduce of the resolution (1, 2, 4 or 8).
+    :return: Flags and whether the decoded image is RGB.
+    """
+    if reduce not in REDUCED_FLAGS:
+        raise Exception('Reduction factor not recognized.')
+    flags = REDUCED_FLAGS[reduce]
+    if IMREAD_COLOR_RGB is None:
+        return flags, False
+    return (flags & ~cv.IMREAD_COLOR) | IMREAD_COLOR_RGB, True
+
+
+def read_image(path, reduce=1):
     """
     Read an image to RGB uint8.
-    Read with opencv (cv) and covert from BGR colorspace to RGB.
+    Read with opencv (cv), decoding to RGB directly where supported.
 
-    :param path: The path to the image.
+    :param path: The path to the image, or the encoded image as bytes, bytearray or memoryview.
+    :param reduce: Decode at 1/reduce of the resolution (1, 2, 4 or 8, JPEG decodes faster at a reduced size).
     :return: RGB uint8 image.
     """
+    if isinstance(path, (bytes, bytearray, memoryview)):
+        return decode_image(path, reduce=reduce)
     assert os.path.isfile(path), "File not found"
-    im = cv.imread(path)
-    # Convert from cv2 standard of BGR to our convention of RGB.
-    im = cv.cvtColor(im, cv.COLOR_BGR2RGB)
-    return im
\ No newline at end of file
+    flags, is_RGB = get_imread_flags(reduce)
+    im = cv.imread(path, flags)
+    if im is None:
+        raise ImageReadException("Image could not be decoded: {}".format(path))
+    return im if is_RGB else to_RGB(im)
+
+
+def decode_image(buffer, reduce=1):
+    """
+    Decode an encoded image (e.g. the content of a PNG or JPEG file) to RGB uint8.
+
+    :param buffer: Bytes, bytearray or memoryview (not copied).
+    :param reduce: Decode at 1/reduce of the resolution (1, 2, 4 or 8).
+    :return: RGB uint8 image.
+    """
+    flags, is_RGB = get_imread_flags(reduce)
+    im = cv.imdecode(np.frombuffer(buffer, dtype=np.uint8), flags)
+    if im is None:
+        raise ImageReadException("Image could not be decoded.")
+    return im if is_RGB else to_RGB(im)
+
+
+def to_RGB(im):
+    """
+    Convert from cv2 standard of BGR to our convention of RGB, in place.
+
+    :param im: BGR uint8 image.
+    :return: The same array, now RGB.
+    """
+    return cv.cvtColor(im, cv.COLOR_BGR2RGB, dst=im)
@@ -2,6 +2,11 @@ import numpy as np
 import cv2 as cv
 
 from staintools.preprocessing.input_validation import is_uint8_image
+from staintools.utils.serialization import save_state, load_state
+from staintools.utils.streaming_statistics import RunningMoments
+
+# (scale, shift) such that the channels of lab_split are uint8 LAB / scale - shift.
+LAB_SCALES = ((2.55, 0.0), (1.0, 128.0), (1.0, 128.0))
 
 
 class ReinhardColorNormalizer(object):
@@ -14,6 +19,15 @@ class ReinhardColorNormalizer(object):
     def __init__(self):
         self.target_means = None
         self.target_stds = None
+        self.stream_statistics = None
+
+    def get_params(self):
+        """
+        Get the constructor parameters.
+
+        :return: Dict of parameters.
+        """
+        return {}
 
     def fit(self, target):
         """
@@ -26,19 +40,127 @@ class ReinhardColorNormalizer(object):
         self.target_means = means
         self.target_stds = stds
 
-    def transform(self, I):
+    def partial_fit(self, target):
+        """
+        Accumulate the LAB statistics of one image of a target cohort. Call finalize once all images are seen.
+
+        :param target: Image RGB uint8.
+        :return:
+        """
+        assert is_uint8_image(target), "Should be a RGB uint8 image"
+        if self.stream_statistics is None:
+            self.stream_statistics = RunningMoments(3)
+        m, sd = cv.meanStdDev(cv.cvtColor(target, cv.COLOR_RGB2LAB))
+        self.stream_statistics.update_from_moments(target.shape[0] * target.shape[1], m, sd)
+
+    def fit_stream(self, targets):
+        """
+        Fit to a cohort of target images, seen one at a time.
+
+        :param targets: Iterable of images RGB uint8.
+        :return:
+        """
+        for target in targets:
+            self.partial_fit(target)
+        self.finalize()
+
+    def finalize(self):
+        """
+        Finish fitting from the statistics accumulated by partial_fit.
+
+        :return:
+        """
+        assert self.stream_statistics is not None, "Call partial_fit first."
+        moments = self.stream_statistics
+        self.target_means, self.target_stds = self.scale_lab_statistics(moments.mean[:, None], moments.std[:, None])
+        self.stream_statistics = None
+
+    def save(self, path):
+        """
+        Save the fitted state to a .npz file.
+
+        :param path: Path or file object.
+        :return:
+        """
+        save_state(path, 'ReinhardColorNormalizer', self.get_params(),
+                   {'target_means': np.array(self.target_means), 'target_stds': np.array(self.target_stds)})
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a fitted normalizer saved with save.
+
+        :param path: Path or file object.
+        :return: Fitted ReinhardColorNormalizer.
+        """
+        params, arrays = load_state(path, 'ReinhardColorNormalizer')
+        normalizer = cls(**params)
+        normalizer.target_means = arrays['target_means']
+        normalizer.target_stds = arrays['target_stds']
+        return normalizer
+
+    def transform(self, I, out=None):
         """
         Transform an image.
 
+        The image is converted to LAB once and the per-channel affine mapping is applied in place as a
+        lookup table on the uint8 LAB image.
+
         :param I: Image RGB uint8.
+        :param out: Optional preallocated uint8 array of the same shape as I to write into.
         :return:
         """
-        I1, I2, I3 = self.lab_split(I)
-        means, stds = self.get_mean_std(I)
-        norm1 = ((I1 - means[0]) * (self.target_stds[0] / stds[0])) + self.target_means[0]
-        norm2 = ((I2 - means[1]) * (self.target_stds[1] / stds[1])) + self.target_means[1]
-        norm3 = ((I3 - means[2]) * (self.target_stds[2] / stds[2])) + self.target_means[2]
-        return self.merge_back(norm1, norm2, norm3)
+        assert is_uint8_image(I), "Should be a RGB uint8 image"
+        I_LAB = cv.cvtColor(I, cv.COLOR_RGB2LAB)
+        means, stds = self.lab_mean_std(I_LAB)
+        cv.LUT(I_LAB, self.get_lookup_table(means, stds), dst=I_LAB)
+        if out is None:
+            return cv.cvtColor(I_LAB, cv.COLOR_LAB2RGB)
+        assert out.shape == I.shape and out.dtype == np.uint8 and out.flags.c_contiguous, \
+            "Output should be a contiguous uint8 array of the image shape."
+        cv.cvtColor(I_LAB, cv.COLOR_LAB2RGB, dst=out)
+        return out
+
+    def transform_batch(self, images, out=None):
+        """
+        Transform a batch of images of the same shape.
+
+        :param images: List of images RGB uint8 or an array N x H x W x 3.
+        :param out: Optional preallocated uint8 array N x H x W x 3 to write into.
+        :return: Array N x H x W x 3 uint8.
+        """
+        images = np.asarray(images)
+        assert images.ndim == 4 and images.dtype == np.uint8, "Images should be a stack of RGB uint8 images."
+        n_images, h, w, c = images.shape
+        # Convert the stack as one tall image.
+        I_LAB = cv.cvtColor(images.reshape((n_images * h, w, c)), cv.COLOR_RGB2LAB).reshape(images.shape)
+        for i in range(n_images):
+            means, stds = self.lab_mean_std(I_LAB[i])
+            cv.LUT(I_LAB[i], self.get_lookup_table(means, stds), dst=I_LAB[i])
+        if out is None:
+            out = np.empty(images.shape, dtype=np.uint8)
+        assert out.shape == images.shape and out.dtype == np.uint8 and out.flags.c_contiguous, \
+            "Output should be a contiguous uint8 array of the images shape."
+        cv.cvtColor(I_LAB.reshape((n_images * h, w, c)), cv.COLOR_LAB2RGB, dst=out.reshape((n_images * h, w, c)))
+        return out
+
+    def get_lookup_table(self, means, stds):
+        """
+        Get the lookup table mapping the uint8 LAB values of an image to normalized uint8 LAB values.
+
+        :param means: Means of the image channels (as given by get_mean_std).
+        :param stds: Standard deviations of the image channels (as given by get_mean_std).
+        :return: Lookup table 256 x 1 x 3 uint8.
+        """
+        means, stds = np.ravel(means), np.ravel(stds)
+        target_means, target_stds = np.ravel(self.target_means), np.ravel(self.target_stds)
+        values = np.arange(256, dtype=np.float64)
+        table = np.empty((256, 1, 3), dtype=np.uint8)
+        for i, (scale, shift) in enumerate(LAB_SCALES):
+            x = values / scale - shift
+            norm = ((x - means[i]) * (target_stds[i] / stds[i])) + target_means[i]
+            table[:, 0, i] = np.clip((norm + shift) * scale, 0, 255).astype(np.uint8)
+        return table
 
     @staticmethod
     def lab_split(I):
@@ -81,10 +203,29 @@ class ReinhardColorNormalizer(object):
         :return:
         """
         assert is_uint8_image(I), "Should be a RGB uint8 image"
-        I1, I2, I3 = self.lab_split(I)
-        m1, sd1 = cv.meanStdDev(I1)
-        m2, sd2 = cv.meanStdDev(I2)
-        m3, sd3 = cv.meanStdDev(I3)
-        means = m1, m2, m3
-        stds = sd1, sd2, sd3
+        return self.lab_mean_std(cv.cvtColor(I, cv.COLOR_RGB2LAB))
+
+    @staticmethod
+    def lab_mean_std(I_LAB):
+        """
+        Get mean and standard deviation of each channel of a uint8 LAB image in one pass.
+        The statistics are given in the units of lab_split (L in [0,100], A and B in [-127,127]).
+
+        :param I_LAB: Image LAB uint8.
+        :return:
+        """
+        m, sd = cv.meanStdDev(I_LAB)
+        return ReinhardColorNormalizer.scale_lab_statistics(m, sd)
+
+    @staticmethod
+    def scale_lab_statistics(m, sd):
+        """
+        Convert channel means and standard deviations of a uint8 LAB image to the units of lab_split.
+
+        :param m: Means 3 x 1.
+        :param sd: Standard deviations 3 x 1.
+        :return:
+        """
+        means = tuple(m[i:i + 1] / scale - shift for i, (scale, shift) in enumerate(LAB_SCALES))
+        stds = tuple(sd[i:i + 1] / scale for i, (scale, _) in enumerate(LAB_SCALES))
         return means, stds
@@ -1,58 +1,227 @@
 import numpy as np
-import copy
 
+from staintools.preprocessing.downscale_image import downscale_image
 from staintools.stain_extraction.macenko_stain_extractor import MacenkoStainExtractor
 from staintools.stain_extraction.vahadane_stain_extractor import VahadaneStainExtractor
 from staintools.tissue_masks.luminosity_threshold_tissue_locator import LuminosityThresholdTissueLocator
+from staintools.tissue_masks.tissue_mask import TissueMask
 from staintools.utils.get_concentrations import get_concentrations
+from staintools.utils.serialization import save_state, load_state
+from staintools.utils.profiling import stage
+from staintools.utils.quantization import QuantizedArray
+from staintools.utils.reconstruction import reconstruct_RGB
 
 
 class StainAugmentor(object):
 
-    def __init__(self, method, sigma1=0.2, sigma2=0.2, augment_background=True):
+    def __init__(self, method, sigma1=0.2, sigma2=0.2, augment_background=True, solver='spams',
+                 extractor_kwargs=None, background=None, concentration_dtype=None,
+                 estimation_scale=1):
+        """
+        :param method: 'macenko' or 'vahadane'.
+        :param sigma1: Range of the multiplicative concentration perturbation.
+        :param sigma2: Range of the additive concentration perturbation.
+        :param augment_background: Augment the background too?
+        :param solver: Concentration solver, 'spams' or 'numpy' (see get_concentrations).
+        :param extractor_kwargs: Optional dict of keyword arguments for get_stain_matrix (e.g. max_pixels).
+        :param background: None to augment every pixel (see augment_background). 'copy' or 'white' to solve and
+            reconstruct the tissue pixels only, and copy the background pixels unchanged or set them to white.
+        :param concentration_dtype: None to keep the concentrations as solved, 'float16' or 'uint16' to keep them as a
+            compact QuantizedArray (rows of zeros, e.g. the white background, not stored), dequantized on use.
+        :param estimation_scale: Estimate the stain matrix from the image downscaled by this factor (e.g. 0.25),
+            while the concentrations are solved at full resolution.
+        """
         if method.lower() == 'macenko':
             self.extractor = MacenkoStainExtractor
         elif method.lower() == 'vahadane':
             self.extractor = VahadaneStainExtractor
         else:
             raise Exception('Method not recognized.')
+        self.method = method.lower()
         self.sigma1 = sigma1
         self.sigma2 = sigma2
         self.augment_background = augment_background
+        self.solver = solver
+        self.extractor_kwargs = extractor_kwargs or {}
+        if background not in (None, 'copy', 'white'):
+            raise Exception('Background not recognized.')
+        self.background = background
+        assert 0 < estimation_scale <= 1, "Estimation scale should be in (0, 1]."
+        self.estimation_scale = estimation_scale
+        self.concentration_dtype = None if concentration_dtype is None else np.dtype(concentration_dtype).name
 
-    def fit(self, I):
+    def get_params(self):
+        """
+        Get the constructor parameters.
+
+        :return: Dict of parameters.
+        """
+        return {'method': self.method, 'sigma1': self.sigma1, 'sigma2': self.sigma2,
+                'augment_background': self.augment_background, 'solver': self.solver,
+                'extractor_kwargs': self.extractor_kwargs, 'background': self.background,
+                'concentration_dtype': self.concentration_dtype, 'estimation_scale': self.estimation_scale}
+
+    def fit(self, I, tissue_mask=None, estimation_image=None):
         """
         Fit to an image I.
 
         :param I:
+        :param tissue_mask: Optional precomputed TissueMask of I.
+        :param estimation_image: Optional low resolution version of I (e.g. a slide thumbnail) to estimate the stain
+            matrix from (see estimation_scale).
         :return:
         """
+        if tissue_mask is None:
+            # Computed once, for both the stain matrix estimation and the background.
+            tissue_mask = LuminosityThresholdTissueLocator.locate(
+                I, luminosity_threshold=self.extractor_kwargs.get('luminosity_threshold', 0.8),
+                downsample=self.extractor_kwargs.get('mask_downsample', 1))
         self.image_shape = I.shape
-        self.stain_matrix = self.extractor.get_stain_matrix(I)
-        self.source_concentrations = get_concentrations(I, self.stain_matrix)
+        if estimation_image is None and self.estimation_scale != 1:
+            estimation_image = downscale_image(I, self.estimation_scale)
+        if estimation_image is None:
+            self.stain_matrix = self.extractor.get_stain_matrix(I, tissue_mask=tissue_mask, **self.extractor_kwargs)
+        else:
+            self.stain_matrix = self.extractor.get_stain_matrix(estimation_image, **self.extractor_kwargs)
+        self.tissue_mask = TissueMask.get_mask(I, tissue_mask).ravel()
+        self.background_pixels = None
+        if self.background is None:
+            self.source_concentrations = get_concentrations(I, self.stain_matrix, solver=self.solver)
+        else:
+            # Only the tissue concentrations are solved and kept.
+            pixels = I.reshape((-1, 3))
+            self.source_concentrations = get_concentrations(pixels[self.tissue_mask], self.stain_matrix,
+                                                            solver=self.solver)
+            if self.background == 'copy':
+                self.background_pixels = pixels[~self.tissue_mask]
+        if self.concentration_dtype is not None:
+            self.source_concentrations = QuantizedArray(self.source_concentrations, self.concentration_dtype,
+                                                        sparse=True)
         self.n_stains = self.source_concentrations.shape[1]
-        self.tissue_mask = LuminosityThresholdTissueLocator.get_tissue_mask(I).ravel()
 
-    def pop(self):
+    def save(self, path):
         """
-        Get an augmented version of the fitted image.
+        Save the fitted state to a .npz file.
 
+        :param path: Path or file object.
         :return:
         """
-        augmented_concentrations = copy.deepcopy(self.source_concentrations)
+        arrays = {'image_shape': np.array(self.image_shape), 'stain_matrix': self.stain_matrix,
+                  'tissue_mask': self.tissue_mask}
+        if isinstance(self.source_concentrations, QuantizedArray):
+            for name, array in self.source_concentrations.get_arrays().items():
+                arrays['source_concentrations_' + name] = array
+        else:
+            arrays['source_concentrations'] = self.source_concentrations
+        if self.background_pixels is not None:
+            arrays['background_pixels'] = self.background_pixels
+        save_state(path, 'StainAugmentor', self.get_params(), arrays)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a fitted augmentor saved with save.
+
+        :param path: Path or file object.
+        :return: Fitted StainAugmentor.
+        """
+        params, arrays = load_state(path, 'StainAugmentor')
+        augmentor = cls(**params)
+        augmentor.image_shape = tuple(arrays['image_shape'].tolist())
+        augmentor.stain_matrix = arrays['stain_matrix']
+        if 'source_concentrations' in arrays:
+            augmentor.source_concentrations = arrays['source_concentrations']
+        else:
+            prefix = 'source_concentrations_'
+            augmentor.source_concentrations = QuantizedArray.from_arrays(
+                {name[len(prefix):]: array for name, array in arrays.items() if name.startswith(prefix)})
+        augmentor.n_stains = augmentor.source_concentrations.shape[1]
+        augmentor.tissue_mask = arrays['tissue_mask']
+        augmentor.background_pixels = arrays.get('background_pixels')
+        return augmentor
+
+    def pop(self, out=None):
+        """
+        Get an augmented version of the fitted image.
+
+        :param out: Optional preallocated array (e.g. uint8) of the image shape to write into.
+        :return: The augmented image. Without out it has the float dtype of the fit, the default dtype at fit time
+            (float32 unless set_default_dtype says otherwise; it was always float64 before the dtype policy).
+        """
+        n_pixels = self.source_concentrations.shape[0]
+        with stage('augmentation', pixels=n_pixels):
+            alpha = np.empty(self.n_stains)
+            beta = np.empty(self.n_stains)
+            for i in range(self.n_stains):
+                alpha[i] = np.random.uniform(1 - self.sigma1, 1 + self.sigma1)
+                beta[i] = np.random.uniform(-self.sigma2, self.sigma2)
 
-        for i in range(self.n_stains):
-            alpha = np.random.uniform(1 - self.sigma1, 1 + self.sigma1)
-            beta = np.random.uniform(-self.sigma2, self.sigma2)
-            if self.augment_background:
-                augmented_concentrations[:, i] *= alpha
-                augmented_concentrations[:, i] += beta
-            else:
-                augmented_concentrations[self.tissue_mask, i] *= alpha
-                augmented_concentrations[self.tissue_mask, i] += beta
+        with stage('reconstruction', pixels=n_pixels):
+            if out is None:
+                out = np.empty(self.image_shape, dtype=self.source_concentrations.dtype)
+            self.reconstruct(alpha, beta, out, self.get_background(out.dtype))
+        return out
+
+    def pop_batch(self, k, rng=None, dtype=np.uint8, out=None):
+        """
+        Get k augmented versions of the fitted image at once.
 
-        I_augmented = 255 * np.exp(-1 * np.dot(augmented_concentrations, self.stain_matrix))
-        I_augmented = I_augmented.reshape(self.image_shape)
-        I_augmented = np.clip(I_augmented, 0, 255)
+        All the perturbations are drawn in one go and each image is reconstructed straight into the output.
 
-        return I_augmented
+        :param k: Number of augmented images.
+        :param rng: A numpy.random.Generator or a seed (for reproducible augmentation).
+        :param dtype: Output dtype (e.g. np.uint8 or np.float32). Ignored if out is given.
+        :param out: Optional preallocated array k x H x W x 3 to write into.
+        :return: Array k x H x W x 3.
+        """
+        n_pixels = k * self.source_concentrations.shape[0]
+        rng = np.random.default_rng(rng)
+        with stage('augmentation', pixels=n_pixels):
+            alpha = rng.uniform(1 - self.sigma1, 1 + self.sigma1, (k, self.n_stains))
+            beta = rng.uniform(-self.sigma2, self.sigma2, (k, self.n_stains))
+
+        with stage('reconstruction', pixels=n_pixels):
+            if out is None:
+                out = np.empty((k,) + tuple(self.image_shape), dtype=dtype)
+            background = self.get_background(out.dtype)
+            for i in range(k):
+                self.reconstruct(alpha[i], beta[i], out[i], background)
+        return out
+
+    def get_background(self, dtype):
+        """
+        Get the unaugmented background pixels (if the background is not augmented).
+
+        :param dtype: Output dtype.
+        :return: Array n_background x 3 (or a scalar for a white background) or None.
+        """
+        if self.background == 'copy':
+            return self.background_pixels.astype(dtype, copy=False)
+        if self.background == 'white':
+            return np.array(255, dtype=dtype)
+        if self.augment_background:
+            return None
+        return reconstruct_RGB(self.source_concentrations[~self.tissue_mask], self.stain_matrix, dtype=dtype)
+
+    def reconstruct(self, alpha, beta, out, background=None):
+        """
+        Reconstruct the image with the concentrations perturbed to C * alpha + beta.
+        The perturbation is folded into the stain matrix and an optical density offset,
+        (C * alpha + beta).W = C.(alpha W) + beta.W, so no augmented copy of the concentrations is made.
+
+        :param alpha: Multiplicative perturbation per stain.
+        :param beta: Additive perturbation per stain.
+        :param out: Array of the image shape to write into.
+        :param background: Optional background pixels to restore (see get_background).
+        :return:
+        """
+        stain_matrix = alpha.reshape((-1, 1)) * self.stain_matrix
+        offset = np.dot(beta, self.stain_matrix)
+        tissue_mask = self.tissue_mask.reshape(self.image_shape[:2])
+        if self.background is None:
+            reconstruct_RGB(self.source_concentrations, stain_matrix, offset=offset, out=out)
+        else:
+            out[tissue_mask] = reconstruct_RGB(self.source_concentrations, stain_matrix, offset=offset,
+                                               dtype=out.dtype)
+        if background is not None:
+            out[~tissue_mask] = background
@@ -3,14 +3,20 @@ import numpy as np
 from staintools.stain_extraction.abc_stain_extractor import ABCStainExtractor
 from staintools.utils.miscellaneous_functions import normalize_matrix_rows
 from staintools.utils.optical_density_conversion import convert_RGB_to_OD
+from staintools.utils.pixel_sampling import sample_pixel_indices
+from staintools.utils.profiling import stage
+from staintools.utils.quantiles import percentile
 from staintools.tissue_masks.luminosity_threshold_tissue_locator import LuminosityThresholdTissueLocator
+from staintools.tissue_masks.tissue_mask import TissueMask
 from staintools.preprocessing.input_validation import is_uint8_image
 
 
 class MacenkoStainExtractor(ABCStainExtractor):
 
     @staticmethod
-    def get_stain_matrix(I, luminosity_threshold=0.8, angular_percentile=99):
+    def get_stain_matrix(I, luminosity_threshold=0.8, angular_percentile=99, max_pixels=None, sample_fraction=None,
+                         random_state=0, block_size=None, covariance=None, exact=True, tissue_mask=None,
+                         mask_downsample=1):
         """
         Stain matrix estimation via method of:
         M. Macenko et al. 'A method for normalizing histology slides for quantitative analysis'
@@ -18,16 +24,32 @@ class MacenkoStainExtractor(ABCStainExtractor):
         :param I: Image RGB uint8.
         :param luminosity_threshold:
         :param angular_percentile:
+        :param max_pixels: Estimate from at most this many (randomly sampled) tissue pixels.
+        :param sample_fraction: Estimate from this fraction of (randomly sampled) tissue pixels.
+        :param random_state: Seed for the pixel sampling.
+        :param block_size: Stratify the pixel sampling by spatial blocks of this size.
+        :param covariance: Optional OD covariance to use instead of that of the image (e.g. from many images).
+        :param exact: Compute the angular percentiles exactly or with a bounded error quantile sketch?
+        :param tissue_mask: Optional precomputed TissueMask (or boolean array) of I, used instead of thresholding.
+        :param mask_downsample: Downsampling factor for computing the tissue mask.
         :return:
         """
         assert is_uint8_image(I), "Image should be RGB uint8."
         # Convert to OD and ignore background
-        tissue_mask = LuminosityThresholdTissueLocator.get_tissue_mask(I, luminosity_threshold=luminosity_threshold).reshape((-1,))
-        OD = convert_RGB_to_OD(I).reshape((-1, 3))
-        OD = OD[tissue_mask]
+        if tissue_mask is None:
+            tissue_mask = LuminosityThresholdTissueLocator.get_tissue_mask(
+                I, luminosity_threshold=luminosity_threshold, downsample=mask_downsample)
+        else:
+            tissue_mask = TissueMask.get_mask(I, tissue_mask)
+        indices = sample_pixel_indices(tissue_mask, max_pixels=max_pixels, sample_fraction=sample_fraction,
+                                       random_state=random_state, block_size=block_size)
+        OD = convert_RGB_to_OD(I.reshape((-1, 3))[indices])
 
         # Eigenvectors of cov in OD space (orthogonal as cov symmetric)
-        _, V = np.linalg.eigh(np.cov(OD, rowvar=False))
+        with stage('stain_matrix.eigen', pixels=OD.shape[0]):
+            if covariance is None:
+                covariance = np.cov(OD, rowvar=False)
+            _, V = np.linalg.eigh(covariance)
 
         # The two principle eigenvectors
         V = V[:, [2, 1]]
@@ -36,15 +58,15 @@ class MacenkoStainExtractor(ABCStainExtractor):
         if V[0, 0] < 0: V[:, 0] *= -1
         if V[0, 1] < 0: V[:, 1] *= -1
 
-        # Project on this basis.
-        That = np.dot(OD, V)
+        with stage('stain_matrix.angles', pixels=OD.shape[0]):
+            # Project on this basis.
+            That = np.dot(OD, V)
 
-        # Angular coordinates with repect to the prinicple, orthogonal eigenvectors
-        phi = np.arctan2(That[:, 1], That[:, 0])
+            # Angular coordinates with repect to the prinicple, orthogonal eigenvectors
+            phi = np.arctan2(That[:, 1], That[:, 0])
 
-        # Min and max angles
-        minPhi = np.percentile(phi, 100 - angular_percentile)
-        maxPhi = np.percentile(phi, angular_percentile)
+            # Min and max angles
+            minPhi, maxPhi = percentile(phi, [100 - angular_percentile, angular_percentile], exact=exact)
 
         # the two principle colors
         v1 = np.dot(V, np.array([np.cos(minPhi), np.sin(minPhi)]))
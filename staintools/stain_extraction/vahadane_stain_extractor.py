@@ -1,16 +1,25 @@
-import spams
+import numpy as np
 
 from staintools.stain_extraction.abc_stain_extractor import ABCStainExtractor
+from staintools.utils.dictionary_learning import nonnegative_dictionary_learning
 from staintools.utils.miscellaneous_functions import normalize_matrix_rows
 from staintools.utils.optical_density_conversion import convert_RGB_to_OD
+from staintools.utils.pixel_sampling import sample_pixel_indices
+from staintools.utils.profiling import stage
 from staintools.tissue_masks.luminosity_threshold_tissue_locator import LuminosityThresholdTissueLocator
+from staintools.tissue_masks.tissue_mask import TissueMask
 from staintools.preprocessing.input_validation import is_uint8_image
 
+# Number of spams.trainDL iterations between the early stopping checks.
+SPAMS_ITERATIONS_PER_CHECK = 10
+
 
 class VahadaneStainExtractor(ABCStainExtractor):
 
     @staticmethod
-    def get_stain_matrix(I, luminosity_threshold=0.8, regularizer=0.1):
+    def get_stain_matrix(I, luminosity_threshold=0.8, regularizer=0.1, max_pixels=None, sample_fraction=None,
+                         random_state=0, block_size=None, tissue_mask=None, mask_downsample=1, backend='spams',
+                         init_dictionary=None, n_iter=None, tol=1e-4, batch_size=None):
         """
         Stain matrix estimation via method of:
         A. Vahadane et al. 'Structure-Preserving Color Normalization and Sparse Stain Separation for Histological Images'
@@ -18,17 +27,41 @@ class VahadaneStainExtractor(ABCStainExtractor):
         :param I: Image RGB uint8.
         :param luminosity_threshold:
         :param regularizer:
+        :param max_pixels: Estimate from at most this many (randomly sampled) tissue pixels.
+        :param sample_fraction: Estimate from this fraction of (randomly sampled) tissue pixels.
+        :param random_state: Seed for the pixel sampling.
+        :param block_size: Stratify the pixel sampling by spatial blocks of this size.
+        :param tissue_mask: Optional precomputed TissueMask (or boolean array) of I, used instead of thresholding.
+        :param mask_downsample: Downsampling factor for computing the tissue mask.
+        :param backend: Dictionary learning by 'spams' (spams.trainDL) or 'numpy' (nonnegative_dictionary_learning).
+        :param init_dictionary: Optional stain matrix to warm start from (e.g. that of the previous tile or the slide).
+        :param n_iter: Maximum number of iterations (default: that of spams, or 100 for numpy).
+        :param tol: Stop once no stain matrix entry changes by more than tol (for spams only if n_iter is given).
+        :param batch_size: Rows per iteration for mini-batch learning (numpy only, None for all).
         :return:
         """
         assert is_uint8_image(I), "Image should be RGB uint8."
         # convert to OD and ignore background
-        tissue_mask = LuminosityThresholdTissueLocator.get_tissue_mask(I, luminosity_threshold=luminosity_threshold).reshape((-1,))
-        OD = convert_RGB_to_OD(I).reshape((-1, 3))
-        OD = OD[tissue_mask]
+        if tissue_mask is None:
+            tissue_mask = LuminosityThresholdTissueLocator.get_tissue_mask(
+                I, luminosity_threshold=luminosity_threshold, downsample=mask_downsample)
+        else:
+            tissue_mask = TissueMask.get_mask(I, tissue_mask)
+        indices = sample_pixel_indices(tissue_mask, max_pixels=max_pixels, sample_fraction=sample_fraction,
+                                       random_state=random_state, block_size=block_size)
+        OD = convert_RGB_to_OD(I.reshape((-1, 3))[indices])
 
         # do the dictionary learning
-        dictionary = spams.trainDL(X=OD.T, K=2, lambda1=regularizer, mode=2,
-                                   modeD=0, posAlpha=True, posD=True, verbose=False).T
+        with stage('stain_matrix.dictionary_learning', pixels=OD.shape[0]):
+            if backend == 'spams':
+                dictionary = VahadaneStainExtractor.train_spams(OD, regularizer, init_dictionary, n_iter, tol)
+            elif backend == 'numpy':
+                dictionary, _ = nonnegative_dictionary_learning(
+                    OD, n_components=2, regularizer=regularizer, init_dictionary=init_dictionary,
+                    n_iter=100 if n_iter is None else n_iter, tol=tol, batch_size=batch_size,
+                    random_state=random_state)
+            else:
+                raise Exception('Backend not recognized.')
 
         # order H and E.
         # H on first row.
@@ -36,3 +69,74 @@ class VahadaneStainExtractor(ABCStainExtractor):
             dictionary = dictionary[[1, 0], :]
 
         return normalize_matrix_rows(dictionary)
+
+    @staticmethod
+    def train_spams(OD, regularizer, init_dictionary=None, n_iter=None, tol=None):
+        """
+        Dictionary learning with spams.trainDL, optionally warm started and stopped early.
+
+        :param OD: Optical densities N x 3.
+        :param regularizer:
+        :param init_dictionary: Optional initial dictionary 2 x 3.
+        :param n_iter: Maximum number of iterations (None for the spams default, without early stopping).
+        :param tol: Stop once no dictionary entry changes by more than tol.
+        :return: Dictionary 2 x 3.
+        """
+        import spams
+
+        kwargs = {'K': 2, 'lambda1': regularizer, 'mode': 2, 'modeD': 0, 'posAlpha': True, 'posD': True,
+                  'verbose': False}
+        D = None
+        if init_dictionary is not None:
+            D = np.asfortranarray(np.asarray(init_dictionary, dtype=OD.dtype).T)
+        if n_iter is None:
+            return spams.trainDL(X=OD.T, D=D, **kwargs).T
+
+        # Continue the same online learning (model) between the checks.
+        model = None
+        n_done = 0
+        while n_done < n_iter:
+            n_step = min(SPAMS_ITERATIONS_PER_CHECK, n_iter - n_done)
+            previous = D
+            D, model = spams.trainDL(X=OD.T, D=D, iter=n_step, return_model=True, model=model, **kwargs)
+            n_done += n_step
+            if tol is not None and previous is not None and np.abs(D - previous).max() < tol:
+                break
+        return D.T
+
+
+class WarmStartVahadaneStainExtractor(object):
+    """
+    Vahadane stain matrix estimation warm started from the previous estimate.
+
+    Consecutive tiles of a slide have nearly identical stain matrices, so starting the dictionary learning of each
+    tile from the stain matrix of the previous one (or from a slide level one) converges in a few iterations.
+    Used by StainNormalizer(method='vahadane_warm').
+    """
+
+    def __init__(self, init_dictionary=None, backend='spams', n_iter=20, tol=1e-4):
+        """
+        :param init_dictionary: Optional stain matrix for the first call (e.g. a slide level one).
+        :param backend: 'spams' or 'numpy'.
+        :param n_iter: Maximum number of iterations per call.
+        :param tol: Early stopping tolerance.
+        """
+        self.dictionary = init_dictionary
+        self.backend = backend
+        self.n_iter = n_iter
+        self.tol = tol
+
+    def get_stain_matrix(self, I, **kwargs):
+        """
+        Estimate the stain matrix of an image, starting from the last estimate.
+
+        :param I: Image RGB uint8.
+        :param kwargs: Other arguments of VahadaneStainExtractor.get_stain_matrix (an init_dictionary is only used
+            if there is no previous estimate).
+        :return:
+        """
+        kwargs = dict({'backend': self.backend, 'n_iter': self.n_iter, 'tol': self.tol}, **kwargs)
+        if self.dictionary is not None:
+            kwargs['init_dictionary'] = self.dictionary
+        self.dictionary = VahadaneStainExtractor.get_stain_matrix(I, **kwargs)
+        return self.dictionary
@@ -1,43 +1,416 @@
 import numpy as np
 
 from staintools.stain_extraction.macenko_stain_extractor import MacenkoStainExtractor
-from staintools.stain_extraction.vahadane_stain_extractor import VahadaneStainExtractor
-from staintools.utils.optical_density_conversion import convert_OD_to_RGB
-from staintools.utils.get_concentrations import get_concentrations
+from staintools.stain_extraction.vahadane_stain_extractor import VahadaneStainExtractor, \
+    WarmStartVahadaneStainExtractor
+from staintools.utils.optical_density_conversion import convert_OD_to_RGB, convert_RGB_to_OD
+from staintools.utils.get_concentrations import get_concentrations, nonnegative_lasso
+from staintools.utils.serialization import save_state, load_state
+from staintools.utils.profiling import stage
+from staintools.utils.quantiles import percentile
+from staintools.utils.dtype_policy import get_default_dtype
+from staintools.utils.reconstruction import reconstruct_RGB
+from staintools.utils.streaming_statistics import RunningCovariance, ReservoirSampler
+from staintools.utils.exceptions import TissueMaskException
+from staintools.tissue_masks.luminosity_threshold_tissue_locator import LuminosityThresholdTissueLocator
+from staintools.tissue_masks.tissue_mask import TissueMask
+from staintools.preprocessing.downscale_image import downscale_image
+from staintools.preprocessing.input_validation import is_uint8_image
 
 
 class StainNormalizer(object):
 
-    def __init__(self, method):
+    def __init__(self, method, solver='spams', extractor_kwargs=None, exact=True, background=None, cache=None,
+                 estimation_scale=1):
+        """
+        :param method: 'macenko', 'vahadane' or 'vahadane_warm' (Vahadane warm started from the previous estimate,
+            see WarmStartVahadaneStainExtractor).
+        :param solver: Concentration solver, 'spams' or 'numpy' (see get_concentrations).
+        :param extractor_kwargs: Optional dict of keyword arguments for get_stain_matrix (e.g. max_pixels).
+        :param exact: Compute the concentration percentiles exactly or with a bounded error quantile sketch?
+        :param background: None to transform every pixel. 'copy' or 'white' to solve, take the percentiles of and
+            reconstruct the tissue pixels only, and copy the background pixels unchanged or set them to white.
+        :param cache: Optional StainMatrixCache for the source stain matrices (not saved with the fit).
+        :param estimation_scale: Estimate the source stain matrix and percentile from the source image downscaled by
+            this factor (e.g. 0.25), while the concentrations are solved and reconstructed at full resolution.
+        """
         if method.lower() == 'macenko':
             self.extractor = MacenkoStainExtractor
         elif method.lower() == 'vahadane':
             self.extractor = VahadaneStainExtractor
+        elif method.lower() == 'vahadane_warm':
+            self.extractor = WarmStartVahadaneStainExtractor()
         else:
             raise Exception('Method not recognized.')
+        self.method = method.lower()
+        self.solver = solver
+        self.extractor_kwargs = extractor_kwargs or {}
+        self.exact = exact
+        if background not in (None, 'copy', 'white'):
+            raise Exception('Background not recognized.')
+        self.background = background
+        self.cache = cache
+        assert 0 < estimation_scale <= 1, "Estimation scale should be in (0, 1]."
+        self.estimation_scale = estimation_scale
+        self.stream_statistics = None
+
+    def get_params(self):
+        """
+        Get the constructor parameters.
+
+        :return: Dict of parameters.
+        """
+        return {'method': self.method, 'solver': self.solver, 'extractor_kwargs': self.extractor_kwargs,
+                'exact': self.exact, 'background': self.background, 'estimation_scale': self.estimation_scale}
 
-    def fit(self, target):
+    def fit(self, target, tissue_mask=None):
         """
         Fit to a target image.
 
         :param target: Image RGB uint8.
+        :param tissue_mask: Optional precomputed TissueMask of the target.
+        :return:
+        """
+        if self.background is not None and tissue_mask is None:
+            tissue_mask = self.locate_tissue(target)
+        self.stain_matrix_target = self.extractor.get_stain_matrix(target, tissue_mask=tissue_mask,
+                                                                   **self.extractor_kwargs)
+        self.fit_target_percentile(target, tissue_mask)
+
+    def locate_tissue(self, I):
+        """
+        Compute the tissue mask of an image with the luminosity threshold of the extractor.
+
+        :param I: Image RGB uint8.
+        :return: TissueMask.
+        """
+        return LuminosityThresholdTissueLocator.locate(
+            I, luminosity_threshold=self.extractor_kwargs.get('luminosity_threshold', 0.8),
+            downsample=self.extractor_kwargs.get('mask_downsample', 1))
+
+    def fit_target_percentile(self, target, tissue_mask=None):
+        """
+        Fit the target concentration percentile given the target stain matrix.
+
+        :param target: Image RGB uint8.
+        :param tissue_mask: Optional precomputed TissueMask of the target (used if background is set).
         :return:
         """
-        self.stain_matrix_target = self.extractor.get_stain_matrix(target)
-        self.target_concentrations = get_concentrations(target, self.stain_matrix_target)
-        self.maxC_target = np.percentile(self.target_concentrations, 99, axis=0).reshape((1, 2))
+        if self.background is not None:
+            # The percentile is taken over the tissue, as it is for the source images.
+            if tissue_mask is None:
+                tissue_mask = self.locate_tissue(target)
+            target = target[TissueMask.get_mask(target, tissue_mask)]
+        # Only the percentile of the target concentrations is needed after fitting.
+        target_concentrations = get_concentrations(target, self.stain_matrix_target, solver=self.solver)
+        with stage('percentile', pixels=target_concentrations.shape[0]):
+            self.maxC_target = percentile(target_concentrations, 99, axis=0, exact=self.exact).reshape((1, 2))
         self.stain_matrix_target_RGB = convert_OD_to_RGB(self.stain_matrix_target)  # useful to visualize.
 
-    def transform(self, I):
+    def partial_fit(self, target, reservoir_size=100000, random_state=0):
+        """
+        Accumulate the statistics of one image of a target cohort. Call finalize once all images are seen.
+
+        The OD covariance of the tissue (used by Macenko) is accumulated exactly. The angular percentiles (Macenko),
+        the dictionary learning (Vahadane) and the concentration percentile are computed by finalize on fixed size
+        random samples of the tissue pixels and of all pixels, so memory use does not grow with the cohort.
+
+        :param target: Image RGB uint8.
+        :param reservoir_size: Number of pixels kept in each random sample (used by the first call).
+        :param random_state: Seed for the random samples (used by the first call).
+        :return:
+        """
+        assert is_uint8_image(target), "Image should be RGB uint8."
+        if self.stream_statistics is None:
+            self.stream_statistics = {'covariance': RunningCovariance(3),
+                                      'tissue': ReservoirSampler(reservoir_size, random_state),
+                                      'pixels': ReservoirSampler(reservoir_size, random_state + 1)}
+        pixels = target.reshape((-1, 3))
+        self.stream_statistics['pixels'].update(pixels)
+        luminosity_threshold = self.extractor_kwargs.get('luminosity_threshold', 0.8)
+        mask_downsample = self.extractor_kwargs.get('mask_downsample', 1)
+        try:
+            tissue_mask = LuminosityThresholdTissueLocator.get_tissue_mask(
+                target, luminosity_threshold=luminosity_threshold, downsample=mask_downsample).reshape((-1,))
+        except TissueMaskException:
+            return  # No tissue in this image.
+        tissue = pixels[tissue_mask]
+        self.stream_statistics['covariance'].update(convert_RGB_to_OD(tissue))
+        self.stream_statistics['tissue'].update(tissue)
+
+    def fit_stream(self, targets, reservoir_size=100000, random_state=0):
+        """
+        Fit to a cohort of target images, seen one at a time.
+
+        :param targets: Iterable of images RGB uint8.
+        :param reservoir_size: Number of pixels kept in each random sample (see partial_fit).
+        :param random_state: Seed for the random samples.
+        :return:
+        """
+        for target in targets:
+            self.partial_fit(target, reservoir_size=reservoir_size, random_state=random_state)
+        self.finalize()
+
+    def finalize(self):
+        """
+        Finish fitting from the statistics accumulated by partial_fit.
+
+        :return:
+        """
+        assert self.stream_statistics is not None, "Call partial_fit first."
+        statistics = self.stream_statistics
+        if statistics['tissue'].n_seen == 0:
+            raise TissueMaskException("Empty tissue mask computed")
+        # Neighbouring pixels of the samples are unrelated, so their tissue mask is not downsampled.
+        extractor_kwargs = dict(self.extractor_kwargs, mask_downsample=1)
+        if self.extractor is MacenkoStainExtractor:
+            extractor_kwargs['covariance'] = statistics['covariance'].covariance
+        # The samples are used as N x 1 x 3 images.
+        tissue = statistics['tissue'].get_sample()[:, None, :]
+        self.stain_matrix_target = self.extractor.get_stain_matrix(tissue, **extractor_kwargs)
+        if self.background is None:
+            self.fit_target_percentile(statistics['pixels'].get_sample()[:, None, :])
+        else:
+            self.fit_target_percentile(tissue, np.ones(tissue.shape[:2], dtype=bool))
+        self.stream_statistics = None
+
+    def save(self, path):
+        """
+        Save the fitted state to a .npz file.
+
+        :param path: Path or file object.
+        :return:
+        """
+        arrays = {'stain_matrix_target': self.stain_matrix_target, 'maxC_target': self.maxC_target}
+        if getattr(self.extractor, 'dictionary', None) is not None:
+            arrays['warm_start_dictionary'] = self.extractor.dictionary  # The last estimate of vahadane_warm.
+        save_state(path, 'StainNormalizer', self.get_params(), arrays)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a fitted normalizer saved with save.
+
+        :param path: Path or file object.
+        :return: Fitted StainNormalizer.
+        """
+        params, arrays = load_state(path, 'StainNormalizer')
+        normalizer = cls(**params)
+        normalizer.stain_matrix_target = arrays['stain_matrix_target']
+        normalizer.maxC_target = arrays['maxC_target']
+        if 'warm_start_dictionary' in arrays:
+            normalizer.extractor.dictionary = arrays['warm_start_dictionary']
+        normalizer.stain_matrix_target_RGB = convert_OD_to_RGB(normalizer.stain_matrix_target)
+        return normalizer
+
+    def get_source_stain_matrix(self, I, tissue_mask=None, slide_id=None):
+        """
+        Get the stain matrix of a source image, from the cache if there is one.
+
+        :param I: Image RGB uint8.
+        :param tissue_mask: Optional precomputed TissueMask of I.
+        :param slide_id: Optional ID of the slide I belongs to, used as the cache key instead of the image content.
+        :return: Stain matrix.
+        """
+        if self.cache is None:
+            return self.extractor.get_stain_matrix(I, tissue_mask=tissue_mask, **self.extractor_kwargs)
+        return self.cache.get_stain_matrix(self.extractor, I, slide_id=slide_id, tissue_mask=tissue_mask,
+                                           **self.extractor_kwargs)
+
+    def get_estimation_image(self, I, estimation_image=None):
+        """
+        Get the image the source stain matrix and percentile are estimated from, if not I itself.
+
+        :param I: Image RGB uint8.
+        :param estimation_image: Optional low resolution version of I (e.g. a slide thumbnail).
+        :return: estimation_image, or I downscaled by estimation_scale, or None to estimate from I.
+        """
+        if estimation_image is not None:
+            return estimation_image
+        if self.estimation_scale == 1:
+            return None
+        return downscale_image(I, self.estimation_scale)
+
+    def get_source_percentile(self, I, stain_matrix_source):
+        """
+        Get the source concentration percentile of an image (over the tissue if background is set).
+
+        :param I: Image RGB uint8.
+        :param stain_matrix_source: Source stain matrix.
+        :return: Array 1 x n_stains.
+        """
+        if self.background is not None:
+            I = I[TissueMask.get_mask(I, self.locate_tissue(I))]
+        source_concentrations = get_concentrations(I, stain_matrix_source, solver=self.solver)
+        with stage('percentile', pixels=source_concentrations.shape[0]):
+            return percentile(source_concentrations, 99, axis=0, exact=self.exact).reshape((1, 2))
+
+    def transform(self, I, out=None, tissue_mask=None, slide_id=None, estimation_image=None):
         """
         Transform an image.
 
         :param I: Image RGB uint8.
+        :param out: Optional preallocated uint8 array of the same shape as I to write into.
+        :param tissue_mask: Optional precomputed TissueMask of I.
+        :param slide_id: Optional ID of the slide I belongs to (see get_source_stain_matrix).
+        :param estimation_image: Optional low resolution version of I (e.g. a slide thumbnail or pyramid level) to
+            estimate the source stain matrix and percentile from (see estimation_scale).
         :return:
         """
-        stain_matrix_source = self.extractor.get_stain_matrix(I)
-        source_concentrations = get_concentrations(I, stain_matrix_source)
-        maxC_source = np.percentile(source_concentrations, 99, axis=0).reshape((1, 2))
-        source_concentrations *= (self.maxC_target / maxC_source)
-        tmp = 255 * np.exp(-1 * np.dot(source_concentrations, self.stain_matrix_target))
-        return tmp.reshape(I.shape).astype(np.uint8)
+        if self.background is not None and tissue_mask is None:
+            tissue_mask = self.locate_tissue(I)
+        if out is None:
+            out = np.empty(I.shape, dtype=np.uint8)
+        estimation_image = self.get_estimation_image(I, estimation_image)
+        if estimation_image is None:
+            stain_matrix_source = self.get_source_stain_matrix(I, tissue_mask, slide_id)
+            maxC_source = None
+        else:
+            stain_matrix_source = self.get_source_stain_matrix(estimation_image, slide_id=slide_id)
+            maxC_source = self.get_source_percentile(estimation_image, stain_matrix_source)
+        if self.background is not None:
+            tissue_mask = TissueMask.get_mask(I, tissue_mask)
+        return self.transform_source(I, stain_matrix_source, out, maxC_source, tissue_mask)
+
+    def transform_source(self, I, stain_matrix_source, out, maxC_source=None, tissue_mask=None):
+        """
+        Transform an image given its source stain matrix.
+
+        :param I: Image RGB uint8.
+        :param stain_matrix_source: Source stain matrix.
+        :param out: Array of the shape of I to write into.
+        :param maxC_source: Source concentration percentile, computed from the concentrations of I if None.
+        :param tissue_mask: Boolean array H x W (used if background is set, see transform_tissue).
+        :return: out.
+        """
+        if self.background is not None:
+            return self.transform_tissue(I, stain_matrix_source, tissue_mask, out, maxC_source)
+        source_concentrations = get_concentrations(I, stain_matrix_source, solver=self.solver)
+        if maxC_source is None:
+            with stage('percentile', pixels=source_concentrations.shape[0]):
+                maxC_source = percentile(source_concentrations, 99, axis=0, exact=self.exact).reshape((1, 2))
+        with stage('reconstruction', pixels=source_concentrations.shape[0]):
+            reconstruct_RGB(source_concentrations, self.get_scaled_stain_matrix(maxC_source), out=out)
+        return out
+
+    def transform_tissue(self, I, stain_matrix_source, tissue_mask, out, maxC_source=None):
+        """
+        Transform the tissue pixels of an image only, so the cost scales with the tissue area.
+        The background pixels are copied from I or set to white.
+
+        :param I: Image RGB uint8.
+        :param stain_matrix_source: Source stain matrix.
+        :param tissue_mask: Boolean array H x W.
+        :param out: Array of the shape of I to write into.
+        :param maxC_source: Source concentration percentile, computed from the tissue of I if None.
+        :return: out.
+        """
+        background = ~tissue_mask
+        out[background] = I[background] if self.background == 'copy' else 255
+        if not tissue_mask.any():
+            return out
+        source_concentrations = get_concentrations(I[tissue_mask], stain_matrix_source, solver=self.solver)
+        if maxC_source is None:
+            with stage('percentile', pixels=source_concentrations.shape[0]):
+                maxC_source = percentile(source_concentrations, 99, axis=0, exact=self.exact).reshape((1, 2))
+        with stage('reconstruction', pixels=source_concentrations.shape[0]):
+            out[tissue_mask] = reconstruct_RGB(source_concentrations, self.get_scaled_stain_matrix(maxC_source))
+        return out
+
+    def get_scaled_stain_matrix(self, maxC_source):
+        """
+        Get the target stain matrix with the concentration scaling maxC_target / maxC_source folded in,
+        as (C * scale).W = C.(scale W), so the source concentrations are not modified.
+
+        :param maxC_source: Source concentration percentiles 1 x n_stains.
+        :return: Array n_stains x 3.
+        """
+        return (self.maxC_target / maxC_source).reshape((-1, 1)) * self.stain_matrix_target
+
+    def transform_batch(self, images, shared_stain_matrix=False, out=None, slide_id=None):
+        """
+        Transform a batch of images of the same shape.
+
+        The concentration percentiles of all images are computed in one pass and the result is written into a
+        single preallocated stack. If shared_stain_matrix is True one source stain matrix is estimated for the whole
+        batch (appropriate for tiles from the same slide) and the concentrations are solved in one call.
+        With the 'numpy' solver the concentrations of the whole batch are solved in one call in either case.
+
+        :param images: List of images RGB uint8 or an array N x H x W x 3.
+        :param shared_stain_matrix: Estimate a single source stain matrix for the batch?
+        :param out: Optional preallocated uint8 array N x H x W x 3 to write into.
+        :param slide_id: Optional ID of the slide the images belong to (see get_source_stain_matrix).
+        :return: Array N x H x W x 3 uint8.
+        """
+        images = np.asarray(images)
+        assert images.ndim == 4 and images.dtype == np.uint8, "Images should be a stack of RGB uint8 images."
+        n_images, h, w, c = images.shape
+        if self.background is not None or self.estimation_scale != 1:
+            return self.transform_batch_separately(images, shared_stain_matrix, out, slide_id)
+        if shared_stain_matrix:
+            # Treat the stack as one tall image.
+            stacked = images.reshape((n_images * h, w, c))
+            stain_matrix_source = self.get_source_stain_matrix(stacked, slide_id=slide_id)
+            source_concentrations = get_concentrations(stacked, stain_matrix_source, solver=self.solver)
+            source_concentrations = source_concentrations.reshape((n_images, h * w, -1))
+        elif self.solver == 'numpy':
+            stain_matrices = [self.get_source_stain_matrix(I, slide_id=slide_id) for I in images]
+            OD = convert_RGB_to_OD(images).reshape((n_images, -1, 3))
+            with stage('concentrations', pixels=n_images * h * w):
+                source_concentrations = nonnegative_lasso(OD, np.stack(stain_matrices))
+        else:
+            source_concentrations = np.empty((n_images, h * w, self.stain_matrix_target.shape[0]),
+                                             dtype=get_default_dtype())
+            for i in range(n_images):
+                stain_matrix_source = self.get_source_stain_matrix(images[i], slide_id=slide_id)
+                source_concentrations[i] = get_concentrations(images[i], stain_matrix_source, solver=self.solver)
+        with stage('percentile', pixels=n_images * h * w):
+            maxC_source = percentile(source_concentrations, 99, axis=1, exact=self.exact)[:, None, :]
+        with stage('reconstruction', pixels=n_images * h * w):
+            if out is None:
+                out = np.empty(images.shape, dtype=np.uint8)
+            for i in range(n_images):
+                reconstruct_RGB(source_concentrations[i], self.get_scaled_stain_matrix(maxC_source[i]), out=out[i])
+        return out
+
+    def transform_batch_separately(self, images, shared_stain_matrix, out, slide_id=None):
+        """
+        Transform a batch of images one by one (see transform_batch), with a background mode or an estimation scale.
+        With a shared stain matrix and a background mode, images without tissue only get their background copied or
+        set to white.
+
+        :param images: Array N x H x W x 3 uint8.
+        :param shared_stain_matrix: Estimate a single source stain matrix for the batch?
+        :param out: Optional preallocated uint8 array N x H x W x 3 to write into.
+        :param slide_id: Optional ID of the slide the images belong to (see get_source_stain_matrix).
+        :return: Array N x H x W x 3 uint8.
+        """
+        n_images, h, w, c = images.shape
+        if out is None:
+            out = np.empty(images.shape, dtype=np.uint8)
+        if not shared_stain_matrix:
+            for i in range(n_images):
+                self.transform(images[i], out=out[i], slide_id=slide_id)
+            return out
+
+        stacked = images.reshape((n_images * h, w, c))
+        tissue_mask = None
+        tissue_masks = [None] * n_images
+        if self.background is not None:
+            tissue_mask = self.locate_tissue(stacked)
+            tissue_masks = tissue_mask.mask.reshape((n_images, h, w))
+        estimation_image = self.get_estimation_image(stacked)
+        if estimation_image is None:
+            stain_matrix_source = self.get_source_stain_matrix(stacked, tissue_mask, slide_id)
+        else:
+            stain_matrix_source = self.get_source_stain_matrix(estimation_image, slide_id=slide_id)
+        for i in range(n_images):
+            maxC_source = None
+            if estimation_image is not None and (tissue_masks[i] is None or tissue_masks[i].any()):
+                try:
+                    maxC_source = self.get_source_percentile(self.get_estimation_image(images[i]),
+                                                             stain_matrix_source)
+                except TissueMaskException:
+                    pass  # No tissue at the low resolution, the percentile is taken at full resolution.
+            self.transform_source(images[i], stain_matrix_source, out[i], maxC_source, tissue_masks[i])
+        return out
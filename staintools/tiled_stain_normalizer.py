@@ -0,0 +1,160 @@
+import numpy as np
+
+from staintools.tissue_masks.luminosity_threshold_tissue_locator import LuminosityThresholdTissueLocator
+from staintools.utils.exceptions import TissueMaskException
+from staintools.utils.get_concentrations import get_concentrations
+from staintools.utils.profiling import stage
+from staintools.utils.quantiles import percentile
+from staintools.utils.reconstruction import reconstruct_RGB
+
+# Rough upper bound on the working memory needed per pixel of a tile (uint8 copy, float64 OD,
+# concentrations, reconstruction temporaries).
+BYTES_PER_PIXEL = 128
+
+
+class TiledStainNormalizer(object):
+    """
+    Stain normalize a large (e.g. whole slide) image tile by tile.
+
+    The source may be any array-like of shape H x W x 3 that supports numpy style slicing (a numpy array,
+    np.memmap, zarr or h5py dataset...). A single slide level source stain matrix and concentration percentile
+    are estimated from a random sample of tiles on every call to transform (unless given, e.g. to reuse those of
+    another slide). Every tile is then normalized with these same parameters so there are no seams between tiles.
+    If the normalizer has a background mode (see StainNormalizer) only the tissue pixels of each tile are
+    transformed.
+    """
+
+    def __init__(self, normalizer, tile_size=None, memory_budget=256 * 2 ** 20, n_sample_tiles=32, random_state=0):
+        """
+        :param normalizer: A StainNormalizer fitted to a target image.
+        :param tile_size: Side of the (square) tiles. If None it is derived from memory_budget.
+        :param memory_budget: Approximate cap on the working memory in bytes.
+        :param n_sample_tiles: Number of tiles sampled to estimate the slide level source parameters.
+        :param random_state: Seed for the tile sampling.
+        """
+        assert hasattr(normalizer, 'stain_matrix_target'), "Normalizer should be fitted."
+        max_pixels = memory_budget // BYTES_PER_PIXEL
+        if tile_size is None:
+            tile_size = int(np.sqrt(max_pixels))
+        assert tile_size > 0, "Memory budget too small."
+        assert tile_size ** 2 <= max_pixels, "Tile size exceeds the memory budget."
+        self.normalizer = normalizer
+        self.tile_size = tile_size
+        self.memory_budget = memory_budget
+        self.n_sample_tiles = n_sample_tiles
+        self.random_state = random_state
+        self.stain_matrix_source = None
+        self.maxC_source = None
+
+    def get_tiles(self, shape):
+        """
+        Get the (row, column) slices of the tiles covering an image.
+
+        :param shape: Image shape.
+        :return: List of (row slice, column slice).
+        """
+        h, w = shape[:2]
+        t = self.tile_size
+        return [(slice(y, min(y + t, h)), slice(x, min(x + t, w))) for y in range(0, h, t) for x in range(0, w, t)]
+
+    def fit_source(self, slide, stain_matrix_source=None):
+        """
+        Estimate the slide level source stain matrix and concentration percentile from a sample of tiles.
+
+        :param slide: Array-like H x W x 3 RGB uint8.
+        :param stain_matrix_source: Optional known source stain matrix (only the percentile is then estimated).
+        :return:
+        """
+        rng = np.random.RandomState(self.random_state)
+        tiles = self.get_tiles(slide.shape)
+        n_tiles = min(self.n_sample_tiles, len(tiles))
+        chosen = rng.choice(len(tiles), n_tiles, replace=False)
+
+        # Keep the sample within the memory budget.
+        pixels_per_tile = (self.memory_budget // BYTES_PER_PIXEL) // n_tiles
+        samples = []
+        for i in sorted(chosen):
+            rows, cols = tiles[i]
+            tile = np.array(slide[rows, cols], dtype=np.uint8).reshape((-1, 3))
+            if tile.shape[0] > pixels_per_tile:
+                tile = tile[rng.choice(tile.shape[0], pixels_per_tile, replace=False)]
+            samples.append(tile)
+        sample = np.concatenate(samples)[:, None, :]  # A N x 1 x 3 image.
+
+        extractor = self.normalizer.extractor
+        # Neighbouring pixels of the sample are unrelated, so its tissue mask is not downsampled.
+        extractor_kwargs = dict(self.normalizer.extractor_kwargs, mask_downsample=1)
+        tissue_mask = None
+        if self.normalizer.background is not None:
+            tissue_mask = LuminosityThresholdTissueLocator.locate(
+                sample, luminosity_threshold=extractor_kwargs.get('luminosity_threshold', 0.8))
+            extractor_kwargs['tissue_mask'] = tissue_mask
+        if stain_matrix_source is None:
+            stain_matrix_source = extractor.get_stain_matrix(sample, **extractor_kwargs)
+        self.stain_matrix_source = stain_matrix_source
+        if tissue_mask is not None:
+            sample = sample[tissue_mask.mask]  # The percentile is taken over the tissue.
+        sample_concentrations = get_concentrations(sample, self.stain_matrix_source, solver=self.normalizer.solver)
+        with stage('percentile', pixels=sample_concentrations.shape[0]):
+            self.maxC_source = percentile(sample_concentrations, 99, axis=0, exact=self.normalizer.exact)
+            self.maxC_source = self.maxC_source.reshape((1, -1))
+
+    def transform(self, slide, out=None, stain_matrix_source=None, maxC_source=None):
+        """
+        Stain normalize a slide tile by tile.
+
+        The source parameters are estimated from the slide unless given. They are deliberately not cached across
+        calls: every slide has its own staining, so reusing those of a previous slide would normalize it wrongly,
+        and a cache keyed by the content would have to read the whole slide to hash it. The estimate only reads
+        n_sample_tiles tiles. To normalize several slides (e.g. serial sections stained together) with the
+        parameters of the first one, pass stain_matrix_source=tiled.stain_matrix_source and
+        maxC_source=tiled.maxC_source.
+
+        :param slide: Array-like H x W x 3 RGB uint8.
+        :param out: Optional writable array-like H x W x 3 uint8 (e.g. np.memmap) to write into.
+        :param stain_matrix_source: Optional source stain matrix.
+        :param maxC_source: Optional source concentration percentile 1 x n_stains (estimated from the slide if None).
+        :return: The normalized slide.
+        """
+        assert len(slide.shape) == 3 and slide.shape[2] == 3, "Slide should be H x W x 3."
+        assert maxC_source is None or stain_matrix_source is not None, "Give the source stain matrix with maxC_source."
+        if maxC_source is None:
+            self.fit_source(slide, stain_matrix_source)
+        else:
+            self.stain_matrix_source = stain_matrix_source
+            self.maxC_source = np.asarray(maxC_source).reshape((1, -1))
+        if out is None:
+            out = np.empty(slide.shape, dtype=np.uint8)
+        assert tuple(out.shape) == tuple(slide.shape), "Output should have the same shape as the slide."
+
+        stain_matrix_target = self.normalizer.get_scaled_stain_matrix(self.maxC_source)
+        for rows, cols in self.get_tiles(slide.shape):
+            tile = np.array(slide[rows, cols], dtype=np.uint8)
+            if self.normalizer.background is not None:
+                out[rows, cols] = self.transform_tissue(tile, stain_matrix_target)
+                continue
+            concentrations = get_concentrations(tile, self.stain_matrix_source, solver=self.normalizer.solver)
+            with stage('reconstruction', pixels=concentrations.shape[0]):
+                out[rows, cols] = reconstruct_RGB(concentrations, stain_matrix_target, out=tile)
+        return out
+
+    def transform_tissue(self, tile, stain_matrix_target):
+        """
+        Transform the tissue pixels of a tile only, in place. The background is copied or set to white.
+
+        :param tile: Tile RGB uint8.
+        :param stain_matrix_target: Target stain matrix scaled for the slide.
+        :return: The tile.
+        """
+        try:
+            tissue_mask = self.normalizer.locate_tissue(tile).mask
+        except TissueMaskException:
+            tissue_mask = np.zeros(tile.shape[:2], dtype=bool)
+        if self.normalizer.background == 'white':
+            tile[~tissue_mask] = 255
+        if tissue_mask.any():
+            concentrations = get_concentrations(tile[tissue_mask], self.stain_matrix_source,
+                                                solver=self.normalizer.solver)
+            with stage('reconstruction', pixels=concentrations.shape[0]):
+                tile[tissue_mask] = reconstruct_RGB(concentrations, stain_matrix_target)
+        return tile
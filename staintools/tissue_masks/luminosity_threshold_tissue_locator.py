@@ -1,29 +1,83 @@
+import numpy as np
 import cv2 as cv
 
 from staintools.tissue_masks.abc_tissue_locator import ABCTissueLocator
+from staintools.tissue_masks.tissue_mask import TissueMask
 from staintools.utils.exceptions import TissueMaskException
+from staintools.utils.profiling import stage
 from staintools.preprocessing.input_validation import is_uint8_image
 
+# Relative luminance Y of each uint8 sRGB value (sRGB gamma expansion times the D65 Y weights, as OpenCV's RGB2LAB).
+_c = np.arange(256) / 255.0
+_linear = np.where(_c <= 0.04045, _c / 12.92, ((_c + 0.055) / 1.055) ** 2.4)
+LUMINANCE_LOOKUP_TABLE = (_linear[:, None] * np.array([0.212671, 0.715160, 0.072169])).reshape((256, 1, 3))
+LUMINANCE_LOOKUP_TABLE = LUMINANCE_LOOKUP_TABLE.astype(np.float32)
+
+# Number of pixels converted at once (the float32 temporaries of a block fit in L2 cache).
+BLOCK_SIZE = 2 ** 15
+
 
 class LuminosityThresholdTissueLocator(ABCTissueLocator):
 
     @staticmethod
-    def get_tissue_mask(I, luminosity_threshold=0.8):
+    def get_tissue_mask(I, luminosity_threshold=0.8, downsample=1):
         """
         Get a binary mask where true denotes pixels with a luminosity less than the specified threshold.
         Typically we use to identify tissue in the image and exclude the bright white background.
 
         :param I: RGB uint 8 image.
         :param luminosity_threshold: Luminosity threshold.
+        :param downsample: Compute the mask on every downsample-th pixel of every downsample-th row and upsample it.
         :return: Binary mask.
         """
+        return LuminosityThresholdTissueLocator.locate(I, luminosity_threshold, downsample).mask
+
+    @staticmethod
+    def locate(I, luminosity_threshold=0.8, downsample=1):
+        """
+        Get the tissue mask as a TissueMask, to be computed once and passed on (e.g. as the tissue_mask argument of
+        the stain extractors).
+
+        The luminosity (LAB lightness) is not computed. Lightness is a monotonic function of the relative luminance Y,
+        so the threshold is converted to one on Y, which is computed with a lookup table straight from RGB.
+
+        :param I: RGB uint 8 image.
+        :param luminosity_threshold: Luminosity threshold.
+        :param downsample: Compute the mask on every downsample-th pixel of every downsample-th row and upsample it.
+        :return: TissueMask.
+        """
         assert is_uint8_image(I), "Image should be RGB uint8."
-        I_LAB = cv.cvtColor(I, cv.COLOR_RGB2LAB)
-        L = I_LAB[:, :, 0] / 255.0  # Convert to range [0,1].
-        mask = L < luminosity_threshold
+        h, w = I.shape[:2]
+        with stage('tissue_mask', pixels=h * w):
+            sample = I[::downsample, ::downsample]
+            Y_threshold = LuminosityThresholdTissueLocator.get_luminance_threshold(luminosity_threshold)
+            mask = np.empty(sample.shape[:2], dtype=bool)
+            rows = max(BLOCK_SIZE // sample.shape[1], 1)
+            for start in range(0, sample.shape[0], rows):
+                block = np.ascontiguousarray(sample[start:start + rows])
+                Y = cv.transform(cv.LUT(block, LUMINANCE_LOOKUP_TABLE), np.ones((1, 3), dtype=np.float32))
+                np.less(Y, Y_threshold, out=mask[start:start + rows])
+            if downsample > 1:
+                mask = np.repeat(np.repeat(mask, downsample, axis=0), downsample, axis=1)[:h, :w]
 
         # Check it's not empty
-        if mask.sum() == 0:
+        if not mask.any():
             raise TissueMaskException("Empty tissue mask computed")
 
-        return mask
\ No newline at end of file
+        return TissueMask(mask, luminosity_threshold=luminosity_threshold, downsample=downsample)
+
+    @staticmethod
+    def get_luminance_threshold(luminosity_threshold):
+        """
+        Get the relative luminance Y below which the uint8 LAB lightness L (as from OpenCV) satisfies
+        L / 255 < luminosity_threshold.
+
+        :param luminosity_threshold: Luminosity threshold.
+        :return: Luminance threshold.
+        """
+        # Largest uint8 lightness in the mask, and the lightness (in [0, 100]) that rounds up past it.
+        L = (np.ceil(255 * luminosity_threshold) - 0.5) * 100 / 255
+        t = (L + 16) / 116
+        if t > 6 / 29:
+            return t ** 3
+        return 3 * (6 / 29) ** 2 * (t - 4 / 29)
@@ -0,0 +1,47 @@
+import numpy as np
+
+from staintools.utils.exceptions import TissueMaskException
+
+
+class TissueMask(object):
+    """
+    A boolean tissue mask of an image, computed once and passed to every stage that needs it
+    (stain matrix estimation, augmentation...) instead of being recomputed by each of them.
+    """
+
+    def __init__(self, mask, luminosity_threshold=None, downsample=1):
+        """
+        :param mask: Boolean array H x W.
+        :param luminosity_threshold: Threshold the mask was computed with (for reference).
+        :param downsample: Downsampling factor the mask was computed at (for reference).
+        """
+        self.mask = mask
+        self.luminosity_threshold = luminosity_threshold
+        self.downsample = downsample
+
+    @property
+    def shape(self):
+        return self.mask.shape
+
+    def ravel(self):
+        """
+        :return: The flattened boolean mask.
+        """
+        return self.mask.ravel()
+
+    @staticmethod
+    def get_mask(I, tissue_mask):
+        """
+        Get the boolean mask array of an image from a TissueMask or a boolean array.
+
+        :param I: Image RGB uint8.
+        :param tissue_mask: TissueMask or boolean array H x W.
+        :return: Boolean array H x W.
+        """
+        if isinstance(tissue_mask, TissueMask):
+            tissue_mask = tissue_mask.mask
+        tissue_mask = np.asarray(tissue_mask, dtype=bool)
+        assert tissue_mask.shape == I.shape[:2], "Tissue mask should have the shape of the image."
+        if not tissue_mask.any():
+            raise TissueMaskException("Empty tissue mask computed")
+        return tissue_mask
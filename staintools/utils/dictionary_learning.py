@@ -0,0 +1,87 @@
+import numpy as np
+
+from staintools.utils.get_concentrations import nonnegative_lasso
+
+# Number of rows considered when choosing the initial dictionary.
+INIT_SAMPLE_SIZE = 10000
+
+
+def nonnegative_dictionary_learning(X, n_components=2, regularizer=0.1, init_dictionary=None, n_iter=100, tol=1e-4,
+                                    batch_size=None, random_state=0):
+    """
+    Learn a non-negative dictionary D with non-negative sparse codes C,
+    min 0.5 * ||X - C.D||^2 + regularizer * sum(C) subject to C >= 0, D >= 0 and rows of D of norm at most 1
+    (the problem spams.trainDL solves with mode=2, posAlpha=True, posD=True and modeD=0).
+
+    Alternates the exact sparse coding of nonnegative_lasso with a block coordinate descent update of the
+    dictionary (J. Mairal et al. 'Online Learning for Matrix Factorization and Sparse Coding'). With batch_size,
+    each iteration uses a new random batch of rows (mini-batch learning), otherwise all the rows.
+
+    :param X: Data N x n_features (e.g. optical densities N x 3).
+    :param n_components: Number of dictionary rows (e.g. stains).
+    :param regularizer: Sparsity regularization of the codes.
+    :param init_dictionary: Optional initial dictionary n_components x n_features (warm start).
+    :param n_iter: Maximum number of iterations.
+    :param tol: Stop once no dictionary entry changes by more than tol in an iteration (None to run n_iter).
+        With mini-batches the changes are noisy so set tol above the noise, or rely on n_iter.
+    :param batch_size: Number of rows per iteration (None for all).
+    :param random_state: Seed for the initialization and the batches.
+    :return: Dictionary n_components x n_features and the number of iterations run.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    rng = np.random.default_rng(random_state)
+    if init_dictionary is None:
+        dictionary = _init_dictionary(X, n_components, rng)
+    else:
+        dictionary = _project_rows(np.array(init_dictionary, dtype=np.float64))
+    assert dictionary.shape == (n_components, X.shape[1]), "Initial dictionary should be n_components x n_features."
+
+    iteration = 0
+    for iteration in range(1, n_iter + 1):
+        batch = X if batch_size is None else X[rng.integers(0, X.shape[0], batch_size)]
+        C = nonnegative_lasso(batch, dictionary, regularizer)
+        updated = _update_dictionary(dictionary, np.dot(C.T, C), np.dot(C.T, batch))
+        change = np.abs(updated - dictionary).max()
+        dictionary = updated
+        if tol is not None and change < tol:
+            break
+    return dictionary, iteration
+
+
+def _update_dictionary(dictionary, A, B):
+    """
+    One pass of block coordinate descent on the dictionary rows given the statistics A = C^T.C and B = C^T.X.
+    """
+    dictionary = dictionary.copy()
+    for k in range(dictionary.shape[0]):
+        if A[k, k] < 1e-12:
+            continue  # Unused row.
+        row = dictionary[k] + (B[k] - np.dot(A[k], dictionary)) / A[k, k]
+        dictionary[k] = _project_rows(row[None, :])[0]
+    return dictionary
+
+
+def _project_rows(D):
+    """
+    Project rows on the non-negative part of the unit ball.
+    """
+    D = np.maximum(D, 0)
+    return D / np.maximum(np.linalg.norm(D, axis=1), 1)[:, None]
+
+
+def _init_dictionary(X, n_components, rng):
+    """
+    Farthest point initialization: start from the row least similar (in angle) to a random row and repeatedly add
+    the row least similar to those chosen so far, so the initial rows span the data.
+    """
+    norms = np.linalg.norm(X, axis=1)
+    candidates = X[norms > 0] / norms[norms > 0, None]
+    assert candidates.shape[0] > 0, "No non-zero data."
+    if candidates.shape[0] > INIT_SAMPLE_SIZE:
+        candidates = candidates[rng.choice(candidates.shape[0], INIT_SAMPLE_SIZE, replace=False)]
+    start = candidates[rng.integers(candidates.shape[0])]
+    chosen = [candidates[np.argmin(np.dot(candidates, start))]]
+    for _ in range(1, n_components):
+        similarity = np.max(np.dot(candidates, np.array(chosen).T), axis=1)
+        chosen.append(candidates[np.argmin(similarity)])
+    return np.array(chosen)
@@ -5,3 +5,11 @@ Exceptions
 
 class TissueMaskException(Exception):
     pass
+
+
+class ImageReadException(Exception):
+    pass
+
+
+class ImageWriteException(Exception):
+    pass
@@ -0,0 +1,65 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from staintools.utils.serialization import split_array_params
+
+
+class FitCache(object):
+    """
+    On-disk cache of fitted transformers.
+
+    Entries are keyed by a hash of the target image and the transformer parameters so that many workers
+    can share one fit instead of each refitting the same target.
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: Directory for the cached .npz files.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+
+    def get_key(self, transformer, target):
+        """
+        Get the cache key of a transformer fitted to a target image.
+
+        :param transformer: StainNormalizer, StainAugmentor or ReinhardColorNormalizer.
+        :param target: Image RGB uint8.
+        :return: Hex digest.
+        """
+        target = np.ascontiguousarray(target)
+        h = hashlib.sha256()
+        h.update(type(transformer).__name__.encode())
+        params, param_arrays = split_array_params(transformer.get_params())
+        h.update(json.dumps(params, sort_keys=True).encode())
+        for key in sorted(param_arrays):
+            value = np.ascontiguousarray(param_arrays[key])
+            h.update(key.encode())
+            h.update(str((value.shape, value.dtype.str)).encode())
+            h.update(value.data)
+        h.update(str((target.shape, target.dtype.str)).encode())
+        h.update(target.data)
+        return h.hexdigest()
+
+    def fit(self, transformer, target):
+        """
+        Fit a transformer to a target image, loading the fit from the cache if possible.
+
+        :param transformer: StainNormalizer, StainAugmentor or ReinhardColorNormalizer.
+        :param target: Image RGB uint8.
+        :return: The fitted transformer (a new object on a cache hit).
+        """
+        path = os.path.join(self.directory, self.get_key(transformer, target) + '.npz')
+        if os.path.isfile(path):
+            return type(transformer).load(path)
+        transformer.fit(target)
+        # Write to a temporary file first so concurrent workers never read a partial file.
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            transformer.save(f)
+        os.replace(tmp_path, path)
+        return transformer
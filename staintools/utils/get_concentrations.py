@@ -1,16 +1,67 @@
-import spams
+import itertools
+
+import numpy as np
 
 from staintools.utils.optical_density_conversion import convert_RGB_to_OD
+from staintools.utils.profiling import stage
 
 
-def get_concentrations(I, stain_matrix, regularizer=0.01):
+def get_concentrations(I, stain_matrix, regularizer=0.01, solver='spams', dtype=None):
     """
     Estimate concentration matrix given an image and stain matrix.
 
     :param I:
     :param stain_matrix:
     :param regularizer:
+    :param solver: 'spams' (spams.lasso) or 'numpy' (closed form, no spams dependency).
+    :param dtype: np.float32 or np.float64 (default given by the dtype policy).
     :return:
     """
-    OD = convert_RGB_to_OD(I).reshape((-1, 3))
-    return spams.lasso(X=OD.T, D=stain_matrix.T, mode=2, lambda1=regularizer, pos=True).toarray().T
+    OD = convert_RGB_to_OD(I, dtype=dtype).reshape((-1, 3))
+    stain_matrix = np.asarray(stain_matrix, dtype=OD.dtype)
+    with stage('concentrations', pixels=OD.shape[0]):
+        if solver == 'spams':
+            import spams
+            return spams.lasso(X=OD.T, D=np.asfortranarray(stain_matrix.T), mode=2, lambda1=regularizer,
+                               pos=True).toarray().T
+        elif solver == 'numpy':
+            return nonnegative_lasso(OD, stain_matrix, regularizer)
+        else:
+            raise Exception('Solver not recognized.')
+
+
+def nonnegative_lasso(OD, stain_matrix, regularizer=0.01):
+    """
+    Solve min_c 0.5 * ||x - c.W||^2 + regularizer * sum(c) subject to c >= 0, exactly, for every row x of OD.
+
+    The problem is the same as spams.lasso with mode=2 and pos=True. With only a few stains every subset of active
+    stains can be tried: on each subset the optimum is the solution of a small linear system, and the best feasible
+    candidate is the global optimum (the problem is convex).
+    Leading batch dimensions are supported, e.g. OD B x N x 3 with one stain matrix per image B x K x 3.
+
+    :param OD: Optical density array N x 3.
+    :param stain_matrix: Stain matrix W, K x 3.
+    :param regularizer:
+    :return: Concentrations N x K (with the dtype of OD).
+    """
+    stain_matrix = np.asarray(stain_matrix, dtype=OD.dtype)
+    n_stains = stain_matrix.shape[-2]
+    stain_matrix_T = np.swapaxes(stain_matrix, -1, -2)
+    gram = np.matmul(stain_matrix, stain_matrix_T)
+    b = np.matmul(OD, stain_matrix_T) - regularizer
+
+    concentrations = np.zeros(b.shape, dtype=b.dtype)
+    best_value = np.zeros(b.shape[:-1], dtype=b.dtype)  # Objective (up to a constant) of c = 0.
+    for n_active in range(1, n_stains + 1):
+        for active in itertools.combinations(range(n_stains), n_active):
+            active = list(active)
+            # The Gram matrix is symmetric so c = b.G^-1 solves G.c = b.
+            c = np.matmul(b[..., active], np.linalg.inv(gram[..., active, :][..., active]))
+            # At the stationary point 0.5 * c.G.c - b.c = -0.5 * b.c
+            value = -0.5 * np.sum(c * b[..., active], axis=-1)
+            better = np.all(c >= 0, axis=-1) & (value < best_value)
+            candidate = np.zeros(b.shape, dtype=b.dtype)
+            candidate[..., active] = c
+            concentrations = np.where(better[..., None], candidate, concentrations)
+            best_value = np.where(better, value, best_value)
+    return concentrations
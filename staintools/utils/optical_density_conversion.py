@@ -1,18 +1,35 @@
 import numpy as np
 
+from staintools.utils.profiling import stage
+from staintools.utils.dtype_policy import resolve_dtype
 
-def convert_RGB_to_OD(I):
+
+def _make_OD_lookup_table(dtype):
+    values = np.arange(256)
+    values[0] = 1
+    return np.maximum(-1 * np.log(values / 255), 1e-6).astype(dtype)
+
+
+# uint8 images only have 256 possible values per channel so the OD can be looked up.
+OD_LOOKUP_TABLES = {np.dtype(dtype): _make_OD_lookup_table(dtype) for dtype in (np.float32, np.float64)}
+
+
+def convert_RGB_to_OD(I, dtype=None):
     """
     Convert from RGB to optical density (OD_RGB) space.
 
     RGB = 255 * exp(-1*OD_RGB).
+    Zeros are treated as ones. uint8 images are converted with a lookup table. The input is not modified.
 
     :param I: Image RGB uint8.
+    :param dtype: np.float32 or np.float64 (default given by the dtype policy).
     :return: Optical denisty RGB image.
     """
-    mask = (I == 0)
-    I[mask] = 1
-    return np.maximum(-1 * np.log(I / 255), 1e-6)
+    with stage('optical_density', pixels=I.size // 3):
+        if I.dtype == np.uint8:
+            return OD_LOOKUP_TABLES[resolve_dtype(dtype)][I]
+        I = np.maximum(I, 1)
+        return np.maximum(-1 * np.log(I / 255), 1e-6).astype(resolve_dtype(dtype), copy=False)
 
 
 def convert_OD_to_RGB(OD):
@@ -27,9 +44,3 @@ def convert_OD_to_RGB(OD):
     assert OD.min() >= 0, "Negative optical density."
     OD = np.maximum(OD, 1e-6)
     return (255 * np.exp(-1 * OD)).astype(np.uint8)
-
-
-
-
-
-
@@ -0,0 +1,42 @@
+import numpy as np
+
+
+def sample_pixel_indices(mask, max_pixels=None, sample_fraction=None, random_state=0, block_size=None):
+    """
+    Choose a deterministic random subset of the pixels selected by a mask.
+
+    :param mask: Boolean mask H x W.
+    :param max_pixels: Maximum number of pixels to keep.
+    :param sample_fraction: Fraction of the pixels to keep.
+    :param random_state: Seed.
+    :param block_size: If given, sample the same fraction from every block_size x block_size spatial block.
+    :return: Sorted flat indices of the chosen pixels.
+    """
+    indices = np.flatnonzero(mask)
+    n = indices.shape[0]
+    n_sample = n
+    if sample_fraction is not None:
+        n_sample = int(np.ceil(sample_fraction * n))
+    if max_pixels is not None:
+        n_sample = min(n_sample, max_pixels)
+    if n_sample >= n:
+        return indices
+
+    rng = np.random.default_rng(random_state)
+    if block_size is None:
+        return np.sort(indices[rng.choice(n, n_sample, replace=False)])
+
+    # Stratify: shuffle, group by block and keep the first pixels of each block.
+    w = mask.shape[1]
+    n_block_columns = -(-w // block_size)
+    n_block_rows = -(-mask.shape[0] // block_size)
+    blocks = (indices // w // block_size) * n_block_columns + (indices % w) // block_size
+    if n_block_rows * n_block_columns <= 2 ** 16:
+        blocks = blocks.astype(np.uint16)  # Stable sorts of small ints use radix sort.
+    order = rng.permutation(n)
+    order = order[np.argsort(blocks[order], kind='stable')]
+    sorted_blocks = blocks[order]
+    counts = np.bincount(blocks)
+    rank = np.arange(n) - (np.cumsum(counts) - counts)[sorted_blocks]
+    quota = np.round(counts * (n_sample / n))
+    return np.sort(indices[order[rank < quota[sorted_blocks]]])
@@ -0,0 +1,146 @@
+"""
+Opt-in per-stage profiling.
+
+Library code wraps its expensive stages with `stage(name, pixels)`. While no profiler is active this returns a shared
+no-op context manager, so instrumentation costs (almost) nothing. Use `profile()` to record the stages:
+
+    with staintools.profile(track_memory=True) as profiler:
+        normalizer.transform(I)
+    print(profiler.as_dict())
+"""
+import contextlib
+import threading
+import time
+import tracemalloc
+
+_active_profiler = None
+_null_stage = contextlib.nullcontext()
+# The stages open in each thread, innermost last (to carry the memory peaks of nested stages to the outer ones).
+_open_stages = threading.local()
+
+
+class Profiler(object):
+    """
+    Aggregated counters (calls, wall time, bytes allocated, pixels) per stage.
+    """
+
+    def __init__(self, track_memory=False):
+        """
+        :param track_memory: Record the peak bytes allocated in each stage (with tracemalloc, slows things down).
+        """
+        self.track_memory = track_memory
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, n_bytes=0, pixels=0):
+        """
+        Add one call of a stage to the counters.
+
+        :param name: Stage name.
+        :param seconds: Wall time.
+        :param n_bytes: Bytes allocated.
+        :param pixels: Number of pixels processed.
+        :return:
+        """
+        with self._lock:
+            counter = self.counters.setdefault(name, {'calls': 0, 'seconds': 0.0, 'bytes': 0, 'pixels': 0})
+            counter['calls'] += 1
+            counter['seconds'] += seconds
+            counter['bytes'] += n_bytes
+            counter['pixels'] += pixels
+
+    def as_dict(self):
+        """
+        Get the counters.
+
+        :return: Dict stage -> dict of counters.
+        """
+        with self._lock:
+            return {name: dict(counter) for name, counter in self.counters.items()}
+
+    def to_prometheus(self, prefix='staintools'):
+        """
+        Export the counters in the Prometheus text format.
+
+        :param prefix: Metric name prefix.
+        :return: String.
+        """
+        lines = []
+        counters = self.as_dict()
+        for metric, help_text in (('calls', 'Number of calls'), ('seconds', 'Wall time in seconds'),
+                                  ('bytes', 'Peak bytes allocated'), ('pixels', 'Pixels processed')):
+            name = '{}_stage_{}_total'.format(prefix, metric)
+            lines.append('# HELP {} {} per stage.'.format(name, help_text))
+            lines.append('# TYPE {} counter'.format(name))
+            for stage_name, counter in sorted(counters.items()):
+                lines.append('{}{{stage="{}"}} {}'.format(name, stage_name, counter[metric]))
+        return '\n'.join(lines) + '\n'
+
+
+class _Stage(object):
+
+    def __init__(self, profiler, name, pixels):
+        self.profiler = profiler
+        self.name = name
+        self.pixels = pixels
+
+    def __enter__(self):
+        if self.profiler.track_memory:
+            stack = _open_stages.__dict__.setdefault('stack', [])
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                # reset_peak forgets the peak of the enclosing stage so far, keep it there.
+                stack[-1].peak = max(stack[-1].peak, peak)
+            stack.append(self)
+            tracemalloc.reset_peak()
+            self.start_bytes = current
+            self.peak = current
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        n_bytes = 0
+        if self.profiler.track_memory:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            n_bytes = max(self.peak - self.start_bytes, 0)
+            stack = _open_stages.stack
+            stack.pop()
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, self.peak)
+        self.profiler.record(self.name, seconds, n_bytes, self.pixels or 0)
+
+
+def stage(name, pixels=None):
+    """
+    Context manager marking a stage of computation.
+
+    :param name: Stage name.
+    :param pixels: Number of pixels processed.
+    :return: Context manager.
+    """
+    if _active_profiler is None:
+        return _null_stage
+    return _Stage(_active_profiler, name, pixels)
+
+
+@contextlib.contextmanager
+def profile(track_memory=False):
+    """
+    Record the stages run inside the block.
+
+    :param track_memory: Record the peak bytes allocated in each stage (with tracemalloc, slows things down).
+    :return: Context manager yielding the Profiler.
+    """
+    global _active_profiler
+    profiler = Profiler(track_memory=track_memory)
+    previous = _active_profiler
+    start_tracing = track_memory and not tracemalloc.is_tracing()
+    if start_tracing:
+        tracemalloc.start()
+    _active_profiler = profiler
+    try:
+        yield profiler
+    finally:
+        _active_profiler = previous
+        if start_tracing:
+            tracemalloc.stop()
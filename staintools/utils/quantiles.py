@@ -0,0 +1,151 @@
+import numpy as np
+
+# Number of values processed at once by QuantileSketch.update, which bounds its extra memory.
+CHUNK_SIZE = 2 ** 16
+
+
+def histogram_percentile(I, q):
+    """
+    Exact percentile of uint8 data from a histogram (same result as np.percentile with linear interpolation).
+    No sorted or float copy of the data is made.
+
+    :param I: Array uint8.
+    :param q: Percentile or array of percentiles in [0, 100].
+    :return: Percentile(s).
+    """
+    assert I.dtype == np.uint8, "Data should be uint8."
+    cumulative = np.cumsum(np.bincount(I.ravel(), minlength=256))
+    return _interpolate_ranks(np.arange(256, dtype=np.float64), cumulative, q)
+
+
+def _interpolate_ranks(values, cumulative, q):
+    """
+    Linearly interpolated order statistics of binned data.
+
+    :param values: Sorted value of each bin.
+    :param cumulative: Cumulative counts of the bins.
+    :param q: Percentile(s).
+    :return: Percentile(s).
+    """
+    rank = np.asarray(q, dtype=np.float64) / 100 * (cumulative[-1] - 1)
+    lower = np.floor(rank)
+    value_lower = values[np.searchsorted(cumulative, lower, side='right')]
+    value_upper = values[np.searchsorted(cumulative, np.ceil(rank), side='right')]
+    return value_lower + (rank - lower) * (value_upper - value_lower)
+
+
+class QuantileSketch(object):
+    """
+    Mergeable quantile sketch for float data with bounded relative error (in the style of DDSketch).
+
+    Values are counted in logarithmically spaced buckets so any quantile is returned with a relative error of at
+    most relative_accuracy. Values with magnitude below min_value are counted as zero and values beyond max_value
+    are clamped, so the memory used is fixed.
+    """
+
+    def __init__(self, relative_accuracy=0.005, min_value=1e-6, max_value=1e6):
+        """
+        :param relative_accuracy: Bound on the relative error of the quantiles.
+        :param min_value: Smallest magnitude distinguished from zero.
+        :param max_value: Largest magnitude.
+        """
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.max_value = max_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = np.log(self.gamma)
+        self.min_key = int(np.ceil(np.log(min_value) / self.log_gamma))
+        n_buckets = int(np.ceil(np.log(max_value) / self.log_gamma)) - self.min_key + 1
+        self.positive_counts = np.zeros(n_buckets, dtype=np.int64)
+        self.negative_counts = np.zeros(n_buckets, dtype=np.int64)
+        self.zero_count = 0
+
+    @property
+    def count(self):
+        return int(self.positive_counts.sum() + self.negative_counts.sum() + self.zero_count)
+
+    def update(self, x):
+        """
+        Add values to the sketch.
+
+        :param x: Array of values.
+        :return:
+        """
+        x = np.asarray(x)
+        if x.ndim != 1:
+            x = x.reshape(-1)
+        for start in range(0, x.shape[0], CHUNK_SIZE):
+            chunk = x[start:start + CHUNK_SIZE]
+            magnitude = np.abs(chunk)
+            nonzero = magnitude >= self.min_value
+            self.zero_count += int(chunk.shape[0] - np.count_nonzero(nonzero))
+            keys = np.ceil(np.log(np.minimum(magnitude[nonzero], self.max_value)) / self.log_gamma)
+            buckets = np.clip(keys.astype(np.int64) - self.min_key, 0, self.positive_counts.shape[0] - 1)
+            positive = chunk[nonzero] > 0
+            n_buckets = self.positive_counts.shape[0]
+            self.positive_counts += np.bincount(buckets[positive], minlength=n_buckets)
+            self.negative_counts += np.bincount(buckets[~positive], minlength=n_buckets)
+
+    def merge(self, other):
+        """
+        Merge another sketch (with the same parameters) into this one.
+
+        :param other: QuantileSketch.
+        :return:
+        """
+        assert self.positive_counts.shape == other.positive_counts.shape and self.gamma == other.gamma, \
+            "Sketches should have the same parameters."
+        self.positive_counts += other.positive_counts
+        self.negative_counts += other.negative_counts
+        self.zero_count += other.zero_count
+
+    def percentile(self, q):
+        """
+        Approximate percentile (linearly interpolated between approximate order statistics, as np.percentile).
+
+        :param q: Percentile or array of percentiles in [0, 100].
+        :return: Percentile(s).
+        """
+        assert self.count > 0, "Empty sketch."
+        keys = np.arange(self.positive_counts.shape[0]) + self.min_key
+        bucket_values = 2 * self.gamma ** keys / (self.gamma + 1)
+        values = np.concatenate([-bucket_values[::-1], [0.0], bucket_values])
+        counts = np.concatenate([self.negative_counts[::-1], [self.zero_count], self.positive_counts])
+        return _interpolate_ranks(values, np.cumsum(counts), q)
+
+
+def approximate_percentile(X, q, axis=None, relative_accuracy=0.005):
+    """
+    Approximate percentile of float data with a QuantileSketch.
+
+    :param X: Array.
+    :param q: Percentile or array of percentiles in [0, 100].
+    :param axis: Axis along which the percentiles are computed (None for the flattened array).
+    :param relative_accuracy: Bound on the relative error.
+    :return: Percentile(s), shaped as np.percentile(X, q, axis=axis).
+    """
+    if axis is None:
+        sketch = QuantileSketch(relative_accuracy=relative_accuracy)
+        sketch.update(X)
+        return sketch.percentile(q)
+    # Views along the axis, so no copy of the data is made.
+    X = np.moveaxis(X, axis, -1)
+    result = np.empty(np.shape(q) + X.shape[:-1])
+    for index in np.ndindex(*X.shape[:-1]):
+        result[(Ellipsis,) + index] = approximate_percentile(X[index], q, relative_accuracy=relative_accuracy)
+    return result
+
+
+def percentile(X, q, axis=None, exact=True):
+    """
+    Percentile of an array, exact (np.percentile) or approximate with bounded error and memory (QuantileSketch).
+
+    :param X: Array.
+    :param q: Percentile or array of percentiles in [0, 100].
+    :param axis: Axis along which the percentiles are computed (None for the flattened array).
+    :param exact: Use np.percentile?
+    :return: Percentile(s).
+    """
+    if exact:
+        return np.percentile(X, q, axis=axis)
+    return approximate_percentile(X, q, axis=axis)
@@ -0,0 +1,166 @@
+import numpy as np
+
+# Largest code of the scaled uint16 representation.
+UINT16_MAX = np.iinfo(np.uint16).max
+
+# Rows per entry of the cumulative count of stored rows of a sparse array (a multiple of 8).
+SPARSE_CHUNK = 4096
+
+
+class QuantizedArray(object):
+    """
+    Compact N x K array (e.g. concentrations N x n_stains), stored as float16 or as uint16 codes scaled per column
+    (value = code * scale + offset, with an offset of 0 for non-negative columns so that 0 is exact). With
+    sparse=True the rows of zeros (e.g. the white background) are not stored, only a bit per row marking the stored
+    rows.
+
+    It is used like a read only float array: shape, dtype and len are those of the original array and indexing
+    (Q[start:stop], Q[mask]...) or np.asarray(Q) dequantize on use. Contiguous slices only dequantize the rows they
+    cover, so block by block consumers never hold the whole float array. reconstruct_RGB goes further and folds the
+    scale and offset into the stain matrix (see fold), so it only casts the codes.
+    """
+
+    def __init__(self, values, storage_dtype=np.uint16, sparse=False):
+        """
+        :param values: Float array N x K.
+        :param storage_dtype: np.float16 (relative error 5e-4) or np.uint16 (error at most range / 131070 per column).
+        :param sparse: Skip the rows of zeros (the values should be non-negative)?
+        """
+        values = np.asarray(values)
+        assert values.ndim == 2, "Values should be N x K."
+        assert not sparse or not (values < 0).any(), "Sparse values should be non-negative."
+        self.shape = values.shape
+        self.dtype = values.dtype
+        self.storage_dtype = np.dtype(storage_dtype)
+        self.stored = None
+        self.chunk_counts = None
+        if sparse:
+            stored = values.any(axis=1)
+            self.stored = np.packbits(stored)
+            counts = np.add.reduceat(stored, np.arange(0, len(stored), SPARSE_CHUNK), dtype=np.int64) \
+                if len(stored) else np.zeros(0, dtype=np.int64)
+            self.chunk_counts = np.concatenate([[0], np.cumsum(counts)])
+            values = values[stored]
+
+        if self.storage_dtype == np.float16:
+            self.data = values.astype(np.float16)
+            self.scale = None
+            self.offset = None
+        elif self.storage_dtype == np.uint16:
+            if values.shape[0] > 0:
+                self.offset = np.minimum(values.min(axis=0), 0).astype(self.dtype)
+                value_range = values.max(axis=0) - self.offset
+            else:
+                self.offset = np.zeros(values.shape[1], dtype=self.dtype)
+                value_range = np.zeros(values.shape[1], dtype=self.dtype)
+            self.scale = (np.where(value_range > 0, value_range, 1) / UINT16_MAX).astype(self.dtype)
+            self.data = np.rint((values - self.offset) / self.scale).astype(np.uint16)
+        else:
+            raise Exception('Quantization dtype not recognized.')
+
+    @property
+    def nbytes(self):
+        """
+        :return: Memory used by the compact representation.
+        """
+        return sum(array.nbytes for array in self.get_arrays().values())
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        return self.dequantize(dtype)
+
+    def __getitem__(self, index):
+        """
+        :param index: Row index, slice or mask.
+        :return: The dequantized rows.
+        """
+        if isinstance(index, slice) and index.step in (None, 1):
+            start, stop, _ = index.indices(self.shape[0])
+            return self.dequantize_range(start, max(start, stop))
+        return self.dequantize()[index]
+
+    def dequantize(self, dtype=None):
+        """
+        :param dtype: Output dtype (that of the original array by default).
+        :return: The dequantized array N x K.
+        """
+        values = self.dequantize_range(0, self.shape[0])
+        return values if dtype is None else values.astype(dtype, copy=False)
+
+    def dequantize_range(self, start, stop):
+        """
+        Dequantize the rows start to stop.
+        """
+        values = self.get_codes(start, stop)
+        if self.scale is not None:
+            values *= self.scale
+            values += self.offset
+        return values
+
+    def get_codes(self, start, stop):
+        """
+        Get the codes of the rows start to stop (0 for the rows that are not stored), as floats.
+        """
+        if self.stored is None:
+            return self.data[start:stop].astype(self.dtype)
+        # The stored rows among start:stop, and the number of stored rows before start.
+        chunk = start // SPARSE_CHUNK
+        first = chunk * SPARSE_CHUNK
+        stored = np.unpackbits(self.stored[first // 8:(stop + 7) // 8], count=stop - first).view(bool)
+        before = self.chunk_counts[chunk] + np.count_nonzero(stored[:start - first])
+        stored = stored[start - first:]
+        codes = np.zeros((stop - start, self.shape[1]), dtype=self.data.dtype)
+        # Scatter whole rows as single elements, much faster than codes[stored] = ...
+        _as_rows(codes)[stored] = _as_rows(self.data[before:before + np.count_nonzero(stored)])
+        return codes.astype(self.dtype)
+
+    def fold(self, stain_matrix, offset):
+        """
+        Fold the dequantization into a linear map and offset applied to the values,
+        (code * scale + o).W + offset = code.(scale W) + (o.W + offset).
+
+        :param stain_matrix: Array K x 3.
+        :param offset: Array of 3 values.
+        :return: The stain matrix and the offset to apply to the codes.
+        """
+        if self.scale is None:
+            return stain_matrix, offset
+        return (self.scale.reshape((-1, 1)) * stain_matrix).astype(self.dtype), \
+            (offset + np.dot(self.offset, stain_matrix)).astype(self.dtype)
+
+    def get_arrays(self):
+        """
+        :return: Dict of the arrays of the compact representation (e.g. to save them).
+        """
+        arrays = {'data': self.data, 'shape': np.array(self.shape), 'dtype': np.array(self.dtype.str)}
+        if self.scale is not None:
+            arrays.update(scale=self.scale, offset=self.offset)
+        if self.stored is not None:
+            arrays.update(stored=self.stored, chunk_counts=self.chunk_counts)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        :param arrays: Dict of arrays given by get_arrays.
+        :return: QuantizedArray.
+        """
+        quantized = cls.__new__(cls)
+        quantized.data = arrays['data']
+        quantized.shape = tuple(arrays['shape'].tolist())
+        quantized.dtype = np.dtype(str(arrays['dtype']))
+        quantized.storage_dtype = quantized.data.dtype
+        quantized.scale = arrays.get('scale')
+        quantized.offset = arrays.get('offset')
+        quantized.stored = arrays.get('stored')
+        quantized.chunk_counts = arrays.get('chunk_counts')
+        return quantized
+
+
+def _as_rows(array):
+    """
+    View the rows of a C contiguous 2D array as single (void) elements.
+    """
+    return array.view(np.dtype((np.void, array.shape[1] * array.itemsize))).reshape(array.shape[0])
@@ -0,0 +1,146 @@
+"""
+Fused reconstruction of RGB images from stain concentrations, clip(255 * exp(-(C.W + offset)), 0, 255).
+
+The pixels are processed in blocks small enough to stay in cache and each block is written straight into the output
+(e.g. uint8), so no full image float temporaries are made. The backends are a chunked NumPy loop, numexpr and a
+multithreaded Numba kernel (numexpr and Numba are optional).
+"""
+import importlib.util
+
+import numpy as np
+
+from staintools.utils.quantization import QuantizedArray
+
+# Number of pixels per block (the float32 temporary of a block fits in L2 cache).
+BLOCK_SIZE = 2 ** 15
+
+_default_backend = None
+_numba_kernel = None
+
+
+def get_available_backends():
+    """
+    :return: List of the available backends.
+    """
+    return ['numpy'] + [name for name in ('numexpr', 'numba') if importlib.util.find_spec(name) is not None]
+
+
+def get_default_backend():
+    """
+    The multithreaded Numba kernel if there are several threads to run it on, otherwise the chunked NumPy loop
+    (which is faster than a single Numba or numexpr thread).
+
+    :return: Backend name.
+    """
+    global _default_backend
+    if _default_backend is not None:
+        return _default_backend
+    _default_backend = 'numpy'
+    if 'numba' in get_available_backends():
+        import numba
+        if numba.config.NUMBA_NUM_THREADS > 1:
+            _default_backend = 'numba'
+    return _default_backend
+
+
+def reconstruct_RGB(concentrations, stain_matrix, offset=None, out=None, dtype=np.uint8, backend=None):
+    """
+    Reconstruct RGB pixels from stain concentrations.
+
+    Float values are truncated when written into an integer output (as .astype(np.uint8)).
+
+    :param concentrations: Array N x n_stains (or a QuantizedArray, dequantized block by block).
+    :param stain_matrix: Array n_stains x 3.
+    :param offset: Optional optical density added to every pixel (3 values).
+    :param out: Optional preallocated array with N x 3 elements (e.g. an image H x W x 3) to write into.
+    :param dtype: Output dtype if out is not given.
+    :param backend: 'numba', 'numexpr', 'numpy' or None for get_default_backend().
+    :return: Array N x 3 (or out).
+    """
+    n_pixels = concentrations.shape[0]
+    if out is None:
+        out = np.empty((n_pixels, 3), dtype=dtype)
+    assert out.size == 3 * n_pixels, "Output should have N x 3 elements."
+    if not out.flags['C_CONTIGUOUS']:
+        pixels = reconstruct_RGB(concentrations, stain_matrix, offset, dtype=out.dtype, backend=backend)
+        out[...] = pixels.reshape(out.shape)
+        return out
+    stain_matrix = np.ascontiguousarray(stain_matrix, dtype=concentrations.dtype)
+    offset = np.zeros(3, dtype=concentrations.dtype) if offset is None else \
+        np.asarray(offset, dtype=concentrations.dtype).reshape((3,))
+    if isinstance(concentrations, QuantizedArray):
+        # Reconstruct from the codes, with the dequantization folded into the stain matrix and the offset.
+        stain_matrix, offset = concentrations.fold(stain_matrix, offset)
+        get_block = concentrations.get_codes
+        block_size = BLOCK_SIZE
+    else:
+        def get_block(start, stop):
+            return concentrations[start:stop]
+        # Slices of an array are views, so the Numba kernel can take it whole.
+        block_size = max(n_pixels, 1)
+    if backend is None:
+        backend = get_default_backend()
+    pixels = out.reshape((n_pixels, 3))
+
+    if backend == 'numba':
+        kernel = _get_numba_kernel()
+        for start in range(0, n_pixels, block_size):
+            stop = min(start + block_size, n_pixels)
+            kernel(get_block(start, stop), stain_matrix, offset, pixels[start:stop])
+    elif backend == 'numexpr':
+        _reconstruct_blocks(get_block, stain_matrix, offset, pixels, _exp_numexpr)
+    elif backend == 'numpy':
+        _reconstruct_blocks(get_block, stain_matrix, offset, pixels, _exp_numpy)
+    else:
+        raise Exception('Backend not recognized.')
+    return out
+
+
+def _exp_numpy(tmp, offset):
+    tmp += offset
+    np.negative(tmp, out=tmp)
+    np.exp(tmp, out=tmp)
+    tmp *= 255
+
+
+def _exp_numexpr(tmp, offset):
+    import numexpr
+    numexpr.evaluate('255 * exp(-(tmp + offset))', out=tmp, casting='same_kind')
+
+
+def _reconstruct_blocks(get_block, stain_matrix, offset, pixels, exp):
+    """
+    Reconstruct block by block, reusing one small float buffer. get_block(start, stop) gives the concentrations.
+    """
+    n_pixels = pixels.shape[0]
+    buffer = np.empty((min(BLOCK_SIZE, n_pixels), 3), dtype=stain_matrix.dtype)
+    for start in range(0, n_pixels, BLOCK_SIZE):
+        stop = min(start + BLOCK_SIZE, n_pixels)
+        tmp = buffer[:stop - start]
+        np.dot(get_block(start, stop), stain_matrix, out=tmp)
+        exp(tmp, offset)
+        np.clip(tmp, 0, 255, out=tmp)
+        pixels[start:stop] = tmp
+
+
+def _get_numba_kernel():
+    """
+    Compile the Numba kernel on first use.
+    """
+    global _numba_kernel
+    if _numba_kernel is None:
+        import numba
+
+        @numba.njit(parallel=True, cache=True)
+        def kernel(concentrations, stain_matrix, offset, pixels):
+            n_stains = concentrations.shape[1]
+            for i in numba.prange(concentrations.shape[0]):
+                for j in range(3):
+                    od = offset[j]
+                    for k in range(n_stains):
+                        od += concentrations[i, k] * stain_matrix[k, j]
+                    value = 255 * np.exp(-od)
+                    pixels[i, j] = min(max(value, 0), 255)
+
+        _numba_kernel = kernel
+    return _numba_kernel
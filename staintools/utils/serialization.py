@@ -0,0 +1,85 @@
+import json
+
+import numpy as np
+
+# Bump when the layout of saved files changes.
+FORMAT_VERSION = 1
+
+# Key prefix of the array valued parameters among the saved arrays.
+PARAM_PREFIX = '__param'
+
+
+def save_state(file, name, params, arrays):
+    """
+    Save the fitted state of a transformer to a compressed .npz file.
+
+    :param file: Path or file object.
+    :param name: Name of the transformer class.
+    :param params: Dict of constructor parameters (JSON serializable, except for numpy arrays).
+    :param arrays: Dict of fitted numpy arrays.
+    :return:
+    """
+    params, param_arrays = split_array_params(params)
+    header = {'format_version': FORMAT_VERSION, 'name': name, 'params': params}
+    np.savez_compressed(file, __header__=np.array(json.dumps(header)), **param_arrays, **arrays)
+
+
+def load_state(file, name):
+    """
+    Load the fitted state of a transformer saved with save_state.
+
+    :param file: Path or file object.
+    :param name: Expected name of the transformer class.
+    :return: Dict of constructor parameters and dict of fitted numpy arrays.
+    """
+    with np.load(file, allow_pickle=False) as data:
+        header = json.loads(str(data['__header__']))
+        if header['format_version'] != FORMAT_VERSION:
+            raise Exception('Unsupported format version {}.'.format(header['format_version']))
+        if header['name'] != name:
+            raise Exception('File contains a {} not a {}.'.format(header['name'], name))
+        arrays = {key: data[key] for key in data.files if key != '__header__'}
+    param_arrays = {key: arrays.pop(key) for key in list(arrays) if key.startswith(PARAM_PREFIX)}
+    return join_array_params(header['params'], param_arrays), arrays
+
+
+def split_array_params(params, path=PARAM_PREFIX):
+    """
+    Take the numpy arrays (e.g. an init_dictionary in extractor_kwargs) out of a dict of parameters, so the rest
+    can be JSON encoded. Each array is replaced by {'__array__': key}.
+
+    :param params: Dict of parameters (possibly nested).
+    :param path: Key prefix of the arrays.
+    :return: Dict of JSON serializable parameters and dict of arrays by key.
+    """
+    json_params = {}
+    arrays = {}
+    for name, value in params.items():
+        key = path + '__' + name
+        if isinstance(value, np.ndarray):
+            json_params[name] = {'__array__': key}
+            arrays[key] = value
+        elif isinstance(value, dict):
+            json_params[name], value_arrays = split_array_params(value, key)
+            arrays.update(value_arrays)
+        else:
+            json_params[name] = value
+    return json_params, arrays
+
+
+def join_array_params(params, arrays):
+    """
+    Put back the arrays taken out by split_array_params.
+
+    :param params: Dict of JSON serializable parameters.
+    :param arrays: Dict of arrays by key.
+    :return: Dict of parameters.
+    """
+    joined = {}
+    for name, value in params.items():
+        if isinstance(value, dict) and list(value) == ['__array__']:
+            value = arrays[value['__array__']]
+        elif isinstance(value, dict):
+            value = join_array_params(value, arrays)
+        joined[name] = value
+    return joined
@@ -0,0 +1,161 @@
+import collections
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+
+class StainMatrixCache(object):
+    """
+    Least recently used cache of stain matrices, with an optional on-disk tier.
+
+    Entries are keyed by the extractor, its parameters and either a hash of the image content or a caller supplied
+    slide ID. With a slide ID the image is not hashed, so all the tiles of a slide (at any tile size, in any epoch)
+    share the stain matrix of the first one seen. A tissue mask passed to the extractor is not part of the key since
+    it is derived from the image. The cache can be shared by threads.
+    """
+
+    def __init__(self, max_entries=4096, directory=None):
+        """
+        :param max_entries: Maximum number of stain matrices kept in memory (a 2 x 3 matrix is about 100 bytes).
+        :param directory: Optional directory for the disk tier (.npy files), shared across processes and runs.
+        """
+        assert max_entries > 0, "The cache should hold at least one entry."
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self.max_entries = max_entries
+        self.directory = directory
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        # Worker processes get a copy of the memory tier (the lock is not picklable) and share the disk tier.
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def get_key(self, extractor, I=None, slide_id=None, **kwargs):
+        """
+        Get the cache key of a stain matrix.
+
+        :param extractor: Stain extractor class (e.g. MacenkoStainExtractor) or instance.
+        :param I: Image RGB uint8 (hashed if slide_id is None).
+        :param slide_id: Optional ID of the slide the image belongs to.
+        :param kwargs: Keyword arguments of get_stain_matrix.
+        :return: Hex digest.
+        """
+        h = hashlib.sha256()
+        h.update(getattr(extractor, '__name__', type(extractor).__name__).encode())
+        for name in sorted(kwargs):
+            if name == 'tissue_mask':
+                continue
+            value = kwargs[name]
+            h.update(name.encode())
+            if isinstance(value, np.ndarray):
+                value = np.ascontiguousarray(value)
+                h.update(str((value.shape, value.dtype.str)).encode())
+                h.update(value.data)
+            else:
+                h.update(json.dumps(value, sort_keys=True).encode())
+        if slide_id is not None:
+            h.update(b'slide_id' + str(slide_id).encode())
+        else:
+            assert I is not None, "Give an image or a slide ID."
+            I = np.ascontiguousarray(I)
+            h.update(str((I.shape, I.dtype.str)).encode())
+            h.update(I.data)
+        return h.hexdigest()
+
+    def get_stain_matrix(self, extractor, I, slide_id=None, **kwargs):
+        """
+        Get the stain matrix of an image from the cache, or compute and cache it.
+
+        :param extractor: Stain extractor class (e.g. MacenkoStainExtractor) or instance.
+        :param I: Image RGB uint8.
+        :param slide_id: Optional ID of the slide the image belongs to (see the class docstring).
+        :param kwargs: Keyword arguments of get_stain_matrix.
+        :return: Stain matrix (a copy, so the cached entry cannot be modified).
+        """
+        key = self.get_key(extractor, I, slide_id=slide_id, **kwargs)
+        with self.lock:
+            stain_matrix = self.entries.get(key)
+            if stain_matrix is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return stain_matrix.copy()
+
+        stain_matrix = self.read(key)
+        if stain_matrix is not None:
+            with self.lock:
+                self.disk_hits += 1
+        else:
+            stain_matrix = extractor.get_stain_matrix(I, **kwargs)
+            with self.lock:
+                self.misses += 1
+            self.write(key, stain_matrix)
+        with self.lock:
+            self.entries[key] = stain_matrix
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return stain_matrix.copy()
+
+    def read(self, key):
+        """
+        Read an entry from the disk tier.
+
+        :param key: Cache key.
+        :return: Stain matrix or None.
+        """
+        if self.directory is None:
+            return None
+        path = os.path.join(self.directory, key + '.npy')
+        if not os.path.isfile(path):
+            return None
+        return np.load(path, allow_pickle=False)
+
+    def write(self, key, stain_matrix):
+        """
+        Write an entry to the disk tier (if any).
+
+        :param key: Cache key.
+        :param stain_matrix: Stain matrix.
+        :return:
+        """
+        if self.directory is None:
+            return
+        # Write to a temporary file first so concurrent workers never read a partial file.
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, stain_matrix, allow_pickle=False)
+        os.replace(tmp_path, os.path.join(self.directory, key + '.npy'))
+
+    def get_stats(self):
+        """
+        Get the cache counters.
+
+        :return: Dict of hits (in memory), disk_hits, misses and the number of entries in memory.
+        """
+        with self.lock:
+            return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                    'entries': len(self.entries)}
+
+    def clear(self):
+        """
+        Empty the memory tier and reset the counters (the disk tier is kept).
+
+        :return:
+        """
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
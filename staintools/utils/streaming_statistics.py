@@ -0,0 +1,126 @@
+import numpy as np
+
+
+class RunningMoments(object):
+    """
+    Running per-feature count, mean and standard deviation (Welford / Chan et al. parallel update).
+    """
+
+    def __init__(self, n_features):
+        self.count = 0
+        self.mean = np.zeros(n_features)
+        self.M2 = np.zeros(n_features)
+
+    def update_from_moments(self, count, mean, std):
+        """
+        Merge in the moments of a batch.
+
+        :param count: Number of samples in the batch.
+        :param mean: Per-feature mean of the batch.
+        :param std: Per-feature (population) standard deviation of the batch.
+        :return:
+        """
+        if count == 0:
+            return
+        mean = np.ravel(mean).astype(np.float64)
+        M2 = count * np.ravel(std).astype(np.float64) ** 2
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (count / total)
+        self.M2 = self.M2 + M2 + delta ** 2 * (self.count * count / total)
+        self.count = total
+
+    def update(self, X):
+        """
+        Merge in a batch of samples.
+
+        :param X: Array n_samples x n_features.
+        :return:
+        """
+        self.update_from_moments(X.shape[0], X.mean(axis=0), X.std(axis=0))
+
+    @property
+    def std(self):
+        return np.sqrt(self.M2 / self.count)
+
+
+class RunningCovariance(object):
+    """
+    Running mean and covariance matrix (Chan et al. parallel update).
+    """
+
+    def __init__(self, n_features):
+        self.count = 0
+        self.mean = np.zeros(n_features)
+        self.comoment = np.zeros((n_features, n_features))
+
+    def update(self, X):
+        """
+        Merge in a batch of samples.
+
+        :param X: Array n_samples x n_features.
+        :return:
+        """
+        count = X.shape[0]
+        if count == 0:
+            return
+        mean = X.mean(axis=0)
+        centered = X - mean
+        comoment = np.dot(centered.T, centered)
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (count / total)
+        self.comoment = self.comoment + comoment + np.outer(delta, delta) * (self.count * count / total)
+        self.count = total
+
+    @property
+    def covariance(self):
+        """
+        Sample covariance (normalized by count - 1, as np.cov).
+        """
+        return self.comoment / (self.count - 1)
+
+
+class ReservoirSampler(object):
+    """
+    Uniform random sample of fixed size from a stream of rows (reservoir sampling).
+    """
+
+    def __init__(self, size, random_state=0):
+        """
+        :param size: Number of rows kept.
+        :param random_state: Seed.
+        """
+        self.size = size
+        self.rng = np.random.default_rng(random_state)
+        self.sample = None
+        self.n_seen = 0
+
+    def update(self, X):
+        """
+        Offer a batch of rows to the reservoir.
+
+        :param X: Array n_rows x ...
+        :return:
+        """
+        if self.sample is None:
+            self.sample = np.empty((self.size,) + X.shape[1:], dtype=X.dtype)
+        # Fill up the reservoir first.
+        n_fill = min(max(self.size - self.n_seen, 0), X.shape[0])
+        self.sample[self.n_seen:self.n_seen + n_fill] = X[:n_fill]
+        self.n_seen += n_fill
+        X = X[n_fill:]
+        if X.shape[0] == 0:
+            return
+        # Row t (0-based over the stream) replaces a random slot with probability size / (t + 1).
+        t = self.n_seen + np.arange(X.shape[0])
+        slots = self.rng.integers(0, t + 1)
+        keep = slots < self.size
+        self.sample[slots[keep]] = X[keep]
+        self.n_seen += X.shape[0]
+
+    def get_sample(self):
+        """
+        :return: The sampled rows.
+        """
+        return self.sample[:min(self.n_seen, self.size)]
@@ -0,0 +1,19 @@
+import numpy as np
+
+# Typical H&E stain matrix (H first).
+STAIN_MATRIX = np.array([[0.65, 0.70, 0.29],
+                         [0.07, 0.99, 0.11]])
+
+
+def make_stained_image(shape=(16, 12), seed=0, background_rows=4):
+    """
+    Random image made of two positive stains with a white background on the top rows.
+
+    :param shape: Image shape (H, W).
+    :param seed: Seed for the concentrations.
+    :param background_rows: Number of white top rows.
+    :return: Image RGB uint8.
+    """
+    concentrations = np.random.RandomState(seed).uniform(0, 1.5, list(shape) + [2])
+    concentrations[:background_rows] = 0
+    return (255 * np.exp(-1 * np.dot(concentrations, STAIN_MATRIX))).astype(np.uint8)
@@ -0,0 +1,74 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import Mock
+import numpy as np
+
+sys.modules['spams'] = Mock()
+
+from staintools.preprocessing.image_io import list_images, prefetch_images, write_image, ImageWriter
+from staintools.preprocessing.read_image import read_image
+from staintools.utils.exceptions import ImageReadException
+
+
+class TestImageIO(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.images = [np.random.randint(0, 256, size=(8, 6, 3), dtype=np.uint8) for _ in range(5)]
+        self.paths = [os.path.join(self.directory.name, 'image_{}.png'.format(i)) for i in range(5)]
+        for path, I in zip(self.paths, self.images):
+            write_image(path, I)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_lists_directory_and_glob(self):
+        with open(os.path.join(self.directory.name, 'notes.txt'), 'w') as f:
+            f.write('not an image')
+
+        self.assertEqual(self.paths, list_images(self.directory.name))
+        self.assertEqual(self.paths[:2], list_images(os.path.join(self.directory.name, 'image_[01].png')))
+
+    def test_prefetch_yields_in_order(self):
+        get = list(prefetch_images(self.directory.name, n_threads=3, prefetch=2))
+
+        self.assertEqual(self.paths, [path for path, _ in get])
+        for expect, (_, I) in zip(self.images, get):
+            self.assertTrue(np.array_equal(expect, I))
+
+    def test_prefetch_with_custom_reader_and_errors(self):
+        paths = self.paths[:2] + [os.path.join(self.directory.name, 'missing.png')]
+
+        def reader(path, reduce=1):
+            if not os.path.isfile(path):
+                raise ImageReadException(path)
+            return read_image(path, reduce=reduce)[:2]
+
+        get = list(prefetch_images(paths, reader=reader, return_exceptions=True, reduce=1))
+
+        self.assertEqual((2, 6, 3), get[0][1].shape)
+        self.assertIsInstance(get[2][1], ImageReadException)
+        with self.assertRaises(ImageReadException):
+            list(prefetch_images(paths, reader=reader))
+
+    def test_writer_writes_batches(self):
+        paths = [path.replace('image_', 'out_') for path in self.paths]
+
+        with ImageWriter(n_threads=2, max_pending=2) as writer:
+            writer.write_batch(paths[:3], np.stack(self.images[:3]))
+            writer.write(paths[3], self.images[3])
+
+        for path, expect in zip(paths[:4], self.images):
+            self.assertTrue(np.array_equal(expect, read_image(path)))
+
+    def test_writer_raises_errors(self):
+        writer = ImageWriter()
+        writer.write(os.path.join(self.directory.name, 'image.unknown_format'), self.images[0])
+
+        with self.assertRaises(Exception):
+            writer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
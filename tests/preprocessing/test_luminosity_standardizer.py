@@ -0,0 +1,37 @@
+import sys
+import unittest
+from unittest.mock import Mock
+import numpy as np
+
+sys.modules['spams'] = Mock()
+
+from staintools.preprocessing.luminosity_standardizer import LuminosityStandardizer
+from tests.helpers import make_stained_image
+
+
+class TestLuminosityStandardizer(unittest.TestCase):
+    def setUp(self):
+        self.image = make_stained_image(background_rows=0)
+
+    def test_brightest_pixels_are_saturated(self):
+        get = LuminosityStandardizer.standardize(self.image, percentile=90)
+
+        self.assertEqual(self.image.shape, get.shape)
+        self.assertEqual(np.uint8, get.dtype)
+        self.assertGreater(get.mean(), self.image.mean())
+
+    def test_writes_into_out(self):
+        out = np.zeros(self.image.shape, dtype=np.uint8)
+
+        get = LuminosityStandardizer.standardize(self.image, out=out)
+
+        self.assertIs(out, get)
+        self.assertTrue(np.array_equal(LuminosityStandardizer.standardize(self.image), out))
+
+    def test_out_should_match_image(self):
+        with self.assertRaises(AssertionError):
+            LuminosityStandardizer.standardize(self.image, out=np.zeros((2, 2, 3), dtype=np.uint8))
+
+
+if __name__ == '__main__':
+    unittest.main()
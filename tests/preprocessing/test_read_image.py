@@ -0,0 +1,71 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import Mock
+import numpy as np
+import cv2 as cv
+
+sys.modules['spams'] = Mock()
+
+from staintools.preprocessing import read_image as read_image_module
+from staintools.preprocessing.read_image import read_image, decode_image
+from staintools.utils.exceptions import ImageReadException
+
+
+class TestReadImage(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.image = np.random.randint(0, 256, size=(32, 24, 3), dtype=np.uint8)
+        self.image[:, :, 0] = 200
+        self.image[:, :, 2] = 10
+        self.path = os.path.join(self.directory.name, 'image.png')
+        cv.imwrite(self.path, cv.cvtColor(self.image, cv.COLOR_RGB2BGR))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_reads_RGB(self):
+        get = read_image(self.path)
+
+        self.assertTrue(np.array_equal(self.image, get))
+
+    def test_converts_to_RGB_without_IMREAD_COLOR_RGB(self):
+        original = read_image_module.IMREAD_COLOR_RGB
+        read_image_module.IMREAD_COLOR_RGB = None
+        try:
+            get = read_image(self.path)
+        finally:
+            read_image_module.IMREAD_COLOR_RGB = original
+
+        self.assertTrue(np.array_equal(self.image, get))
+
+    def test_reads_reduced_resolution(self):
+        for reduce in [2, 4, 8]:
+            with self.subTest(reduce=reduce):
+                get = read_image(self.path, reduce=reduce)
+                self.assertEqual((32 // reduce, 24 // reduce, 3), get.shape)
+                self.assertTrue(np.all(get[:, :, 0] == 200) and np.all(get[:, :, 2] == 10))
+
+    def test_decodes_bytes_and_memoryview(self):
+        with open(self.path, 'rb') as f:
+            content = f.read()
+
+        for buffer in [content, bytearray(content), memoryview(content)]:
+            with self.subTest(type=type(buffer)):
+                self.assertTrue(np.array_equal(self.image, decode_image(buffer)))
+                self.assertTrue(np.array_equal(self.image, read_image(buffer)))
+
+    def test_raises_for_undecodable_file(self):
+        path = os.path.join(self.directory.name, 'broken.png')
+        with open(path, 'wb') as f:
+            f.write(b'not an image')
+
+        with self.assertRaises(ImageReadException):
+            read_image(path)
+        with self.assertRaises(ImageReadException):
+            decode_image(b'not an image')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import sys
+import unittest
+from unittest.mock import Mock
+import numpy as np
+
+sys.modules['spams'] = Mock()
+
+from staintools.stain_extraction.vahadane_stain_extractor import VahadaneStainExtractor, \
+    WarmStartVahadaneStainExtractor
+from tests.helpers import make_stained_image
+
+
+class TestVahadaneStainExtractor(unittest.TestCase):
+    def setUp(self):
+        self.image = make_stained_image((64, 64), seed=0)
+
+    def test_numpy_backend(self):
+        get = VahadaneStainExtractor.get_stain_matrix(self.image, regularizer=0.01, backend='numpy')
+
+        self.assertEqual((2, 3), get.shape)
+        self.assertTrue(np.allclose(1, np.linalg.norm(get, axis=1)))
+        self.assertGreater(get[0, 0], get[1, 0])  # H first.
+
+    def test_warm_start_extractor_keeps_last_estimate(self):
+        expect = VahadaneStainExtractor.get_stain_matrix(self.image, regularizer=0.01, backend='numpy')
+        extractor = WarmStartVahadaneStainExtractor(init_dictionary=expect, backend='numpy')
+
+        get = extractor.get_stain_matrix(make_stained_image((64, 64), seed=1), regularizer=0.01)
+
+        self.assertIs(get, extractor.dictionary)
+        self.assertTrue(np.allclose(expect, get, atol=0.05))
+
+    def test_warm_start_extractor_uses_same_backend_default(self):
+        dictionary = np.asfortranarray(np.array([[0.65, 0.70, 0.29], [0.07, 0.99, 0.11]]).T)
+        spams = sys.modules['spams']
+        spams.trainDL = Mock(return_value=(dictionary, 'model'))
+
+        WarmStartVahadaneStainExtractor().get_stain_matrix(self.image)
+
+        self.assertTrue(spams.trainDL.called)
+
+    def test_spams_backend_stops_early(self):
+        dictionary = np.asfortranarray(np.array([[0.65, 0.70, 0.29], [0.07, 0.99, 0.11]]).T)
+        spams = sys.modules['spams']
+        spams.trainDL = Mock(return_value=(dictionary, 'model'))
+
+        VahadaneStainExtractor.get_stain_matrix(self.image, init_dictionary=dictionary.T, n_iter=100, tol=1e-4)
+
+        self.assertEqual(1, spams.trainDL.call_count)
+        kwargs = spams.trainDL.call_args.kwargs
+        self.assertTrue(np.allclose(dictionary, kwargs['D']))
+        self.assertEqual(10, kwargs['iter'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import sys
+import unittest
+from unittest.mock import Mock
+import numpy as np
+
+sys.modules['spams'] = Mock()
+
+from staintools.augmentation_dataset import StainAugmentationDataset
+from staintools.stain_augmentor import StainAugmentor
+from tests.helpers import make_stained_image
+
+
+class TestStainAugmentationDataset(unittest.TestCase):
+    def setUp(self):
+        self.images = [make_stained_image(seed=seed) for seed in range(5)]
+        self.augmentor = StainAugmentor(method='macenko', solver='numpy')
+
+    def test_iterate_matches_indexing(self):
+        dataset = StainAugmentationDataset(self.images, self.augmentor, seed=0)
+
+        got = list(dataset.iterate(epoch=1, shuffle=True, n_workers=2, prefetch=3))
+
+        self.assertEqual(list(range(5)), sorted(index for index, _ in got))
+        dataset.set_epoch(1)
+        for index, I in got:
+            with self.subTest(index=index):
+                self.assertTrue(np.array_equal(dataset[index], I))
+        stats = dataset.get_stats()
+        self.assertEqual(5, stats['fits'])
+        self.assertEqual(5, stats['images'])
+
+    def test_epochs_differ(self):
+        dataset = StainAugmentationDataset(self.images, self.augmentor, seed=0)
+
+        self.assertFalse(np.array_equal(dataset.get_item(0, epoch=0), dataset.get_item(0, epoch=1)))
+        self.assertEqual(1, dataset.get_stats()['fits'])
+
+    def test_quantized_concentrations(self):
+        exact = StainAugmentationDataset(self.images, self.augmentor, seed=0, dtype=np.float32)
+        quantized = StainAugmentationDataset(self.images, self.augmentor, seed=0, dtype=np.float32,
+                                             concentration_dtype=np.uint16)
+        exact.fit_all()
+        quantized.fit_all()
+
+        self.assertTrue(np.allclose(exact[2], quantized[2], atol=0.5))
+        self.assertLess(quantized.get_stats()['concentration_bytes'], 0.6 * exact.get_stats()['concentration_bytes'])
+
+    def test_cache_size(self):
+        dataset = StainAugmentationDataset(self.images, self.augmentor, cache_size=2)
+
+        list(dataset.iterate(n_workers=1))
+
+        self.assertEqual(2, len(dataset.fitted))
+
+    def test_process_backend(self):
+        dataset = StainAugmentationDataset(self.images[:2], self.augmentor, seed=0)
+        dataset.fit_all()
+
+        got = dict(dataset.iterate(n_workers=2, backend='process'))
+
+        for index in range(2):
+            with self.subTest(index=index):
+                self.assertTrue(np.array_equal(dataset[index], got[index]))
@@ -0,0 +1,94 @@
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import Mock
+import numpy as np
+
+sys.modules['spams'] = Mock()
+
+from staintools.cli import get_parser, run
+from staintools.preprocessing.image_io import write_image
+from staintools.preprocessing.read_image import read_image
+from tests.helpers import make_stained_image
+
+
+class TestCLI(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.input = os.path.join(self.directory.name, 'input')
+        self.output = os.path.join(self.directory.name, 'output')
+        os.makedirs(self.input)
+        for i in range(3):
+            write_image(os.path.join(self.input, 'image_{}.png'.format(i)), make_stained_image(seed=i))
+        write_image(os.path.join(self.input, 'white.png'), np.full((8, 8, 3), 255, dtype=np.uint8))
+        self.target = os.path.join(self.directory.name, 'target.png')
+        write_image(self.target, make_stained_image(seed=3))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_command(self, argv):
+        return run(get_parser().parse_args(argv), stream=io.StringIO())
+
+    def read_manifest(self):
+        with open(os.path.join(self.output, 'manifest.jsonl')) as f:
+            return [json.loads(line) for line in f]
+
+    def test_normalize_records_failures_and_resumes(self):
+        fit = os.path.join(self.directory.name, 'fit.npz')
+        argv = ['normalize', self.input, '-o', self.output, '--target', self.target, '--save-fit', fit]
+
+        first = self.run_command(argv)
+        second = self.run_command(['normalize', self.input, '-o', self.output, '--fit', fit])
+
+        self.assertEqual({'ok': 3, 'skipped': 0, 'failed': 1}, first)
+        self.assertEqual({'ok': 0, 'skipped': 3, 'failed': 1}, second)
+        self.assertEqual((16, 12, 3), read_image(os.path.join(self.output, 'image_0.png')).shape)
+        records = self.read_manifest()
+        failed = [record for record in records if record['status'] == 'failed']
+        self.assertTrue(all('TissueMaskException' in record['error'] for record in failed))
+        self.assertTrue(all('transform_seconds' in record for record in records if record['status'] == 'ok'))
+
+    def test_augment_with_workers(self):
+        argv = ['augment', os.path.join(self.input, 'image_*.png'), '-o', self.output, '--n-augmentations', '2',
+                '--workers', '2', '--format', 'jpg']
+
+        counts = self.run_command(argv)
+
+        self.assertEqual({'ok': 3, 'skipped': 0, 'failed': 0}, counts)
+        self.assertTrue(os.path.isfile(os.path.join(self.output, 'image_2_1.jpg')))
+
+    def test_outputs_keep_relative_paths(self):
+        for name in ['a', 'b']:
+            os.makedirs(os.path.join(self.input, name))
+            write_image(os.path.join(self.input, name, 'same.png'), make_stained_image())
+
+        counts = self.run_command(['standardize', os.path.join(self.input, '*', 'same.png'), '-o', self.output])
+
+        self.assertEqual({'ok': 2, 'skipped': 0, 'failed': 0}, counts)
+        self.assertTrue(os.path.isfile(os.path.join(self.output, 'a', 'same.png')))
+        self.assertTrue(os.path.isfile(os.path.join(self.output, 'b', 'same.png')))
+
+    def test_output_collisions_fail(self):
+        other = os.path.join(self.directory.name, 'other')
+        os.makedirs(other)
+        write_image(os.path.join(other, 'image_0.png'), make_stained_image())
+
+        counts = self.run_command(['standardize', self.input, other, '-o', self.output])
+
+        self.assertEqual({'ok': 4, 'skipped': 0, 'failed': 1}, counts)
+        failed = [record for record in self.read_manifest() if record['status'] == 'failed']
+        self.assertEqual(os.path.join(other, 'image_0.png'), failed[0]['input'])
+        self.assertIn('OutputCollision', failed[0]['error'])
+
+    def test_standardize(self):
+        counts = self.run_command(['standardize', self.input, '-o', self.output, '--overwrite'])
+
+        self.assertEqual({'ok': 4, 'skipped': 0, 'failed': 0}, counts)
+
+
+if __name__ == '__main__':
+    unittest.main()
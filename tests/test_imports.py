@@ -0,0 +1,38 @@
+import json
+import subprocess
+import sys
+import unittest
+
+HEAVY_MODULES = ['cv2', 'matplotlib', 'spams']
+
+
+def get_loaded_heavy_modules(code):
+    """
+    Run code in a fresh interpreter and get the heavy modules it loaded.
+    """
+    code += '\nimport sys, json\nprint(json.dumps([m for m in {} if m in sys.modules]))'.format(HEAVY_MODULES)
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+class TestImports(unittest.TestCase):
+    def test_import_is_lightweight(self):
+        self.assertEqual([], get_loaded_heavy_modules('import staintools'))
+        self.assertEqual([], get_loaded_heavy_modules('import staintools.cli'))
+
+    def test_modules_are_loaded_on_use(self):
+        self.assertEqual(['cv2'], get_loaded_heavy_modules('import staintools; staintools.StainNormalizer'))
+        self.assertIn('matplotlib', get_loaded_heavy_modules('import staintools; staintools.plot_image'))
+
+    def test_public_names_resolve(self):
+        import staintools
+
+        for name in staintools.__all__:
+            with self.subTest(name=name):
+                self.assertTrue(hasattr(staintools, name))
+        with self.assertRaises(AttributeError):
+            staintools.not_a_name
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import functools
+import sys
+import unittest
+from unittest.mock import Mock
+import numpy as np
+
+sys.modules['spams'] = Mock()
+
+from staintools.parallel_runner import apply_transformer, parallel_transform
+from staintools.preprocessing.luminosity_standardizer import LuminosityStandardizer
+from staintools.stain_augmentor import StainAugmentor
+from staintools.stain_normalizer import StainNormalizer
+from tests.helpers import make_stained_image
+
+
+class TestParallelRunner(unittest.TestCase):
+    def setUp(self):
+        self.images = [make_stained_image(background_rows=0, seed=seed) for seed in range(7)]
+
+    def test_thread_backend_matches_serial_in_order(self):
+        expect = [LuminosityStandardizer.standardize(I) for I in self.images]
+
+        get = list(parallel_transform(LuminosityStandardizer, self.images, n_jobs=2, chunk_size=2, backend='thread'))
+
+        self.assertEqual(len(expect), len(get))
+        for e, g in zip(expect, get):
+            self.assertTrue(np.array_equal(e, g))
+
+    def test_process_backend_shares_fitted_arrays(self):
+        normalizer = StainNormalizer(method='macenko', solver='numpy')
+        normalizer.fit(self.images[0].copy())
+        expect = [normalizer.transform(I.copy()) for I in self.images]
+
+        get = list(parallel_transform(normalizer, self.images, n_jobs=2, chunk_size=3, share_threshold=0))
+
+        self.assertEqual(len(expect), len(get))
+        for e, g in zip(expect, get):
+            self.assertTrue(np.array_equal(e, g))
+
+    def test_function_and_augmentations(self):
+        augmentor = StainAugmentor(method='macenko', solver='numpy')
+
+        function = functools.partial(apply_transformer, n_augmentations=2, rng=0)
+
+        get = list(parallel_transform(augmentor, self.images[:3], n_jobs=2, backend='thread', function=function))
+
+        self.assertEqual(3, len(get))
+        self.assertEqual((2,) + self.images[0].shape, get[0].shape)
+        self.assertTrue(np.array_equal(apply_transformer(augmentor, self.images[0], n_augmentations=2, rng=0), get[0]))
+
@@ -0,0 +1,48 @@
+import sys
+import unittest
+from unittest.mock import Mock
+import numpy as np
+
+sys.modules['spams'] = Mock()
+
+from staintools.reinhard_color_normalizer import ReinhardColorNormalizer
+
+
+class TestReinhardColorNormalizer(unittest.TestCase):
+    def setUp(self):
+        self.normalizer = ReinhardColorNormalizer()
+        self.normalizer.fit(np.random.randint(0, 256, [20, 30, 3]).astype(np.uint8))
+
+    def test_transform_matches_channel_by_channel_mapping(self):
+        I = np.random.randint(0, 220, [25, 15, 3]).astype(np.uint8)
+        I1, I2, I3 = ReinhardColorNormalizer.lab_split(I)
+        means, stds = self.normalizer.get_mean_std(I)
+        t_means, t_stds = self.normalizer.target_means, self.normalizer.target_stds
+        norm1 = ((I1 - means[0]) * (t_stds[0] / stds[0])) + t_means[0]
+        norm2 = ((I2 - means[1]) * (t_stds[1] / stds[1])) + t_means[1]
+        norm3 = ((I3 - means[2]) * (t_stds[2] / stds[2])) + t_means[2]
+        expect = ReinhardColorNormalizer.merge_back(norm1, norm2, norm3).astype(int)
+
+        get = self.normalizer.transform(I).astype(int)
+
+        self.assertTrue(np.abs(expect - get).max() <= 1)
+
+    def test_transform_batch_matches_transform(self):
+        images = np.random.randint(0, 220, [3, 10, 12, 3]).astype(np.uint8)
+
+        get = self.normalizer.transform_batch(images)
+
+        for i in range(3):
+            with self.subTest():
+                self.assertTrue(np.array_equal(self.normalizer.transform(images[i]), get[i]))
+
+    def test_fit_stream_matches_fit_on_all_images(self):
+        images = [np.random.randint(0, 256, [8, 10, 3]).astype(np.uint8) for _ in range(4)]
+        expect = ReinhardColorNormalizer()
+        expect.fit(np.concatenate(images))
+
+        get = ReinhardColorNormalizer()
+        get.fit_stream(iter(images))
+
+        self.assertTrue(np.allclose(np.ravel(expect.target_means), np.ravel(get.target_means)))
+        self.assertTrue(np.allclose(np.ravel(expect.target_stds), np.ravel(get.target_stds)))
@@ -0,0 +1,108 @@
+import io
+import sys
+import unittest
+from unittest.mock import Mock
+import numpy as np
+
+sys.modules['spams'] = Mock()
+
+from staintools.stain_augmentor import StainAugmentor
+from tests.helpers import make_stained_image
+
+
+class TestStainAugmentor(unittest.TestCase):
+    def setUp(self):
+        self.image = make_stained_image()
+
+    def test_pop_batch_is_reproducible(self):
+        augmentor = StainAugmentor(method='macenko', solver='numpy')
+        augmentor.fit(self.image)
+
+        first = augmentor.pop_batch(5, rng=np.random.default_rng(42))
+        second = augmentor.pop_batch(5, rng=np.random.default_rng(42))
+
+        self.assertEqual((5,) + self.image.shape, first.shape)
+        self.assertEqual(np.uint8, first.dtype)
+        self.assertTrue(np.array_equal(first, second))
+
+    def test_pop_batch_writes_into_out(self):
+        augmentor = StainAugmentor(method='macenko', solver='numpy')
+        augmentor.fit(self.image)
+        out = np.zeros((3,) + self.image.shape, dtype=np.float32)
+
+        get = augmentor.pop_batch(3, rng=0, out=out)
+
+        self.assertIs(out, get)
+        self.assertTrue(out.max() <= 255)
+
+    def test_pop_batch_can_leave_background(self):
+        augmentor = StainAugmentor(method='macenko', sigma1=0.5, sigma2=0.5, augment_background=False, solver='numpy')
+        augmentor.fit(self.image)
+        background = ~augmentor.tissue_mask.reshape(self.image.shape[:2])
+        expect = np.clip(255 * np.exp(-1 * np.dot(augmentor.source_concentrations, augmentor.stain_matrix)), 0, 255)
+        expect = expect.reshape(self.image.shape).astype(np.float32)
+
+        get = augmentor.pop_batch(4, rng=0, dtype=np.float32)
+
+        for augmented in get:
+            with self.subTest():
+                self.assertTrue(np.allclose(expect[background], augmented[background], atol=1e-3))
+
+    def test_pop_batch_tissue_only(self):
+        full = StainAugmentor(method='macenko', solver='numpy')
+        full.fit(self.image)
+        tissue_only = StainAugmentor(method='macenko', solver='numpy', background='copy')
+        tissue_only.fit(self.image)
+        tissue = tissue_only.tissue_mask.reshape(self.image.shape[:2])
+
+        expect = full.pop_batch(3, rng=0)
+        get = tissue_only.pop_batch(3, rng=0)
+
+        self.assertEqual(tissue.sum(), tissue_only.source_concentrations.shape[0])
+        for expect_i, get_i in zip(expect, get):
+            with self.subTest():
+                self.assertTrue(np.array_equal(expect_i[tissue], get_i[tissue]))
+                self.assertTrue(np.array_equal(self.image[~tissue], get_i[~tissue]))
+
+    def test_pop_white_background(self):
+        augmentor = StainAugmentor(method='macenko', solver='numpy', background='white')
+        augmentor.fit(self.image)
+        background = ~augmentor.tissue_mask.reshape(self.image.shape[:2])
+
+        get = augmentor.pop(out=np.empty(self.image.shape, dtype=np.uint8))
+
+        self.assertTrue(np.all(get[background] == 255))
+
+    def test_quantized_concentrations(self):
+        exact = StainAugmentor(method='macenko', solver='numpy')
+        exact.fit(self.image)
+        quantized = StainAugmentor(method='macenko', solver='numpy', concentration_dtype=np.uint16)
+        quantized.fit(self.image)
+
+        expect = exact.pop_batch(2, rng=0, dtype=np.float32)
+        get = quantized.pop_batch(2, rng=0, dtype=np.float32)
+
+        self.assertLess(quantized.source_concentrations.nbytes, exact.source_concentrations.nbytes)
+        self.assertTrue(np.allclose(expect, get, atol=0.1))
+
+    def test_quantized_save_and_load(self):
+        augmentor = StainAugmentor(method='macenko', solver='numpy', concentration_dtype='float16')
+        augmentor.fit(self.image)
+        f = io.BytesIO()
+
+        augmentor.save(f)
+        f.seek(0)
+        loaded = StainAugmentor.load(f)
+
+        self.assertEqual('float16', loaded.concentration_dtype)
+        self.assertTrue(np.array_equal(augmentor.pop_batch(2, rng=0), loaded.pop_batch(2, rng=0)))
+
+    def test_estimation_scale(self):
+        image = np.repeat(np.repeat(self.image, 4, axis=0), 4, axis=1)
+        full = StainAugmentor(method='macenko', solver='numpy')
+        full.fit(image)
+        augmentor = StainAugmentor(method='macenko', solver='numpy', estimation_scale=0.25)
+        augmentor.fit(image)
+
+        self.assertEqual(full.source_concentrations.shape, augmentor.source_concentrations.shape)
+        self.assertTrue(np.allclose(full.stain_matrix, augmentor.stain_matrix, atol=0.02))
@@ -0,0 +1,191 @@
+import io
+import sys
+import unittest
+from unittest.mock import Mock
+import numpy as np
+
+sys.modules['spams'] = Mock()
+
+from staintools.stain_normalizer import StainNormalizer
+from staintools.tissue_masks.luminosity_threshold_tissue_locator import LuminosityThresholdTissueLocator
+from tests.helpers import make_stained_image
+
+
+class TestStainNormalizer(unittest.TestCase):
+    def setUp(self):
+        self.target = make_stained_image(seed=0)
+        self.image = make_stained_image(seed=1)
+        self.tissue = LuminosityThresholdTissueLocator.get_tissue_mask(self.image)
+
+    def test_transform_copies_background(self):
+        normalizer = StainNormalizer(method='macenko', solver='numpy', background='copy')
+        normalizer.fit(self.target)
+
+        get = normalizer.transform(self.image)
+
+        self.assertTrue(np.array_equal(self.image[~self.tissue], get[~self.tissue]))
+        self.assertFalse(np.array_equal(self.image[self.tissue], get[self.tissue]))
+
+    def test_transform_white_background(self):
+        normalizer = StainNormalizer(method='macenko', solver='numpy', background='white')
+        normalizer.fit(self.target)
+
+        get = normalizer.transform(self.image)
+
+        self.assertTrue(np.all(get[~self.tissue] == 255))
+
+    def test_transform_batch_tissue_only(self):
+        normalizer = StainNormalizer(method='macenko', solver='numpy', background='copy')
+        normalizer.fit(self.target)
+        images = np.stack([self.image, make_stained_image(seed=2)])
+
+        get = normalizer.transform_batch(images)
+
+        for image, get_i in zip(images, get):
+            with self.subTest():
+                self.assertTrue(np.array_equal(normalizer.transform(image), get_i))
+
+    def test_background_not_recognized(self):
+        with self.assertRaises(Exception):
+            StainNormalizer(method='macenko', background='black')
+
+    def test_warm_start_state_is_saved(self):
+        normalizer = StainNormalizer(method='vahadane_warm', solver='numpy', extractor_kwargs={'backend': 'numpy'})
+        normalizer.fit(self.target)
+        normalizer.transform(self.image)
+        f = io.BytesIO()
+
+        normalizer.save(f)
+        f.seek(0)
+        get = StainNormalizer.load(f)
+
+        self.assertEqual('vahadane_warm', get.get_params()['method'])
+        self.assertTrue(np.array_equal(normalizer.extractor.dictionary, get.extractor.dictionary))
+        self.assertTrue(np.array_equal(normalizer.transform(self.image), get.transform(self.image)))
+
+
+class TestTransformBatch(unittest.TestCase):
+    def setUp(self):
+        self.normalizer = StainNormalizer(method='macenko', solver='numpy')
+        self.normalizer.fit(make_stained_image(seed=0))
+        self.images = np.stack([make_stained_image(seed=seed) for seed in [1, 2, 3]])
+
+    def test_matches_transform(self):
+        get = self.normalizer.transform_batch(self.images)
+
+        self.assertEqual(self.images.shape, get.shape)
+        for image, get_i in zip(self.images, get):
+            with self.subTest():
+                self.assertTrue(np.array_equal(self.normalizer.transform(image), get_i))
+
+    def test_shared_stain_matrix_matches_transform_source(self):
+        stacked = self.images.reshape((-1,) + self.images.shape[2:])
+        stain_matrix_source = self.normalizer.extractor.get_stain_matrix(stacked)
+
+        get = self.normalizer.transform_batch(self.images, shared_stain_matrix=True)
+
+        for image, get_i in zip(self.images, get):
+            with self.subTest():
+                expect = self.normalizer.transform_source(image, stain_matrix_source,
+                                                          np.empty(image.shape, dtype=np.uint8))
+                self.assertTrue(np.array_equal(expect, get_i))
+
+    def test_writes_into_out(self):
+        out = np.zeros(self.images.shape, dtype=np.uint8)
+
+        get = self.normalizer.transform_batch(self.images, out=out)
+
+        self.assertIs(out, get)
+
+
+class TestStreamingFit(unittest.TestCase):
+    def setUp(self):
+        self.targets = [make_stained_image(shape=(32, 24), seed=seed) for seed in range(3)]
+
+    def fit_both(self, method, reservoir_size, extractor_kwargs=None):
+        expect = StainNormalizer(method=method, solver='numpy', extractor_kwargs=extractor_kwargs)
+        expect.fit(np.concatenate(self.targets))
+        get = StainNormalizer(method=method, solver='numpy', extractor_kwargs=extractor_kwargs)
+        get.fit_stream(self.targets, reservoir_size=reservoir_size)
+        return expect, get
+
+    def test_macenko_matches_fit(self):
+        expect, get = self.fit_both('macenko', reservoir_size=10000)
+
+        self.assertTrue(np.allclose(expect.stain_matrix_target, get.stain_matrix_target, atol=1e-6))
+        self.assertTrue(np.allclose(expect.maxC_target, get.maxC_target))
+
+    def test_vahadane_matches_fit(self):
+        expect, get = self.fit_both('vahadane', reservoir_size=10000, extractor_kwargs={'backend': 'numpy'})
+
+        self.assertTrue(np.allclose(expect.stain_matrix_target, get.stain_matrix_target, atol=1e-6))
+        self.assertTrue(np.allclose(expect.maxC_target, get.maxC_target))
+
+    def test_sampled_fit_within_tolerance(self):
+        for method, extractor_kwargs in [('macenko', None), ('vahadane', {'backend': 'numpy'})]:
+            with self.subTest(method=method):
+                expect, get = self.fit_both(method, reservoir_size=500, extractor_kwargs=extractor_kwargs)
+                self.assertTrue(np.allclose(expect.stain_matrix_target, get.stain_matrix_target, atol=0.02))
+                self.assertTrue(np.allclose(expect.maxC_target, get.maxC_target, rtol=0.05))
+
+    def test_partial_fit_then_finalize(self):
+        expect, _ = self.fit_both('macenko', reservoir_size=10000)
+        get = StainNormalizer(method='macenko', solver='numpy')
+
+        for target in self.targets:
+            get.partial_fit(target, reservoir_size=10000)
+        get.finalize()
+
+        self.assertTrue(np.allclose(expect.maxC_target, get.maxC_target))
+        self.assertIsNone(get.stream_statistics)
+
+    def test_finalize_without_partial_fit(self):
+        with self.assertRaises(AssertionError):
+            StainNormalizer(method='macenko', solver='numpy').finalize()
+
+
+def make_smooth_stained_image(shape=(16, 12), seed=0, factor=4):
+    """
+    Stained image made of factor x factor blocks of constant color, so downscaling by 1 / factor loses nothing.
+    """
+    image = make_stained_image(shape, seed=seed)
+    return np.repeat(np.repeat(image, factor, axis=0), factor, axis=1)
+
+
+class TestEstimationScale(unittest.TestCase):
+    def setUp(self):
+        self.target = make_stained_image(seed=0)
+        self.image = make_smooth_stained_image(seed=1)
+
+    def test_estimation_scale_matches_full_resolution(self):
+        expect = StainNormalizer(method='macenko', solver='numpy')
+        expect.fit(self.target)
+        normalizer = StainNormalizer(method='macenko', solver='numpy', estimation_scale=0.25)
+        normalizer.fit(self.target)
+
+        get = normalizer.transform(self.image)
+
+        self.assertEqual(self.image.shape, get.shape)
+        self.assertLessEqual(np.abs(expect.transform(self.image).astype(int) - get).max(), 2)
+
+    def test_estimation_image(self):
+        normalizer = StainNormalizer(method='macenko', solver='numpy', estimation_scale=0.25)
+        normalizer.fit(self.target)
+        full = StainNormalizer(method='macenko', solver='numpy')
+        full.fit(self.target)
+        small = self.image[::4, ::4]
+
+        self.assertTrue(np.array_equal(normalizer.transform(self.image), full.transform(self.image,
+                                                                                        estimation_image=small)))
+
+    def test_transform_batch(self):
+        normalizer = StainNormalizer(method='macenko', solver='numpy', estimation_scale=0.5, background='copy')
+        normalizer.fit(self.target)
+        images = np.stack([self.image, make_smooth_stained_image(seed=2)])
+
+        separate = normalizer.transform_batch(images)
+        shared = normalizer.transform_batch(images, shared_stain_matrix=True)
+
+        for image, get in zip(images, separate):
+            self.assertTrue(np.array_equal(normalizer.transform(image), get))
+        self.assertEqual(images.shape, shared.shape)
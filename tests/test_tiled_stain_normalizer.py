@@ -0,0 +1,80 @@
+import sys
+import unittest
+from unittest.mock import Mock
+import numpy as np
+
+sys.modules['spams'] = Mock()
+
+from staintools.stain_normalizer import StainNormalizer
+from staintools.tiled_stain_normalizer import BYTES_PER_PIXEL, TiledStainNormalizer
+from tests.helpers import make_stained_image
+
+
+class TestTiledStainNormalizer(unittest.TestCase):
+    def setUp(self):
+        self.normalizer = StainNormalizer(method='macenko', solver='numpy')
+        self.normalizer.fit(make_stained_image(seed=0))
+        self.image = make_stained_image(seed=1)
+        self.stain_matrix_source = self.normalizer.extractor.get_stain_matrix(self.image)
+        self.maxC_source = np.array([[1.2, 0.9]])
+
+    def test_matches_stain_normalizer(self):
+        tiled = TiledStainNormalizer(self.normalizer, tile_size=5)
+        expect = self.normalizer.transform_source(self.image, self.stain_matrix_source,
+                                                  np.empty(self.image.shape, dtype=np.uint8), self.maxC_source)
+
+        get = tiled.transform(self.image, stain_matrix_source=self.stain_matrix_source, maxC_source=self.maxC_source)
+
+        self.assertTrue(np.array_equal(expect, get))
+
+    def test_no_seams_between_tiles(self):
+        whole = TiledStainNormalizer(self.normalizer, tile_size=16)
+        expect = whole.transform(self.image, stain_matrix_source=self.stain_matrix_source,
+                                 maxC_source=self.maxC_source)
+        for tile_size in [3, 4, 7]:
+            with self.subTest(tile_size=tile_size):
+                tiled = TiledStainNormalizer(self.normalizer, tile_size=tile_size)
+                get = tiled.transform(self.image, stain_matrix_source=self.stain_matrix_source,
+                                      maxC_source=self.maxC_source)
+                self.assertTrue(np.array_equal(expect, get))
+
+    def test_fits_each_slide(self):
+        other = make_stained_image(seed=2)
+        tiled = TiledStainNormalizer(self.normalizer, tile_size=4)
+        tiled.transform(self.image)
+
+        get = tiled.transform(other)
+
+        self.assertTrue(np.array_equal(TiledStainNormalizer(self.normalizer, tile_size=4).transform(other), get))
+
+    def test_reuses_given_stain_matrix(self):
+        tiled = TiledStainNormalizer(self.normalizer, tile_size=4)
+
+        tiled.transform(make_stained_image(seed=2), stain_matrix_source=self.stain_matrix_source)
+
+        self.assertTrue(np.array_equal(self.stain_matrix_source, tiled.stain_matrix_source))
+
+    def test_tile_size_within_memory_budget(self):
+        for memory_budget in [2 ** 16, 10 ** 6, 256 * 2 ** 20]:
+            with self.subTest(memory_budget=memory_budget):
+                tiled = TiledStainNormalizer(self.normalizer, memory_budget=memory_budget)
+                tiles = tiled.get_tiles((5000, 3000, 3))
+                max_pixels = max((rows.stop - rows.start) * (cols.stop - cols.start) for rows, cols in tiles)
+                self.assertLessEqual(max_pixels * BYTES_PER_PIXEL, memory_budget)
+
+        with self.assertRaises(AssertionError):
+            TiledStainNormalizer(self.normalizer, tile_size=100, memory_budget=100 ** 2 * BYTES_PER_PIXEL - 1)
+
+    def test_transform_copies_background(self):
+        normalizer = StainNormalizer(method='macenko', solver='numpy', background='copy')
+        normalizer.fit(make_stained_image(seed=0))
+        image = make_stained_image(seed=1)
+        tiled = TiledStainNormalizer(normalizer, tile_size=4)
+
+        get = tiled.transform(image)
+
+        self.assertTrue(np.array_equal(image[:4], get[:4]))  # The background rows.
+
+
+if __name__ == '__main__':
+    unittest.main()
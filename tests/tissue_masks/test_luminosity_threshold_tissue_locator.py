@@ -2,10 +2,13 @@ import sys
 import unittest
 from unittest.mock import Mock
 import numpy as np
+import cv2 as cv
 
 sys.modules['spams'] = Mock()
 
+from staintools.stain_extraction.macenko_stain_extractor import MacenkoStainExtractor
 from staintools.tissue_masks.luminosity_threshold_tissue_locator import LuminosityThresholdTissueLocator
+from staintools.tissue_masks.tissue_mask import TissueMask
 from staintools.utils.exceptions import TissueMaskException
 
 
@@ -48,3 +51,35 @@ class TestLuminosityThresholdTissueLocator(unittest.TestCase):
             raises = True
 
         self.assertTrue(raises)
+
+    def test_agrees_with_LAB_lightness(self):
+        image = np.random.randint(0, 256, size=(100, 100, 3), dtype=np.uint8)
+        lightness = cv.cvtColor(image, cv.COLOR_RGB2LAB)[:, :, 0]
+
+        for luminosity_threshold in [0.5, 0.8, 0.9]:
+            with self.subTest(luminosity_threshold=luminosity_threshold):
+                expect = lightness / 255.0 < luminosity_threshold
+                get = LuminosityThresholdTissueLocator.get_tissue_mask(image, luminosity_threshold)
+                self.assertTrue(np.mean(expect != get) < 0.005)
+
+    def test_downsampled_mask_is_upsampled(self):
+        small = np.random.randint(100, 256, size=(5, 4, 3), dtype=np.uint8)
+        image = np.repeat(np.repeat(small, 4, axis=0), 4, axis=1)[:18, :15]
+        expect = LuminosityThresholdTissueLocator.get_tissue_mask(image)
+
+        get = LuminosityThresholdTissueLocator.locate(image, downsample=4)
+
+        self.assertIsInstance(get, TissueMask)
+        self.assertEqual(4, get.downsample)
+        self.assertTrue(np.array_equal(expect, get.mask))
+
+    def test_extractor_reuses_precomputed_mask(self):
+        image = np.random.randint(0, 256, size=(20, 20, 3), dtype=np.uint8)
+        tissue_mask = LuminosityThresholdTissueLocator.locate(image)
+        expect = MacenkoStainExtractor.get_stain_matrix(image)
+
+        get = MacenkoStainExtractor.get_stain_matrix(image, tissue_mask=tissue_mask)
+
+        self.assertTrue(np.allclose(expect, get))
+        with self.assertRaises(TissueMaskException):
+            MacenkoStainExtractor.get_stain_matrix(image, tissue_mask=np.zeros((20, 20), dtype=bool))
@@ -0,0 +1,52 @@
+import sys
+import unittest
+from unittest.mock import Mock
+import numpy as np
+
+sys.modules['spams'] = Mock()
+
+from staintools.utils.dictionary_learning import nonnegative_dictionary_learning
+
+
+class TestDictionaryLearning(unittest.TestCase):
+    def setUp(self):
+        self.dictionary = np.array([[0.65, 0.70, 0.29],
+                                    [0.07, 0.99, 0.11]])
+        self.dictionary /= np.linalg.norm(self.dictionary, axis=1)[:, None]
+        rng = np.random.default_rng(0)
+        codes = rng.exponential(0.5, (20000, 2)) * (rng.random((20000, 2)) < 0.7)
+        self.X = np.dot(codes, self.dictionary)
+
+    def get_max_angle(self, dictionary):
+        dictionary = dictionary / np.linalg.norm(dictionary, axis=1)[:, None]
+        if dictionary[0, 0] < dictionary[1, 0]:
+            dictionary = dictionary[[1, 0]]
+        cosines = np.clip(np.sum(dictionary * self.dictionary, axis=1), -1, 1)
+        return np.degrees(np.arccos(cosines)).max()
+
+    def test_recovers_dictionary(self):
+        dictionary, n_iter = nonnegative_dictionary_learning(self.X, regularizer=0.01)
+
+        self.assertTrue(np.all(dictionary >= 0))
+        self.assertTrue(np.all(np.linalg.norm(dictionary, axis=1) <= 1 + 1e-9))
+        self.assertLess(self.get_max_angle(dictionary), 2)
+        self.assertLess(n_iter, 100)
+
+    def test_warm_start_converges_faster(self):
+        cold, n_cold = nonnegative_dictionary_learning(self.X, regularizer=0.01)
+
+        warm, n_warm = nonnegative_dictionary_learning(self.X[::2], regularizer=0.01, init_dictionary=cold)
+
+        self.assertLess(n_warm, n_cold / 2)
+        self.assertTrue(np.allclose(cold, warm, atol=1e-3))
+
+    def test_mini_batches(self):
+        dictionary, n_iter = nonnegative_dictionary_learning(self.X, regularizer=0.01, n_iter=50, tol=None,
+                                                             batch_size=1000)
+
+        self.assertEqual(50, n_iter)
+        self.assertLess(self.get_max_angle(dictionary), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import sys
+import unittest
+from unittest.mock import Mock
+import numpy as np
+
+sys.modules['spams'] = Mock()
+
+from staintools.utils.get_concentrations import get_concentrations, nonnegative_lasso
+
+
+def projected_gradient_lasso(OD, stain_matrix, regularizer, n_iter=5000):
+    """
+    Slow reference solver for the non-negative lasso.
+    """
+    gram = np.dot(stain_matrix, stain_matrix.T)
+    step = 1 / np.linalg.eigvalsh(gram).max()
+    b = np.dot(OD, stain_matrix.T)
+    C = np.zeros((OD.shape[0], stain_matrix.shape[0]))
+    for _ in range(n_iter):
+        C = np.maximum(C - step * (np.dot(C, gram) - b + regularizer), 0)
+    return C
+
+
+class TestGetConcentrations(unittest.TestCase):
+    def setUp(self):
+        stain_matrix = np.array([[0.65, 0.70, 0.29],
+                                 [0.07, 0.99, 0.11]])
+        self.stain_matrix = stain_matrix / np.linalg.norm(stain_matrix, axis=1)[:, None]
+
+    def test_nonnegative_lasso_matches_reference(self):
+        OD = np.random.uniform(0, 2, [200, 3])
+
+        get = nonnegative_lasso(OD, self.stain_matrix, 0.01)
+        expect = projected_gradient_lasso(OD, self.stain_matrix, 0.01)
+
+        self.assertTrue(np.allclose(expect, get, atol=1e-6))
+
+    def test_nonnegative_lasso_is_batched(self):
+        OD = np.random.uniform(0, 2, [2, 50, 3])
+        stain_matrices = np.stack([self.stain_matrix, self.stain_matrix[::-1]])
+
+        get = nonnegative_lasso(OD, stain_matrices)
+
+        for i in range(2):
+            with self.subTest():
+                self.assertTrue(np.allclose(nonnegative_lasso(OD[i], stain_matrices[i]), get[i]))
+
+    def test_numpy_solver_does_not_use_spams(self):
+        rgb = np.random.randint(0, 256, [6, 5, 3]).astype(np.uint8)
+
+        get = get_concentrations(rgb, self.stain_matrix, solver='numpy')
+
+        self.assertEqual((30, 2), get.shape)
+        self.assertTrue(np.all(get >= 0))
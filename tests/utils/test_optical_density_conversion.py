@@ -6,20 +6,40 @@ import numpy as np
 sys.modules['spams'] = Mock()
 
 from staintools.utils.optical_density_conversion import convert_RGB_to_OD, convert_OD_to_RGB
+from staintools.utils.dtype_policy import default_dtype
 
 
 class TestOpticalDensityConversion(unittest.TestCase):
     def test_convert_RGB_to_OD(self):
         rgb = np.random.randint(0, 256, [7, 2, 3])
 
-        get = convert_RGB_to_OD(rgb)
+        get = convert_RGB_to_OD(rgb, dtype=np.float64)
 
         for i in range(3):
             for j in range(2):
                 for k in range(3):
-                    expect = -1 * np.log(rgb[i, j, k] / 255)
+                    expect = max(-1 * np.log(max(rgb[i, j, k], 1) / 255), 1e-6)
                     self.assertAlmostEqual(expect, get[i, j, k])
 
+    def test_convert_RGB_to_OD_lookup_table_matches_direct_conversion(self):
+        rgb = np.random.randint(0, 256, [7, 2, 3])
+        rgb[0, 0, 0] = 0
+        rgb_uint8 = rgb.astype(np.uint8)
+
+        expect = convert_RGB_to_OD(rgb, dtype=np.float64)
+
+        self.assertTrue(np.array_equal(expect, convert_RGB_to_OD(rgb_uint8, dtype=np.float64)))
+        self.assertTrue(np.allclose(expect, convert_RGB_to_OD(rgb_uint8, dtype=np.float32)))
+        self.assertEqual(np.float32, convert_RGB_to_OD(rgb_uint8, dtype=np.float32).dtype)
+
+    def test_convert_RGB_to_OD_does_not_modify_input(self):
+        rgb = np.zeros([2, 2, 3], dtype=np.uint8)
+
+        convert_RGB_to_OD(rgb)
+        convert_RGB_to_OD(rgb.astype(int))
+
+        self.assertEqual(0, rgb.max())
+
     def test_convert_OD_to_RGB(self):
         od = np.random.uniform(0, 1, [4, 5, 3])
 
@@ -30,3 +50,11 @@ class TestOpticalDensityConversion(unittest.TestCase):
                 for k in range(3):
                     expect = (255 * np.exp(-1 * od[i, j, k])).astype(np.uint8)
                     self.assertAlmostEqual(expect, get[i, j, k])
+
+    def test_convert_RGB_to_OD_follows_dtype_policy(self):
+        rgb = np.random.randint(0, 256, [3, 4, 3]).astype(np.uint8)
+
+        self.assertEqual(np.float32, convert_RGB_to_OD(rgb).dtype)
+        with default_dtype(np.float64):
+            self.assertEqual(np.float64, convert_RGB_to_OD(rgb).dtype)
+        self.assertEqual(np.float32, convert_RGB_to_OD(rgb).dtype)
@@ -0,0 +1,53 @@
+import sys
+import unittest
+from unittest.mock import Mock
+import numpy as np
+
+sys.modules['spams'] = Mock()
+
+from staintools.utils.pixel_sampling import sample_pixel_indices
+
+
+class TestPixelSampling(unittest.TestCase):
+    def setUp(self):
+        self.mask = np.random.uniform(0, 1, [40, 30]) < 0.7
+
+    def test_keeps_all_pixels_by_default(self):
+        get = sample_pixel_indices(self.mask)
+
+        self.assertTrue(np.array_equal(np.flatnonzero(self.mask), get))
+
+    def test_sample_is_deterministic_subset(self):
+        first = sample_pixel_indices(self.mask, max_pixels=100, random_state=3)
+        second = sample_pixel_indices(self.mask, max_pixels=100, random_state=3)
+
+        self.assertEqual(100, len(first))
+        self.assertTrue(np.array_equal(first, second))
+        self.assertTrue(np.all(self.mask.ravel()[first]))
+        self.assertEqual(100, len(np.unique(first)))
+
+    def test_sample_fraction(self):
+        get = sample_pixel_indices(self.mask, sample_fraction=0.5)
+
+        self.assertEqual(int(np.ceil(0.5 * self.mask.sum())), len(get))
+
+    def test_stratified_sample_covers_every_block(self):
+        mask = np.ones([40, 40], dtype=bool)
+
+        get = sample_pixel_indices(mask, max_pixels=160, block_size=10)
+
+        rows, columns = get // 40, get % 40
+        blocks = (rows // 10) * 4 + columns // 10
+        self.assertTrue(np.array_equal(np.full(16, 10), np.bincount(blocks, minlength=16)))
+
+    def test_stratified_sample_with_many_blocks(self):
+        # Block 2 ** 16 (top right) would wrap to block 0 (where the last pixel is) if the ids were cast to uint16.
+        w = 2 * (2 ** 16 + 1)
+        mask = np.zeros([2, w], dtype=bool)
+        mask[0, 2 * 2 ** 16:] = True
+        mask[1, :2] = True
+
+        for random_state in range(8):
+            get = sample_pixel_indices(mask, sample_fraction=0.5, random_state=random_state, block_size=2)
+            self.assertEqual([0, 1], sorted(((get % w) // 2 == 0).astype(int)))
+
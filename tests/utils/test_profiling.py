@@ -0,0 +1,60 @@
+import sys
+import unittest
+from unittest.mock import Mock
+import numpy as np
+
+sys.modules['spams'] = Mock()
+
+from staintools.utils.optical_density_conversion import convert_RGB_to_OD
+from staintools.utils.profiling import profile, stage
+
+
+class TestProfiling(unittest.TestCase):
+    def test_stages_are_not_recorded_when_disabled(self):
+        with profile() as profiler:
+            pass
+        convert_RGB_to_OD(np.zeros([2, 2, 3], dtype=np.uint8))
+
+        self.assertEqual({}, profiler.as_dict())
+
+    def test_records_stages(self):
+        with profile(track_memory=True) as profiler:
+            convert_RGB_to_OD(np.zeros([4, 5, 3], dtype=np.uint8))
+            with stage('custom', pixels=3):
+                np.ones(1000)
+            with stage('custom', pixels=4):
+                pass
+
+        get = profiler.as_dict()
+
+        self.assertEqual(1, get['optical_density']['calls'])
+        self.assertEqual(20, get['optical_density']['pixels'])
+        self.assertEqual(2, get['custom']['calls'])
+        self.assertEqual(7, get['custom']['pixels'])
+        self.assertTrue(get['custom']['bytes'] >= 8000)
+
+    def test_nested_stage_keeps_outer_peak(self):
+        with profile(track_memory=True) as profiler:
+            with stage('outer'):
+                big = np.ones(10 ** 6)
+                del big
+                with stage('inner'):
+                    np.ones(1000)
+                with stage('inner'):
+                    pass
+
+        get = profiler.as_dict()
+
+        self.assertGreaterEqual(get['outer']['bytes'], 8 * 10 ** 6)
+        self.assertLess(get['inner']['bytes'], 10 ** 6)
+        self.assertGreaterEqual(get['inner']['bytes'], 8000)
+
+    def test_prometheus_export(self):
+        with profile() as profiler:
+            with stage('custom', pixels=3):
+                pass
+
+        get = profiler.to_prometheus()
+
+        self.assertIn('staintools_stage_calls_total{stage="custom"} 1', get)
+        self.assertIn('staintools_stage_pixels_total{stage="custom"} 3', get)
@@ -0,0 +1,56 @@
+import sys
+import unittest
+from unittest.mock import Mock
+import numpy as np
+
+sys.modules['spams'] = Mock()
+
+from staintools.utils.quantiles import histogram_percentile, QuantileSketch, approximate_percentile
+
+
+class TestQuantiles(unittest.TestCase):
+    def test_histogram_percentile_is_exact(self):
+        I = np.random.randint(0, 256, [31, 17]).astype(np.uint8)
+        q = [0, 5, 37.3, 95, 100]
+
+        get = histogram_percentile(I, q)
+
+        self.assertTrue(np.allclose(np.percentile(I.astype(float), q), get))
+
+    def test_sketch_relative_error_is_bounded(self):
+        x = np.concatenate([np.random.gamma(2, 0.5, 20000), -np.random.uniform(0.1, 3, 5000), np.zeros(100)])
+        sketch = QuantileSketch(relative_accuracy=0.01)
+        sketch.update(x)
+
+        for q in [1, 25, 50, 99]:
+            with self.subTest():
+                expect = np.percentile(x, q)
+                self.assertTrue(abs(sketch.percentile(q) - expect) <= 0.01 * abs(expect) + 1e-9)
+
+    def test_merged_sketches_equal_one_sketch(self):
+        x = np.random.uniform(0, 10, 1000)
+        whole, first, second = QuantileSketch(), QuantileSketch(), QuantileSketch()
+        whole.update(x)
+        first.update(x[:300])
+        second.update(x[300:])
+
+        first.merge(second)
+
+        self.assertEqual(whole.percentile(99), first.percentile(99))
+
+    def test_approximate_percentile_along_axis(self):
+        X = np.random.uniform(1, 2, [3, 500, 2])
+
+        get = approximate_percentile(X, 99, axis=1)
+
+        self.assertEqual((3, 2), get.shape)
+        self.assertTrue(np.allclose(np.percentile(X, 99, axis=1), get, rtol=0.01))
+
+    def test_approximate_percentiles_along_axis(self):
+        X = np.random.uniform(1, 2, [3, 500, 2])
+        q = np.array([[1, 50], [90, 99]])
+
+        get = approximate_percentile(X, q, axis=1)
+
+        self.assertEqual((2, 2, 3, 2), get.shape)
+        self.assertTrue(np.allclose(np.percentile(X, q, axis=1), get, rtol=0.01))
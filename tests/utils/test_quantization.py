@@ -0,0 +1,58 @@
+import sys
+import unittest
+from unittest.mock import Mock
+import numpy as np
+
+sys.modules['spams'] = Mock()
+
+from staintools.utils.quantization import QuantizedArray
+
+
+class TestQuantization(unittest.TestCase):
+    def setUp(self):
+        self.values = np.random.uniform(0, 3, [1000, 2]).astype(np.float32)
+
+    def test_uint16_error_is_bounded(self):
+        quantized = QuantizedArray(self.values, np.uint16)
+        value_range = self.values.max(axis=0) - self.values.min(axis=0)
+
+        error = np.abs(quantized.dequantize() - self.values).max(axis=0)
+
+        self.assertEqual(np.uint16, quantized.data.dtype)
+        self.assertLess(quantized.nbytes, self.values.nbytes / 2 + 100)
+        self.assertTrue(np.all(error <= value_range / 131070 + 1e-6))
+
+    def test_float16(self):
+        quantized = QuantizedArray(self.values, np.float16)
+
+        self.assertTrue(np.allclose(self.values, quantized.dequantize(), rtol=1e-3))
+
+    def test_rows_are_dequantized(self):
+        quantized = QuantizedArray(self.values, np.uint16)
+
+        self.assertTrue(np.array_equal(quantized.dequantize()[10:20], quantized[10:20]))
+
+    def test_constant_column(self):
+        values = np.ones([5, 2])
+
+        self.assertTrue(np.array_equal(values, QuantizedArray(values, np.uint16).dequantize()))
+
+    def test_sparse_rows_of_zeros(self):
+        values = self.values.copy()
+        values[np.random.uniform(0, 1, 1000) < 0.5] = 0
+        quantized = QuantizedArray(values, np.uint16, sparse=True)
+        expect = quantized.dequantize()
+
+        self.assertEqual(np.count_nonzero(values.any(axis=1)), quantized.data.shape[0])
+        self.assertTrue(np.all(expect[~values.any(axis=1)] == 0))
+        for start, stop in [(0, 1000), (3, 3), (10, 517), (999, 1000)]:
+            with self.subTest(start=start, stop=stop):
+                self.assertTrue(np.array_equal(expect[start:stop], quantized[start:stop]))
+
+    def test_arrays_round_trip(self):
+        quantized = QuantizedArray(self.values, np.float16, sparse=True)
+
+        get = QuantizedArray.from_arrays(quantized.get_arrays())
+
+        self.assertEqual(quantized.shape, get.shape)
+        self.assertTrue(np.array_equal(quantized.dequantize(), np.asarray(get)))
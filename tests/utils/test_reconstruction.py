@@ -0,0 +1,106 @@
+import sys
+import unittest
+from unittest.mock import Mock
+import numpy as np
+
+sys.modules['spams'] = Mock()
+
+from staintools.utils import reconstruction
+from staintools.utils.quantization import QuantizedArray
+from staintools.utils.reconstruction import reconstruct_RGB, get_available_backends
+
+
+class TestReconstruction(unittest.TestCase):
+    def setUp(self):
+        self.concentrations = np.random.uniform(-0.5, 3, (1000, 2)).astype(np.float32)
+        self.stain_matrix = np.array([[0.65, 0.70, 0.29],
+                                      [0.07, 0.99, 0.11]])
+        self.offset = np.array([0.1, -0.2, 0.0])
+
+    def get_expected(self):
+        OD = np.dot(self.concentrations.astype(np.float64), self.stain_matrix) + self.offset
+        return np.clip(255 * np.exp(-1 * OD), 0, 255)
+
+    def test_backends_agree_with_reference(self):
+        expect = self.get_expected()
+        for backend in get_available_backends():
+            with self.subTest(backend=backend):
+                get = reconstruct_RGB(self.concentrations, self.stain_matrix, offset=self.offset, dtype=np.float32,
+                                      backend=backend)
+                self.assertTrue(np.allclose(expect, get, atol=1e-3))
+                get = reconstruct_RGB(self.concentrations, self.stain_matrix, offset=self.offset, backend=backend)
+                self.assertEqual(np.uint8, get.dtype)
+                self.assertTrue(np.abs(expect.astype(np.uint8).astype(int) - get).max() <= 1)
+
+    def test_blocks(self):
+        original_block_size = reconstruction.BLOCK_SIZE
+        reconstruction.BLOCK_SIZE = 64
+        try:
+            get = reconstruct_RGB(self.concentrations, self.stain_matrix, offset=self.offset, dtype=np.float32,
+                                  backend='numpy')
+        finally:
+            reconstruction.BLOCK_SIZE = original_block_size
+
+        self.assertTrue(np.allclose(self.get_expected(), get, atol=1e-3))
+
+    def test_writes_into_image_shaped_out(self):
+        out = np.zeros((2, 40, 25, 3), dtype=np.uint8)
+
+        get = reconstruct_RGB(self.concentrations, self.stain_matrix, out=out[1])
+        non_contiguous = np.zeros((40, 50, 3), dtype=np.uint8)[:, ::2]
+        reconstruct_RGB(self.concentrations, self.stain_matrix, out=non_contiguous)
+
+        self.assertTrue(np.shares_memory(out, get))
+        self.assertTrue(np.array_equal(out[1], non_contiguous))
+        self.assertFalse(out[0].any())
+
+    def test_unknown_backend(self):
+        with self.assertRaises(Exception):
+            reconstruct_RGB(self.concentrations, self.stain_matrix, backend='gpu')
+
+    def test_quantized_concentrations(self):
+        self.concentrations = np.maximum(self.concentrations, 0)
+        self.concentrations[100:400] = 0
+        original_block_size = reconstruction.BLOCK_SIZE
+        reconstruction.BLOCK_SIZE = 64
+        try:
+            for storage_dtype in [np.uint16, np.float16]:
+                quantized = QuantizedArray(self.concentrations, storage_dtype, sparse=True)
+                expect = reconstruct_RGB(quantized.dequantize(), self.stain_matrix, offset=self.offset,
+                                         dtype=np.float32)
+                for backend in get_available_backends():
+                    with self.subTest(storage_dtype=storage_dtype, backend=backend):
+                        get = reconstruct_RGB(quantized, self.stain_matrix, offset=self.offset, dtype=np.float32,
+                                              backend=backend)
+                        self.assertTrue(np.allclose(expect, get, atol=1e-3))
+        finally:
+            reconstruction.BLOCK_SIZE = original_block_size
+
+
+    @unittest.skipUnless('numba' in get_available_backends(), "Numba is not installed.")
+    def test_numba_backend_matches_numpy(self):
+        self.concentrations = np.maximum(self.concentrations, 0)
+        self.concentrations[100:400] = 0
+        quantized = QuantizedArray(self.concentrations, sparse=True)
+        quantized.get_codes = Mock(side_effect=quantized.get_codes)
+        original_block_size = reconstruction.BLOCK_SIZE
+        reconstruction.BLOCK_SIZE = 64
+        try:
+            for concentrations in [self.concentrations, quantized]:
+                for dtype in [np.float32, np.uint8]:
+                    with self.subTest(quantized=concentrations is quantized, dtype=dtype):
+                        expect = reconstruct_RGB(concentrations, self.stain_matrix, offset=self.offset, dtype=dtype,
+                                                 backend='numpy')
+                        get = reconstruct_RGB(concentrations, self.stain_matrix, offset=self.offset, dtype=dtype,
+                                              backend='numba')
+                        tolerance = 1e-3 if dtype == np.float32 else 1
+                        self.assertLessEqual(np.abs(expect.astype(float) - get).max(), tolerance)
+        finally:
+            reconstruction.BLOCK_SIZE = original_block_size
+
+        # The quantized concentrations are dequantized block by block.
+        self.assertLessEqual(max(stop - start for (start, stop), _ in quantized.get_codes.call_args_list), 64)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import io
+import sys
+import tempfile
+import unittest
+from unittest.mock import Mock
+import numpy as np
+
+sys.modules['spams'] = Mock()
+
+from staintools.reinhard_color_normalizer import ReinhardColorNormalizer
+from staintools.stain_normalizer import StainNormalizer
+from staintools.utils.fit_cache import FitCache
+from staintools.utils.serialization import save_state, load_state
+
+
+class TestSerialization(unittest.TestCase):
+    def test_round_trip(self):
+        f = io.BytesIO()
+        arrays = {'a': np.random.uniform(0, 1, [3, 2]), 'b': np.arange(4)}
+
+        save_state(f, 'Thing', {'method': 'macenko'}, arrays)
+        f.seek(0)
+        params, get = load_state(f, 'Thing')
+
+        self.assertEqual({'method': 'macenko'}, params)
+        for key in arrays:
+            self.assertTrue(np.array_equal(arrays[key], get[key]))
+
+    def test_round_trip_array_params(self):
+        f = io.BytesIO()
+        params = {'method': 'vahadane', 'extractor_kwargs': {'init_dictionary': np.eye(2, 3), 'n_iter': 5}}
+
+        save_state(f, 'Thing', params, {'a': np.arange(3)})
+        f.seek(0)
+        get, arrays = load_state(f, 'Thing')
+
+        self.assertEqual(['a'], list(arrays))
+        self.assertEqual(5, get['extractor_kwargs']['n_iter'])
+        self.assertTrue(np.array_equal(np.eye(2, 3), get['extractor_kwargs']['init_dictionary']))
+
+    def test_load_state_rejects_other_class(self):
+        f = io.BytesIO()
+        save_state(f, 'Thing', {}, {})
+        f.seek(0)
+
+        with self.assertRaises(Exception):
+            load_state(f, 'OtherThing')
+
+    def test_fit_cache_loads_saved_fit(self):
+        target = np.random.randint(0, 256, [9, 7, 3]).astype(np.uint8)
+        I = np.random.randint(0, 256, [5, 4, 3]).astype(np.uint8)
+
+        with tempfile.TemporaryDirectory() as directory:
+            cache = FitCache(directory)
+            first = cache.fit(ReinhardColorNormalizer(), target)
+            second = cache.fit(ReinhardColorNormalizer(), target)
+
+        self.assertIsNot(first, second)
+        self.assertTrue(np.array_equal(first.transform(I), second.transform(I)))
+
+    def test_fit_cache_with_array_params(self):
+        target = np.random.RandomState(0).randint(0, 256, [9, 7, 3]).astype(np.uint8)
+        extractor_kwargs = {'backend': 'numpy', 'n_iter': 5,
+                            'init_dictionary': np.array([[0.65, 0.70, 0.29], [0.07, 0.99, 0.11]])}
+        other_kwargs = dict(extractor_kwargs, init_dictionary=extractor_kwargs['init_dictionary'][::-1].copy())
+
+        with tempfile.TemporaryDirectory() as directory:
+            cache = FitCache(directory)
+            first = cache.fit(StainNormalizer('vahadane', solver='numpy', extractor_kwargs=extractor_kwargs), target)
+            second = cache.fit(StainNormalizer('vahadane', solver='numpy', extractor_kwargs=extractor_kwargs), target)
+
+        self.assertIsNot(first, second)
+        self.assertTrue(np.array_equal(extractor_kwargs['init_dictionary'],
+                                       second.extractor_kwargs['init_dictionary']))
+        self.assertTrue(np.array_equal(first.stain_matrix_target, second.stain_matrix_target))
+        self.assertNotEqual(cache.get_key(first, target),
+                            cache.get_key(StainNormalizer('vahadane', extractor_kwargs=other_kwargs), target))
@@ -0,0 +1,87 @@
+import pickle
+import sys
+import tempfile
+import unittest
+from unittest.mock import Mock
+import numpy as np
+
+sys.modules['spams'] = Mock()
+
+from staintools.stain_extraction.macenko_stain_extractor import MacenkoStainExtractor
+from staintools.stain_normalizer import StainNormalizer
+from staintools.utils.stain_matrix_cache import StainMatrixCache
+from tests.helpers import make_stained_image
+
+
+class TestStainMatrixCache(unittest.TestCase):
+    def test_hits_and_misses(self):
+        cache = StainMatrixCache()
+        I = make_stained_image()
+
+        first = cache.get_stain_matrix(MacenkoStainExtractor, I)
+        second = cache.get_stain_matrix(MacenkoStainExtractor, I)
+        cache.get_stain_matrix(MacenkoStainExtractor, I, luminosity_threshold=0.7)
+
+        self.assertTrue(np.array_equal(MacenkoStainExtractor.get_stain_matrix(I), first))
+        self.assertTrue(np.array_equal(first, second))
+        self.assertEqual({'hits': 1, 'disk_hits': 0, 'misses': 2, 'entries': 2}, cache.get_stats())
+
+    def test_least_recently_used_is_evicted(self):
+        cache = StainMatrixCache(max_entries=2)
+        images = [make_stained_image(seed=seed) for seed in range(3)]
+
+        cache.get_stain_matrix(MacenkoStainExtractor, images[0])
+        cache.get_stain_matrix(MacenkoStainExtractor, images[1])
+        cache.get_stain_matrix(MacenkoStainExtractor, images[0])
+        cache.get_stain_matrix(MacenkoStainExtractor, images[2])  # Evicts images[1].
+        cache.get_stain_matrix(MacenkoStainExtractor, images[0])
+        cache.get_stain_matrix(MacenkoStainExtractor, images[1])
+
+        self.assertEqual({'hits': 2, 'disk_hits': 0, 'misses': 4, 'entries': 2}, cache.get_stats())
+
+    def test_slide_id_is_the_key(self):
+        cache = StainMatrixCache()
+
+        first = cache.get_stain_matrix(MacenkoStainExtractor, make_stained_image(seed=0), slide_id='slide')
+        second = cache.get_stain_matrix(MacenkoStainExtractor, make_stained_image(seed=1), slide_id='slide')
+
+        self.assertTrue(np.array_equal(first, second))
+        self.assertEqual(1, cache.get_stats()['hits'])
+
+    def test_disk_tier_is_shared(self):
+        I = make_stained_image()
+        with tempfile.TemporaryDirectory() as directory:
+            expect = StainMatrixCache(directory=directory).get_stain_matrix(MacenkoStainExtractor, I)
+            cache = pickle.loads(pickle.dumps(StainMatrixCache(directory=directory)))
+
+            get = cache.get_stain_matrix(MacenkoStainExtractor, I)
+
+            self.assertTrue(np.array_equal(expect, get))
+            self.assertEqual({'hits': 0, 'disk_hits': 1, 'misses': 0, 'entries': 1}, cache.get_stats())
+
+    def test_normalizer_uses_cache(self):
+        target = make_stained_image(seed=0)
+        I = make_stained_image(seed=1)
+        expect = StainNormalizer(method='macenko', solver='numpy')
+        expect.fit(target)
+        normalizer = StainNormalizer(method='macenko', solver='numpy', cache=StainMatrixCache())
+        normalizer.fit(target)
+
+        first = normalizer.transform(I)
+        second = normalizer.transform(I)
+
+        self.assertTrue(np.array_equal(expect.transform(I), first))
+        self.assertTrue(np.array_equal(first, second))
+        self.assertEqual({'hits': 1, 'disk_hits': 0, 'misses': 1, 'entries': 1}, normalizer.cache.get_stats())
+
+    def test_warm_start_normalizer_uses_cache(self):
+        normalizer = StainNormalizer(method='vahadane_warm', solver='numpy', extractor_kwargs={'backend': 'numpy'},
+                                     cache=StainMatrixCache())
+        normalizer.fit(make_stained_image(seed=0))
+        I = make_stained_image(seed=1)
+
+        first = normalizer.transform(I)
+        second = normalizer.transform(I)
+
+        self.assertTrue(np.array_equal(first, second))
+        self.assertEqual(1, normalizer.cache.get_stats()['hits'])
@@ -0,0 +1,47 @@
+import sys
+import unittest
+from unittest.mock import Mock
+import numpy as np
+
+sys.modules['spams'] = Mock()
+
+from staintools.utils.streaming_statistics import RunningMoments, RunningCovariance, ReservoirSampler
+
+
+class TestStreamingStatistics(unittest.TestCase):
+    def setUp(self):
+        self.X = np.random.uniform(0, 5, [300, 3])
+        self.batches = [self.X[:10], self.X[10:150], self.X[150:151], self.X[151:]]
+
+    def test_running_moments(self):
+        moments = RunningMoments(3)
+        for batch in self.batches:
+            moments.update(batch)
+
+        self.assertTrue(np.allclose(self.X.mean(axis=0), moments.mean))
+        self.assertTrue(np.allclose(self.X.std(axis=0), moments.std))
+
+    def test_running_covariance(self):
+        covariance = RunningCovariance(3)
+        for batch in self.batches:
+            covariance.update(batch)
+
+        self.assertTrue(np.allclose(np.cov(self.X, rowvar=False), covariance.covariance))
+
+    def test_reservoir_keeps_distinct_rows_of_the_stream(self):
+        X = np.arange(1000)[:, None]
+        reservoir = ReservoirSampler(50, random_state=1)
+        for i in range(0, 1000, 64):
+            reservoir.update(X[i:i + 64])
+
+        get = reservoir.get_sample()
+
+        self.assertEqual((50, 1), get.shape)
+        self.assertEqual(50, len(np.unique(get)))
+        self.assertTrue(get.max() >= 50)  # Not just the first rows.
+
+    def test_reservoir_smaller_stream(self):
+        reservoir = ReservoirSampler(50)
+        reservoir.update(np.ones((7, 3)))
+
+        self.assertEqual((7, 3), reservoir.get_sample().shape)